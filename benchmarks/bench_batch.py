@@ -0,0 +1,104 @@
+"""
+Micro-benchmark: memory per record and staging encode time of the list-of-dicts batch vs ProductBatch.
+
+    python benchmarks/bench_batch.py --rows 100000
+"""
+import argparse
+import csv
+import gc
+import gzip
+import io
+import json
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import _bootstrap  # noqa: F401  (sys.path and placeholder environment)
+from confluent_kafka.schema_registry import SchemaRegistryClient  # noqa: E402
+
+from bench_serialization import make_rows  # noqa: E402
+from kafka_setting import KAFKA_SCHEMA_NAME, PRODUCT_AVRO_SCHEMA  # noqa: E402
+from src.columnar import PRODUCT_COLUMNS, ProductBatch  # noqa: E402
+from src.serialization import BulkAvroSerializer, BulkAvroDeserializer  # noqa: E402
+from src.staging import get_staging_writer  # noqa: E402
+
+
+# --- the list-of-dicts staging path the consumer used before the columnar batch ---
+def format_timestamp(value) -> str:
+    if isinstance(value, int):
+        value = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def encode_dicts_json(batch: list[dict]) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=1) as gz:
+        for record in batch:
+            processed_record = dict(record)
+            processed_record['updated_timestamp'] = format_timestamp(processed_record['updated_timestamp'])
+            gz.write(json.dumps(processed_record).encode("utf-8"))
+            gz.write(b"\n")
+    buffer.seek(0)
+    return buffer
+
+
+def encode_dicts_csv(batch: list[dict]) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=1) as gz:
+        text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(PRODUCT_COLUMNS)
+        writer.writerows((record['product_id'], record['name'], record['category'], record['price'],
+                          format_timestamp(record['updated_timestamp'])) for record in batch)
+        text.flush()
+        text.detach()
+    buffer.seek(0)
+    return buffer
+
+
+def retained_bytes(build) -> tuple[object, int]:
+    """Builds a batch and returns it with the bytes it still holds once temporaries are gone."""
+    gc.collect()
+    tracemalloc.start()
+    batch = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return batch, current
+
+
+def timed(encode, batch, repeat: int = 3) -> float:
+    return min(_timed_once(encode, batch) for _ in range(repeat))
+
+
+def _timed_once(encode, batch) -> float:
+    started = time.perf_counter()
+    encode(batch)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    client = SchemaRegistryClient.new_client({"url": "mock://benchmark"})
+    payloads = BulkAvroSerializer(client, KAFKA_SCHEMA_NAME, PRODUCT_AVRO_SCHEMA).serialize_page(make_rows(args.rows))
+    dict_deserializer = BulkAvroDeserializer(client, PRODUCT_AVRO_SCHEMA)
+    raw_deserializer = BulkAvroDeserializer(client, PRODUCT_AVRO_SCHEMA, logical_types=False)
+
+    dicts, dict_bytes = retained_bytes(lambda: dict_deserializer.deserialize_values(payloads))
+    columns, column_bytes = retained_bytes(
+        lambda: ProductBatch.from_records(raw_deserializer.deserialize_values(payloads)))
+    print(f"{'memory per record':<22} list of dicts {dict_bytes / args.rows:>8.1f} B   "
+          f"ProductBatch {column_bytes / args.rows:>8.1f} B")
+
+    for staging_format, encode_dicts in (("csv", encode_dicts_csv), ("json", encode_dicts_json)):
+        dict_seconds = timed(encode_dicts, dicts)
+        column_seconds = timed(get_staging_writer(staging_format).encode, columns)
+        print(f"{'encode ' + staging_format:<22} list of dicts {dict_seconds * 1000:>8.1f} ms  "
+              f"ProductBatch {column_seconds * 1000:>8.1f} ms  ({dict_seconds / column_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Offline end-to-end benchmark: KafkaProducerApp and KafkaConsumer against local fakes
+(in-process broker, mock Schema Registry, SQLite source, filesystem Snowflake stage).
+
+    python benchmarks/bench_pipeline.py --rows 100000 --staging-format csv
+"""
+import argparse
+import os
+import resource
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import _bootstrap  # noqa: F401,E402  (sys.path and placeholder environment)
+import fakes  # noqa: E402
+from confluent_kafka.schema_registry import SchemaRegistryClient  # noqa: E402
+
+from kafka_setting import KAFKA_TOPIC_NAME  # noqa: E402
+from src.staging import get_staging_writer  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def run(rows: int, staging_format: str, max_batch_age: float, timeout: float, shards: int = 0,
+        snapshot: bool = False, replay: bool = False) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="kafka_ingestion_bench_"))
+    # the producer keeps its high-watermark file in the working directory
+    os.chdir(workdir)
+    database_path = str(workdir / "source.db")
+    fakes.seed_products(database_path, rows)
+
+    broker = fakes.FakeBroker()
+    registry = SchemaRegistryClient.new_client({"url": "mock://benchmark"})
+    sink = fakes.FakeSnowflakeSink(workdir / "stage", broker)
+    fakes.install(broker, registry, database_path, sink)
+
+    from src.consumer import KafkaConsumer
+    from src.producer import KafkaProducerApp
+    from src.replay import ReplayConsumer
+    from src.sharding import ShardedExtractor
+
+    producer_app = KafkaProducerApp()
+    started = time.perf_counter()
+    if snapshot:
+        producer_app.snapshot(KAFKA_TOPIC_NAME, "csv")
+    elif shards:
+        extractor = ShardedExtractor(producer_app.pipeline, shards)
+        extractor_thread = threading.Thread(target=extractor.run, args=(KAFKA_TOPIC_NAME,), name="bench-extract")
+        extractor_thread.start()
+        while sum(extractor.records_fetched) < rows and time.perf_counter() < started + timeout:
+            time.sleep(0.01)
+        extractor.stop()
+        extractor_thread.join()
+    else:
+        producer_app.produce_message(KAFKA_TOPIC_NAME, idle_wait=0)
+    produce_seconds = time.perf_counter() - started
+    rss_after_produce = peak_rss_mb()
+
+    consumer = KafkaConsumer()
+    consumer.staging_writer = get_staging_writer(staging_format)
+    consumer.batching.max_age = max_batch_age
+    consumer_thread = threading.Thread(target=consumer.consume_message, name="bench-consumer")
+    started = time.perf_counter()
+    consumer_thread.start()
+    deadline = started + timeout
+    while sink.rows_loaded < rows and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    consume_seconds = time.perf_counter() - started
+    consumer.stop()
+    consumer_thread.join()
+
+    result = {}
+    if replay:
+        # reload the whole topic; the live group's committed offsets must not move
+        committed = dict(broker.committed)
+        rows_before = sink.rows_loaded
+        replay_consumer = ReplayConsumer()
+        replay_consumer.staging_writer = get_staging_writer(staging_format)
+        started = time.perf_counter()
+        replay_consumer.resolve_window()
+        result["replay_complete"] = replay_consumer.replay()
+        result["replay_records_per_s"] = (sink.rows_loaded - rows_before) / (time.perf_counter() - started)
+        result["replay_committed_unchanged"] = broker.committed == committed
+
+    return {
+        **result,
+        "rows": rows,
+        "rows_loaded": sink.rows_loaded,
+        "producer_records_per_s": rows / produce_seconds,
+        "consumer_records_per_s": sink.rows_loaded / consume_seconds,
+        "latency_p50_ms": percentile(sink.latencies, 50) * 1000,
+        "latency_p99_ms": percentile(sink.latencies, 99) * 1000,
+        "peak_rss_producer_mb": rss_after_produce,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline producer/consumer throughput benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--staging-format", default="csv", choices=["csv", "json", "parquet"])
+    parser.add_argument("--max-batch-age", type=float, default=0.5,
+                        help="seconds before a partial batch is flushed (keeps the tail of the run short)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--shards", type=int, default=0, help="extract with N keyset shards instead of one query")
+    parser.add_argument("--snapshot", action="store_true", help="extract with the COPY TO STDOUT snapshot mode")
+    parser.add_argument("--replay", action="store_true",
+                        help="afterwards, reload the whole topic with the replay consumer")
+    args = parser.parse_args()
+
+    result = run(args.rows, args.staging_format, args.max_batch_age, args.timeout, args.shards, args.snapshot,
+                 args.replay)
+    if result["rows_loaded"] < result["rows"]:
+        print(f"WARNING: only {result['rows_loaded']} of {result['rows']} rows reached the sink before the timeout")
+    print(f"producer      {result['producer_records_per_s']:>12,.0f} records/s")
+    print(f"consumer      {result['consumer_records_per_s']:>12,.0f} records/s")
+    print(f"latency       p50 {result['latency_p50_ms']:,.1f} ms   p99 {result['latency_p99_ms']:,.1f} ms")
+    print(f"peak RSS      {result['peak_rss_producer_mb']:,.1f} MB after produce, {result['peak_rss_mb']:,.1f} MB total")
+    if args.replay:
+        print(f"replay        {result['replay_records_per_s']:>12,.0f} records/s"
+              f"   complete={result['replay_complete']}"
+              f"   group offsets unchanged={result['replay_committed_unchanged']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark: records/s of the per-record AvroSerializer path vs BulkAvroSerializer.
+
+    python benchmarks/bench_serialization.py --rows 100000 --workers 4
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import _bootstrap  # noqa: F401  (sys.path and placeholder environment)
+from confluent_kafka.schema_registry import SchemaRegistryClient  # noqa: E402
+from confluent_kafka.schema_registry.avro import AvroSerializer  # noqa: E402
+from confluent_kafka.serialization import StringSerializer, SerializationContext, MessageField  # noqa: E402
+
+from kafka_setting import KAFKA_TOPIC_NAME, KAFKA_SCHEMA_NAME, PRODUCT_AVRO_SCHEMA  # noqa: E402
+from src.serialization import BulkAvroSerializer  # noqa: E402
+
+
+def make_rows(count: int) -> list[dict]:
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "product_id": f"P{i:07d}",
+            "name": f"Product {i}",
+            "category": ("Electronics", "Clothing", "Books", "Home & Living")[i % 4],
+            "price": Decimal(f"{i % 1000}.99"),
+            "updated_timestamp": start + timedelta(milliseconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+def bench_per_record(client: SchemaRegistryClient, rows: list[dict]) -> float:
+    """The original produce_message path: convert in place, one SerializationContext per record."""
+    avro_serializer = AvroSerializer(schema_registry_client=client, schema_str=PRODUCT_AVRO_SCHEMA)
+    string_serializer = StringSerializer("utf-8")
+    rows = [dict(row) for row in rows]
+    started = time.perf_counter()
+    for product_data in rows:
+        product_data["updated_timestamp"] = int(product_data["updated_timestamp"].timestamp() * 1000)
+        product_data["price"] = float(product_data["price"])
+        avro_serializer(product_data, SerializationContext(KAFKA_TOPIC_NAME, MessageField.VALUE))
+        string_serializer(str(product_data["product_id"]))
+    return time.perf_counter() - started
+
+
+def bench_bulk(client: SchemaRegistryClient, rows: list[dict], workers: int, page_size: int) -> float:
+    serializer = BulkAvroSerializer(client, KAFKA_SCHEMA_NAME, PRODUCT_AVRO_SCHEMA, workers=workers,
+                                    parallel_threshold=page_size if workers > 1 else len(rows) + 1)
+    started = time.perf_counter()
+    for i in range(0, len(rows), page_size):
+        page = rows[i:i + page_size]
+        serializer.serialize_page(page)
+        [str(row["product_id"]).encode("utf-8") for row in page]
+    elapsed = time.perf_counter() - started
+    serializer.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    client = SchemaRegistryClient.new_client({"url": "mock://benchmark"})
+    rows = make_rows(args.rows)
+    for label, elapsed in (
+            ("per-record AvroSerializer", bench_per_record(client, rows)),
+            (f"BulkAvroSerializer (workers={args.workers})", bench_bulk(client, rows, args.workers, args.page_size)),
+    ):
+        print(f"{label:<40} {args.rows / elapsed:>12,.0f} records/s ({elapsed:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
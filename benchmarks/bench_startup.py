@@ -0,0 +1,67 @@
+"""
+Start-up benchmark: module import time of the producer/consumer and KafkaProducerApp() construction
+with a cold vs warm metadata cache, against fakes with a simulated network round-trip.
+
+    python benchmarks/bench_startup.py --rtt-ms 50
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import _bootstrap  # noqa: F401,E402  (sys.path and placeholder environment)
+import fakes  # noqa: E402
+from confluent_kafka.schema_registry import SchemaRegistryClient  # noqa: E402
+
+
+def import_seconds(module: str) -> float:
+    """Wall time of importing `module` in a fresh interpreter, minus the bare interpreter start-up."""
+    bootstrap = f"import sys; sys.path.insert(0, {str(Path(__file__).parent)!r}); import _bootstrap"
+
+    def run(code: str) -> float:
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-W", "ignore", "-c", code], check=True)
+        return time.perf_counter() - started
+
+    baseline = min(run(bootstrap) for _ in range(3))
+    return min(run(f"{bootstrap}; import {module}") for _ in range(3)) - baseline
+
+
+def construct_producer_seconds(rtt: float) -> tuple[float, float]:
+    workdir = Path(tempfile.mkdtemp(prefix="kafka_ingestion_startup_"))
+    os.chdir(workdir)
+    database_path = str(workdir / "source.db")
+    fakes.seed_products(database_path, 0)
+    broker = fakes.FakeBroker()
+    registry = SchemaRegistryClient.new_client({"url": "mock://startup"})
+    fakes.install(broker, registry, database_path, fakes.FakeSnowflakeSink(workdir / "stage"), rtt=rtt)
+
+    from src.producer import KafkaProducerApp
+
+    timings = []
+    for _ in range(2):  # first start fills .metadata_cache.json, second one reads it
+        started = time.perf_counter()
+        KafkaProducerApp()
+        timings.append(time.perf_counter() - started)
+    return timings[0], timings[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Producer/consumer start-up benchmark")
+    parser.add_argument("--rtt-ms", type=float, default=50, help="simulated broker/registry round-trip")
+    args = parser.parse_args()
+
+    for module in ("src.producer", "src.consumer"):
+        print(f"import {module:<14} {import_seconds(module) * 1000:>8.1f} ms")
+    cold, warm = construct_producer_seconds(args.rtt_ms / 1000)
+    print(f"KafkaProducerApp() cold cache {cold * 1000:>8.1f} ms")
+    print(f"KafkaProducerApp() warm cache {warm * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""
+In-process stand-ins for Kafka, Schema Registry, PostgreSQL and Snowflake used by the offline benchmarks.
+
+They implement just the surface the application touches, with the same call signatures,
+so KafkaProducerApp and KafkaConsumer run unmodified once `install()` has patched them in.
+"""
+import csv
+import gzip
+import io
+import json
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+import _bootstrap  # noqa: F401  (sys.path and placeholder environment)
+from confluent_kafka import TopicPartition
+from confluent_kafka.schema_registry import SchemaRegistryClient, Schema, SchemaRegistryError
+
+from kafka_setting import FETCH_PAGE_SIZE, PRODUCT_AVRO_SCHEMA
+
+SQLITE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+sqlite3.register_adapter(datetime, lambda value: value.strftime(SQLITE_TIMESTAMP_FORMAT))
+
+
+# --- Kafka ---
+class FakeMessage:
+    __slots__ = ("_topic", "_partition", "_offset", "_key", "_value", "_timestamp")
+
+    def __init__(self, topic: str, partition: int, offset: int, key: Optional[bytes], value: Optional[bytes],
+                 timestamp: int = 0):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._timestamp = timestamp
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def timestamp(self):
+        return 1, self._timestamp  # TIMESTAMP_CREATE_TIME
+
+    def error(self):
+        return None
+
+
+class FakeBroker:
+    """Partitioned, in-memory log shared by the fake producer and consumers."""
+
+    def __init__(self, num_partitions: int = 10):
+        self.num_partitions = num_partitions
+        self.topics: dict[str, list[list[FakeMessage]]] = {}
+        self.committed: dict[tuple[str, int], int] = {}
+        # key -> perf_counter() of its latest produce, used for end-to-end latency
+        self.produced_at: dict[bytes, float] = {}
+        self.lock = threading.Lock()
+
+    def partitions(self, topic: str) -> list[list[FakeMessage]]:
+        return self.topics.setdefault(topic, [[] for _ in range(self.num_partitions)])
+
+    def append(self, topic: str, key: Optional[bytes], value: Optional[bytes]) -> FakeMessage:
+        partitions = self.partitions(topic)
+        partition = zlib.crc32(key) % len(partitions) if key else 0
+        with self.lock:
+            log = partitions[partition]
+            message = FakeMessage(topic, partition, len(log), key, value, int(time.time() * 1000))
+            log.append(message)
+            self.produced_at[key] = time.perf_counter()
+        return message
+
+
+class FakeProducer:
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def produce(self, topic, key=None, value=None, on_delivery=None, **kwargs):
+        message = self.broker.append(topic, key, value)
+        if on_delivery is not None:
+            with self._lock:
+                self._pending.append((on_delivery, message))
+
+    def poll(self, timeout=None):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending and timeout:
+            time.sleep(min(timeout, 0.01))
+        for on_delivery, message in pending:
+            on_delivery(None, message)
+        return len(pending)
+
+    def flush(self, timeout=None):
+        self.poll(0)
+        return 0
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class FakeConsumer:
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+        self.positions: dict[tuple[str, int], int] = {}
+        self.paused: set[tuple[str, int]] = set()
+        self.on_revoke = None
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None, **kwargs):
+        assignment = [TopicPartition(topic, partition)
+                      for topic in topics for partition in range(len(self.broker.partitions(topic)))]
+        self.on_revoke = on_revoke
+        if on_assign is not None:
+            on_assign(self, assignment)
+        self.assign(assignment)
+
+    def revoke(self, partitions):
+        """Simulates an incremental (cooperative) revocation of `partitions` by a rebalance."""
+        if self.on_revoke is not None:
+            self.on_revoke(self, partitions)
+        for tp in partitions:
+            self.positions.pop((tp.topic, tp.partition), None)
+
+    def assign(self, partitions):
+        for tp in partitions:
+            start = tp.offset if tp.offset >= 0 else self.broker.committed.get((tp.topic, tp.partition), 0)
+            self.positions[(tp.topic, tp.partition)] = start
+
+    def consume(self, num_messages=1, timeout=-1):
+        messages = []
+        for (topic, partition), position in self.positions.items():
+            if (topic, partition) in self.paused:
+                continue
+            log = self.broker.partitions(topic)[partition]
+            chunk = log[position:position + num_messages - len(messages)]
+            messages.extend(chunk)
+            self.positions[(topic, partition)] = position + len(chunk)
+            if len(messages) >= num_messages:
+                break
+        if not messages and timeout:
+            time.sleep(min(timeout, 0.01))
+        return messages
+
+    def poll(self, timeout=None):
+        messages = self.consume(1, timeout)
+        return messages[0] if messages else None
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        for tp in offsets or []:
+            self.broker.committed[(tp.topic, tp.partition)] = tp.offset
+
+    def seek(self, partition):
+        self.positions[(partition.topic, partition.partition)] = partition.offset
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False):
+        return 0, len(self.broker.partitions(partition.topic)[partition.partition])
+
+    def position(self, partitions):
+        return [TopicPartition(tp.topic, tp.partition, self.positions.get((tp.topic, tp.partition), -1001))
+                for tp in partitions]
+
+    def pause(self, partitions):
+        self.paused.update((tp.topic, tp.partition) for tp in partitions)
+
+    def resume(self, partitions):
+        self.paused.difference_update((tp.topic, tp.partition) for tp in partitions)
+
+    def list_topics(self, topic=None, timeout=-1):
+        partitions = {partition: None for partition in range(len(self.broker.partitions(topic)))}
+        return SimpleNamespace(topics={topic: SimpleNamespace(partitions=partitions, error=None)})
+
+    def offsets_for_times(self, partitions, timeout=None):
+        found = []
+        for tp in partitions:
+            log = self.broker.partitions(tp.topic)[tp.partition]
+            index = bisect_left([message.timestamp()[1] for message in log], tp.offset)
+            found.append(TopicPartition(tp.topic, tp.partition, index if index < len(log) else -1))
+        return found
+
+    def assignment(self):
+        return [TopicPartition(topic, partition) for topic, partition in self.positions]
+
+    def close(self):
+        # like the real client, leaving the group revokes whatever is still assigned
+        self.revoke(self.assignment())
+
+
+class FakeAdminSetting:
+    """KafkaAdminSetting over the fake broker; `rtt` simulates the network round-trip of each admin call."""
+
+    def __init__(self, broker: FakeBroker, rtt: float = 0.0):
+        self.broker = broker
+        self.rtt = rtt
+
+    def check_topic_existence(self, topic_name: str):
+        return self.get_partition_count(topic_name) > 0
+
+    def create_new_topic(self, topic_name: str, num_partitions: int = 10, replication_factor: int = 3):
+        time.sleep(self.rtt)
+        self.broker.topics.setdefault(topic_name, [[] for _ in range(num_partitions)])
+
+    def get_partition_count(self, topic_name: str) -> int:
+        time.sleep(self.rtt)
+        return len(self.broker.topics.get(topic_name, []))
+
+
+# --- Schema Registry ---
+class FakeKafkaSchema:
+    """KafkaSchema backed by confluent-kafka's in-memory mock registry; `rtt` simulates each HTTP round-trip."""
+
+    def __init__(self, schema_reg_client: SchemaRegistryClient, rtt: float = 0.0):
+        self.schema_reg_client = schema_reg_client
+        self.rtt = rtt
+
+    def check_schema_existence(self, schema_name: str):
+        time.sleep(self.rtt)
+        return schema_name in self.schema_reg_client.get_subjects()
+
+    def get_schema_id(self, schema_name: str, schema_str: str = PRODUCT_AVRO_SCHEMA) -> Optional[int]:
+        time.sleep(self.rtt)
+        try:
+            return self.schema_reg_client.lookup_schema(schema_name,
+                                                        Schema(schema_str=schema_str, schema_type="AVRO")).schema_id
+        except SchemaRegistryError:
+            return None
+
+    def create_schema(self, schema_name: str, schema_str: str = PRODUCT_AVRO_SCHEMA) -> int:
+        time.sleep(self.rtt)
+        return self.schema_reg_client.register_schema(schema_name, Schema(schema_str=schema_str, schema_type="AVRO"))
+
+
+# --- PostgreSQL ---
+class FakeDataBaseConnection:
+    """
+    DataBaseConnection over SQLite. Rows come back as dicts with datetime/Decimal values,
+    the same types psycopg2's RealDictCursor yields for the products table.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.create_function("pg_current_wal_lsn", 0, lambda: "0/0")
+
+    @staticmethod
+    def _to_row(cursor, values) -> dict:
+        row = {column[0]: value for column, value in zip(cursor.description, values)}
+        if isinstance(row.get("updated_timestamp"), str):
+            row["updated_timestamp"] = datetime.strptime(row["updated_timestamp"], SQLITE_TIMESTAMP_FORMAT)
+        if isinstance(row.get("price"), str):
+            row["price"] = Decimal(row["price"])
+        return row
+
+    def fetch_query_stream(self, query: str, params=None, page_size: int = FETCH_PAGE_SIZE):
+        cursor = self.connection.execute(query.replace("%s", "?"), params or ())
+        while True:
+            rows = cursor.fetchmany(page_size)
+            if not rows:
+                break
+            yield [self._to_row(cursor, row) for row in rows]
+
+    def fetch_query_all(self, query: str, params=None):
+        cursor = self.connection.execute(query.replace("%s", "?"), params or ())
+        return [self._to_row(cursor, row) for row in cursor.fetchall()]
+
+    def fetch_query_once(self, query: str, params=None):
+        cursor = self.connection.execute(query.replace("%s", "?"), params or ())
+        row = cursor.fetchone()
+        return self._to_row(cursor, row) if row else None
+
+    @contextmanager
+    def snapshot(self):
+        yield self
+
+    def copy_out(self, query: str, file, size: int = 0):
+        """Emulates `COPY (SELECT ...) TO STDOUT WITH (FORMAT csv, NULL '\\N')`, one write per row."""
+        select = re.match(r"COPY \((.*)\) TO STDOUT WITH \(FORMAT csv", query, re.S)
+        if select is None:
+            raise NotImplementedError("the SQLite fake only emulates CSV COPY")
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for row in self.connection.execute(select.group(1)):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow("\\N" if value is None else value for value in row)
+            file.write(buffer.getvalue().encode("utf-8"))
+
+    def close(self):
+        self.connection.close()
+
+
+class FakeDataBaseConnectionPool:
+    """DataBaseConnectionPool over SQLite, with PostgreSQL's hashtext()/mod() registered for the shard query."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        if getattr(self._local, "connection", None) is None:
+            connection = sqlite3.connect(self.path)
+            connection.create_function("hashtext", 1, lambda text: zlib.crc32(text.encode()) - 2 ** 31,
+                                       deterministic=True)
+            connection.create_function("mod", 2, lambda a, b: a % b, deterministic=True)
+            self._local.connection = connection
+        return self._local.connection
+
+    def fetch_page(self, query: str, params=None) -> list[dict]:
+        cursor = self._connection().execute(query.replace("%s", "?"), params or ())
+        return [FakeDataBaseConnection._to_row(cursor, row) for row in cursor.fetchall()]
+
+    def close(self):
+        pass
+
+
+def seed_products(path: str, rows: int, categories: tuple = ("Electronics", "Home & Living", "Clothing", "Sportswear",
+                                                               "Books", "Accessories", "Personal Care")):
+    """Creates the init.sql products table in SQLite and fills it with `rows` generated products."""
+    connection = sqlite3.connect(path)
+    connection.execute("DROP TABLE IF EXISTS products")
+    connection.execute("""
+        CREATE TABLE products(
+            product_id VARCHAR(50) PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            category VARCHAR(100),
+            price TEXT NOT NULL,
+            updated_timestamp TEXT
+        )""")
+    connection.execute("CREATE INDEX products_updated_timestamp ON products(updated_timestamp, product_id)")
+    start = datetime(2024, 1, 1)
+    connection.executemany(
+        "INSERT INTO products VALUES (?, ?, ?, ?, ?)",
+        ((f"P{i:07d}", f"Product {i}", categories[i % len(categories)], f"{(i % 20000) / 100:.2f}",
+          start + timedelta(milliseconds=i)) for i in range(rows)),
+    )
+    connection.commit()
+    connection.close()
+
+
+# --- Snowflake ---
+class FakeSnowflakeCursor:
+    def __init__(self, sink: "FakeSnowflakeSink"):
+        self.sink = sink
+        self.rowcount = 0
+        self.description = None
+        self.sfqid = None
+        self._results = []
+
+    def execute(self, sql: str, params=None, file_stream=None, **kwargs):
+        statement = sql.strip().split(None, 1)[0].upper()
+        if statement == "PUT":
+            self.sink.put(sql, file_stream)
+        elif statement == "COPY":
+            self.rowcount = self.sink.copy(sql)
+        elif statement == "REMOVE":
+            self.sink.remove(sql)
+        return self
+
+    def fetchall(self):
+        return self._results
+
+    def close(self):
+        pass
+
+
+class FakeSnowflakeConnection:
+    def __init__(self, sink: "FakeSnowflakeSink"):
+        self.sink = sink
+
+    def cursor(self):
+        return FakeSnowflakeCursor(self.sink)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSnowflakeSink:
+    """
+    Filesystem stand-in for a Snowflake stage and table: PUT writes the staged file to `stage_dir`,
+    COPY decodes it and counts the rows, recording each row's produce-to-load latency.
+    """
+
+    def __init__(self, stage_dir: Path, broker: Optional[FakeBroker] = None):
+        self.stage_dir = stage_dir
+        self.stage_dir.mkdir(parents=True, exist_ok=True)
+        self.broker = broker
+        self.rows_loaded = 0
+        self.latencies: list[float] = []
+        self.lock = threading.Lock()
+
+    def connect(self, **kwargs) -> FakeSnowflakeConnection:
+        return FakeSnowflakeConnection(self)
+
+    def _stage_file(self, stage_path: str) -> Path:
+        # @stage/prefix/file -> <stage_dir>/prefix/file
+        return self.stage_dir / stage_path.lstrip("@").split("/", 1)[-1]
+
+    def put(self, sql: str, file_stream):
+        local, target = re.findall(r"'([^']*)'", sql)[:2]
+        file_name = local.rsplit("/", 1)[-1]
+        destination = self._stage_file(f"{target.rstrip('/')}/{file_name}")
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        if file_stream is not None:
+            destination.write_bytes(file_stream.read())
+        else:
+            destination.write_bytes(Path(local.replace("file://", "")).read_bytes())
+
+    def copy(self, sql: str) -> int:
+        source = re.search(r"FROM\s+(@\S+)", sql).group(1)
+        location = self._stage_file(source)
+        if location.is_dir():
+            paths = sorted(path for path in location.rglob("*") if path.is_file())
+        else:
+            paths = [location]
+        product_ids = [product_id for path in paths for product_id in self._read_product_ids(path)]
+        loaded_at = time.perf_counter()
+        with self.lock:
+            self.rows_loaded += len(product_ids)
+            if self.broker is not None:
+                for product_id in product_ids:
+                    produced_at = self.broker.produced_at.get(product_id.encode("utf-8"))
+                    if produced_at is not None:
+                        self.latencies.append(loaded_at - produced_at)
+        return len(product_ids)
+
+    def remove(self, sql: str):
+        location = self._stage_file(sql.split(None, 1)[1].strip().rstrip(";"))
+        if location.is_dir():
+            shutil.rmtree(location)
+        elif location.exists():
+            location.unlink()
+
+    @staticmethod
+    def _read_product_ids(path: Path) -> list[str]:
+        name = path.name
+        if name.endswith(".parquet"):
+            import pyarrow.parquet
+            return pyarrow.parquet.read_table(path, columns=["product_id"]).column("product_id").to_pylist()
+        data = path.read_bytes()
+        if name.endswith(".gz"):
+            data = gzip.decompress(data)
+        text = data.decode("utf-8")
+        if ".csv" in name:
+            return [row["product_id"] for row in csv.DictReader(io.StringIO(text))]
+        return [json.loads(line)["product_id"] for line in text.splitlines() if line]
+
+
+def install(broker: FakeBroker, registry: SchemaRegistryClient, database_path: str, sink: FakeSnowflakeSink,
+            rtt: float = 0.0):
+    """
+    Points the producer and consumer modules at the fakes. Must run before the apps are constructed.
+    `rtt` adds a simulated network round-trip to every admin/registry call.
+    """
+    import snowflake.connector
+    import src.consumer
+    import src.dead_letter
+    import src.producer
+    import src.sharding
+
+    src.producer.Producer = lambda config: FakeProducer(broker)
+    src.producer.DataBaseConnection = lambda *args, **kwargs: FakeDataBaseConnection(database_path)
+    src.producer.KafkaSchema = lambda: FakeKafkaSchema(registry, rtt)
+    src.producer.KafkaAdminSetting = lambda: FakeAdminSetting(broker, rtt)
+    src.sharding.DataBaseConnectionPool = lambda *args, **kwargs: FakeDataBaseConnectionPool(database_path)
+    src.consumer.Consumer = lambda config: FakeConsumer(broker)
+    src.consumer.KafkaSchema = lambda: FakeKafkaSchema(registry, rtt)
+    src.dead_letter.Producer = lambda config: FakeProducer(broker)
+    src.dead_letter.KafkaAdminSetting = lambda: FakeAdminSetting(broker, rtt)
+    snowflake.connector.connect = sink.connect
@@ -8,6 +8,9 @@ CREATE TABLE IF NOT EXISTS PRODUCTS(
     updated_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- serves the incremental and keyset queries of the producer
+CREATE INDEX IF NOT EXISTS products_updated_timestamp_idx ON products (updated_timestamp, product_id);
+
 INSERT INTO products (product_id, name, category, price)
 VALUES
 ('P0001', 'Wireless Mouse', 'Electronics', 25.99),
@@ -1,7 +1,16 @@
+import argparse
+import math
 import sys
+import time
+import uuid
+from collections import Counter
 
-from confluent_kafka.admin import AdminClient, NewTopic
-from kafka_setting import kafka_config
+from confluent_kafka import Consumer, ConsumerGroupTopicPartitions, KafkaException, TopicPartition
+from confluent_kafka.admin import AdminClient, NewPartitions, NewTopic, OffsetSpec
+from kafka_setting import (
+    kafka_config, KAFKA_TOPIC_NAME, CONSUMER_GROUP_ID, TOPIC_PARTITIONS, TOPIC_REPLICATION_FACTOR,
+    ADMIN_SAMPLE_SECONDS, ADMIN_SKEW_SAMPLE_MESSAGES, ADMIN_PARTITION_RATE, ADMIN_HEADROOM,
+)
 
 
 class KafkaAdminSetting:
@@ -12,14 +21,23 @@ class KafkaAdminSetting:
         """
         Returns true if topic exists otherwise False
         """
-        topic_metadata = self.admin.list_topics(timeout=5)
-        if topic_name in topic_metadata.topics:
+        if self.get_partition_count(topic_name) > 0:
             print(f"⚠️ Topic '{topic_name}' already exists.")
             return True
         else:
             return False
 
-    def create_new_topic(self, topic_name: str, num_partitions: int = 4, replication_factor: int = 5):
+    def get_partition_count(self, topic_name: str) -> int:
+        """
+        Returns the number of partitions of a topic, 0 if it doesn't exist
+        """
+        topic_metadata = self.admin.list_topics(topic=topic_name, timeout=5).topics.get(topic_name)
+        if topic_metadata is None or topic_metadata.error is not None:
+            return 0
+        return len(topic_metadata.partitions)
+
+    def create_new_topic(self, topic_name: str, num_partitions: int = TOPIC_PARTITIONS,
+                         replication_factor: int = TOPIC_REPLICATION_FACTOR):
         """
         Creates a new topic
         """
@@ -31,3 +49,211 @@ class KafkaAdminSetting:
         except Exception as e:
             print(f"❌ Failed to create topic '{topic_name}': {e}", file=sys.stderr)
             raise
+
+    def grow_partitions(self, topic_name: str, total_partitions: int):
+        """
+        Raises the partition count of an existing topic online. Partitions can only be added, and keys
+        that hash to a new partition lose ordering relative to their earlier messages.
+        """
+        current = self.get_partition_count(topic_name)
+        if total_partitions <= current:
+            raise ValueError(f"'{topic_name}' already has {current} partitions; partitions can only be added")
+        futures = self.admin.create_partitions([NewPartitions(topic_name, total_partitions)])
+        try:
+            futures[topic_name].result()
+            print(f"✅ Grew topic '{topic_name}' from {current} to {total_partitions} partitions")
+        except Exception as e:
+            print(f"❌ Failed to grow topic '{topic_name}': {e}", file=sys.stderr)
+            raise
+
+    def _partitions(self, topic_name: str) -> list[TopicPartition]:
+        return [TopicPartition(topic_name, partition) for partition in range(self.get_partition_count(topic_name))]
+
+    def get_offsets(self, topic_name: str, spec: OffsetSpec) -> dict[int, int]:
+        """
+        Returns partition -> offset for `spec` (OffsetSpec.earliest() or OffsetSpec.latest())
+        """
+        futures = self.admin.list_offsets({tp: spec for tp in self._partitions(topic_name)}, request_timeout=10)
+        return {tp.partition: future.result().offset for tp, future in futures.items()}
+
+    def get_committed_offsets(self, group_id: str, topic_name: str) -> dict[int, int]:
+        """
+        Returns partition -> committed offset of a consumer group (negative when nothing was committed)
+        """
+        request = ConsumerGroupTopicPartitions(group_id, self._partitions(topic_name))
+        result = self.admin.list_consumer_group_offsets([request])[group_id].result()
+        return {tp.partition: tp.offset for tp in result.topic_partitions}
+
+    def get_group_member_count(self, group_id: str) -> int:
+        description = self.admin.describe_consumer_groups([group_id])[group_id].result()
+        return len(description.members)
+
+    def get_lag(self, topic_name: str, group_id: str) -> list[dict]:
+        """
+        Per-partition start/end offsets, committed offset and lag of `group_id`.
+        A partition without a commit counts as lagging from its earliest offset.
+        """
+        earliest = self.get_offsets(topic_name, OffsetSpec.earliest())
+        latest = self.get_offsets(topic_name, OffsetSpec.latest())
+        committed = self.get_committed_offsets(group_id, topic_name)
+        rows = []
+        for partition in sorted(latest):
+            position = committed.get(partition, -1)
+            consumed_from = position if position >= 0 else earliest[partition]
+            rows.append({"partition": partition, "earliest": earliest[partition], "end": latest[partition],
+                         "committed": position, "lag": max(latest[partition] - consumed_from, 0)})
+        return rows
+
+    def sample_rates(self, topic_name: str, group_id: str, window: float = ADMIN_SAMPLE_SECONDS) -> dict[int, dict]:
+        """
+        Measures per-partition produce and commit rates (messages/s) over `window` seconds
+        """
+        produced = self.get_offsets(topic_name, OffsetSpec.latest())
+        committed = self.get_committed_offsets(group_id, topic_name)
+        started = time.monotonic()
+        time.sleep(window)
+        produced_after = self.get_offsets(topic_name, OffsetSpec.latest())
+        committed_after = self.get_committed_offsets(group_id, topic_name)
+        elapsed = time.monotonic() - started
+        rates = {}
+        for partition in sorted(produced_after):
+            commit_delta = 0
+            if committed.get(partition, -1) >= 0 and committed_after.get(partition, -1) >= 0:
+                commit_delta = committed_after[partition] - committed[partition]
+            rates[partition] = {"produce": (produced_after[partition] - produced.get(partition, 0)) / elapsed,
+                                "consume": commit_delta / elapsed}
+        return rates
+
+    def sample_key_skew(self, topic_name: str, messages_per_partition: int = ADMIN_SKEW_SAMPLE_MESSAGES) -> dict:
+        """
+        Reads the most recent messages of every partition (outside any consumer group, nothing is committed)
+        and reports each partition's share of the sample and the hottest keys.
+        """
+        latest = self.get_offsets(topic_name, OffsetSpec.latest())
+        earliest = self.get_offsets(topic_name, OffsetSpec.earliest())
+        consumer = Consumer({**kafka_config, "group.id": f"admin-skew-{uuid.uuid4()}", "enable.auto.commit": False})
+        assignment = [TopicPartition(topic_name, partition, max(latest[partition] - messages_per_partition,
+                                                                earliest[partition]))
+                      for partition in latest if latest[partition] > earliest[partition]]
+        expected = sum(latest[tp.partition] - tp.offset for tp in assignment)
+        per_partition = Counter()
+        keys = Counter()
+        try:
+            consumer.assign(assignment)
+            deadline = time.monotonic() + 30
+            while sum(per_partition.values()) < expected and time.monotonic() < deadline:
+                for msg in consumer.consume(num_messages=500, timeout=1.0):
+                    if msg.error():
+                        continue
+                    per_partition[msg.partition()] += 1
+                    keys[msg.key()] += 1
+        finally:
+            consumer.close()
+        total = sum(per_partition.values()) or 1
+        shares = {partition: per_partition[partition] / total for partition in sorted(latest)}
+        return {
+            "sampled": sum(per_partition.values()),
+            "shares": shares,
+            "max_share": max(shares.values(), default=0.0),
+            "hot_keys": [(key.decode("utf-8", "replace") if key else None, count / total)
+                         for key, count in keys.most_common(5)],
+        }
+
+
+def recommend_capacity(target_rate: float, consumer_rate: float, partition_count: int,
+                       max_share: float = 0.0, headroom: float = ADMIN_HEADROOM) -> dict:
+    """
+    Sizes partitions and consumers for `target_rate` messages/s with `headroom`, given what one consumer
+    sustains. With skewed keys the hottest partition has to fit within a single consumer, so the recommendation
+    is scaled up by how far its share exceeds an even split.
+    """
+    skew_factor = max(1.0, max_share * partition_count) if partition_count and max_share else 1.0
+    consumers = max(1, math.ceil(target_rate * headroom * skew_factor / consumer_rate))
+    partitions = max(partition_count, consumers)
+    return {"consumers": consumers, "partitions": partitions, "skew_factor": skew_factor}
+
+
+def _print_lag(admin: KafkaAdminSetting, args):
+    rows = admin.get_lag(args.topic, args.group)
+    print(f"{'partition':>9} {'earliest':>12} {'end':>12} {'committed':>12} {'lag':>10}")
+    for row in rows:
+        committed = row['committed'] if row['committed'] >= 0 else "-"
+        print(f"{row['partition']:>9} {row['earliest']:>12} {row['end']:>12} {committed:>12} {row['lag']:>10}")
+    print(f"{'total':>9} {'':>12} {'':>12} {'':>12} {sum(row['lag'] for row in rows):>10}")
+
+
+def _print_rates(admin: KafkaAdminSetting, args):
+    print(f"Sampling '{args.topic}' for {args.window}s...")
+    rates = admin.sample_rates(args.topic, args.group, args.window)
+    print(f"{'partition':>9} {'produce/s':>12} {'consume/s':>12}")
+    for partition, rate in rates.items():
+        print(f"{partition:>9} {rate['produce']:>12.1f} {rate['consume']:>12.1f}")
+    print(f"{'total':>9} {sum(r['produce'] for r in rates.values()):>12.1f} "
+          f"{sum(r['consume'] for r in rates.values()):>12.1f}")
+
+
+def _print_skew(admin: KafkaAdminSetting, args):
+    skew = admin.sample_key_skew(args.topic, args.messages)
+    even = 1 / len(skew["shares"]) if skew["shares"] else 0
+    print(f"Sampled {skew['sampled']} messages; an even split is {even:.1%} per partition")
+    for partition, share in skew["shares"].items():
+        print(f"{partition:>9} {share:>8.1%} {'#' * round(share * 50)}")
+    print("Hottest keys: " + ", ".join(f"{key} ({share:.1%})" for key, share in skew["hot_keys"]))
+
+
+def _print_recommendation(admin: KafkaAdminSetting, args):
+    partition_count = admin.get_partition_count(args.topic)
+    consumer_rate = args.consumer_rate
+    if consumer_rate is None:
+        rates = admin.sample_rates(args.topic, args.group, args.window)
+        consumed = sum(rate["consume"] for rate in rates.values())
+        members = admin.get_group_member_count(args.group)
+        consumer_rate = consumed / members if consumed and members else ADMIN_PARTITION_RATE
+        print(f"Measured {consumed:.1f} msg/s across {members} consumers -> {consumer_rate:.1f} msg/s per consumer")
+    skew = admin.sample_key_skew(args.topic, args.messages)
+    plan = recommend_capacity(args.target_rate, consumer_rate, partition_count, skew["max_share"])
+    print(f"Target {args.target_rate:.0f} msg/s (x{ADMIN_HEADROOM} headroom, skew factor {plan['skew_factor']:.2f}):")
+    print(f"  consumers : {plan['consumers']}  (python src/supervisor.py --workers {plan['consumers']})")
+    print(f"  partitions: {plan['partitions']}  (currently {partition_count})")
+    if plan["partitions"] > partition_count:
+        print(f"  grow with: python src/admin.py grow-partitions --topic {args.topic} --to {plan['partitions']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect consumer lag and partition throughput")
+    parser.add_argument("--topic", default=KAFKA_TOPIC_NAME)
+    parser.add_argument("--group", default=CONSUMER_GROUP_ID)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("lag", help="end offsets vs committed offsets per partition")
+    rate = commands.add_parser("rate", help="produce/commit rate per partition over a sampling window")
+    rate.add_argument("--window", type=float, default=ADMIN_SAMPLE_SECONDS)
+    skew = commands.add_parser("skew", help="partition share and hottest keys of the most recent messages")
+    skew.add_argument("--messages", type=int, default=ADMIN_SKEW_SAMPLE_MESSAGES, help="messages read per partition")
+    recommend = commands.add_parser("recommend", help="partition and consumer count for a target throughput")
+    recommend.add_argument("--target-rate", type=float, required=True, help="messages/s to sustain")
+    recommend.add_argument("--consumer-rate", type=float, help="messages/s one consumer sustains (measured if omitted)")
+    recommend.add_argument("--window", type=float, default=ADMIN_SAMPLE_SECONDS)
+    recommend.add_argument("--messages", type=int, default=ADMIN_SKEW_SAMPLE_MESSAGES)
+    grow = commands.add_parser("grow-partitions", help="add partitions to a topic online")
+    grow.add_argument("--to", type=int, required=True, dest="total", help="new total partition count")
+    args = parser.parse_args()
+
+    admin = KafkaAdminSetting()
+    try:
+        if args.command == "lag":
+            _print_lag(admin, args)
+        elif args.command == "rate":
+            _print_rates(admin, args)
+        elif args.command == "skew":
+            _print_skew(admin, args)
+        elif args.command == "recommend":
+            _print_recommendation(admin, args)
+        elif args.command == "grow-partitions":
+            admin.grow_partitions(args.topic, args.total)
+    except (KafkaException, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import threading
+from typing import Optional
+
+from kafka_setting import (
+    BATCH_SIZE,
+    BATCH_MIN_SIZE,
+    BATCH_MAX_SIZE,
+    BATCH_MAX_BYTES,
+    BATCH_TIME_LIMIT_SECONDS,
+    BATCH_TARGET_LOAD_SECONDS,
+)
+from src.logger import get_logger
+
+logger = get_logger("batching")
+
+
+class AdaptiveBatchController:
+    """
+    Decides when the consumer flushes a batch and how large the next one should be.
+
+    A batch is flushed on record count, accumulated bytes or age, whichever comes first.
+    After every load the record-count target is adjusted: it doubles while the consumer is behind
+    and loads stay under the latency target (amortising Snowflake's per-statement overhead),
+    halves when loads get too slow, and decays back towards the minimum once the lag is gone.
+    """
+
+    def __init__(self, initial_size: int = BATCH_SIZE, min_size: int = BATCH_MIN_SIZE,
+                 max_size: int = BATCH_MAX_SIZE, max_bytes: int = BATCH_MAX_BYTES,
+                 max_age: float = BATCH_TIME_LIMIT_SECONDS, target_load_seconds: float = BATCH_TARGET_LOAD_SECONDS):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.target_load_seconds = target_load_seconds
+        self.target_size = max(min_size, min(initial_size, max_size))
+        self.last_lag = 0
+        self.last_load_seconds = 0.0
+        self.last_flush_reason = None
+        self._lock = threading.Lock()
+
+    def flush_reason(self, batch_records: int, batch_bytes: int, batch_age: float) -> Optional[str]:
+        """
+        Returns why the current (non-empty) batch should be flushed ("size", "bytes" or "age"),
+        or None to keep accumulating
+        """
+        if batch_records >= self.target_size:
+            reason = "size"
+        elif batch_bytes >= self.max_bytes:
+            reason = "bytes"
+        elif batch_age >= self.max_age:
+            reason = "age"
+        else:
+            return None
+        self.last_flush_reason = reason
+        return reason
+
+    def observe_lag(self, lag: int):
+        """Records the consumer lag (messages behind the high watermark) measured at flush time."""
+        self.last_lag = lag
+
+    def record_load(self, batch_records: int, load_seconds: float):
+        """
+        Feeds back the duration of a finished load and adjusts the target batch size.
+        Called from the loader thread.
+        """
+        with self._lock:
+            self.last_load_seconds = load_seconds
+            previous = self.target_size
+            if load_seconds > self.target_load_seconds:
+                self.target_size = max(self.min_size, self.target_size // 2)
+            elif self.last_lag > self.target_size and batch_records >= self.target_size:
+                self.target_size = min(self.max_size, self.target_size * 2)
+            elif self.last_lag < self.target_size // 4:
+                self.target_size = max(self.min_size, self.target_size * 3 // 4)
+            if self.target_size != previous:
+                logger.info("Batch target %d -> %d (load %.2fs, lag %d)",
+                            previous, self.target_size, load_seconds, self.last_lag)
+
+    def snapshot(self) -> dict:
+        """Current decisions, for monitoring."""
+        return {
+            "target_size": self.target_size,
+            "max_bytes": self.max_bytes,
+            "max_age_seconds": self.max_age,
+            "last_flush_reason": self.last_flush_reason,
+            "last_load_seconds": self.last_load_seconds,
+            "last_lag": self.last_lag,
+        }
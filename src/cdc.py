@@ -0,0 +1,82 @@
+import json
+import select
+from datetime import datetime
+
+from psycopg2 import OperationalError
+
+from kafka_setting import CDC_CHANNEL_NAME
+from src.db import DataBaseConnection
+
+# Trigger that publishes every inserted/updated product row on the NOTIFY channel.
+# Kept idempotent so it can be (re)installed on every producer start.
+PRODUCT_CHANGE_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION notify_product_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(
+        '{channel}',
+        json_build_object(
+            'product_id', NEW.product_id,
+            'name', NEW.name,
+            'category', NEW.category,
+            'price', NEW.price,
+            'updated_timestamp', NEW.updated_timestamp
+        )::text
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS product_change_trigger ON products;
+CREATE TRIGGER product_change_trigger
+    AFTER INSERT OR UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION notify_product_change();
+"""
+
+
+class ProductChangeListener:
+    def __init__(self, channel: str = CDC_CHANNEL_NAME):
+        self.channel = channel
+        # LISTEN only delivers notifications outside of a transaction block
+        self.database_connection = DataBaseConnection(autocommit=True)
+        if self.database_connection.connection is None:
+            raise OperationalError("could not open the change channel connection")
+
+    def install_trigger(self):
+        """
+        Creates (or replaces) the trigger that publishes product changes
+        """
+        with self.database_connection.connection.cursor() as cursor:
+            cursor.execute(PRODUCT_CHANGE_TRIGGER_SQL.format(channel=self.channel))
+        print(f"Change trigger installed on channel '{self.channel}'")
+
+    def listen(self):
+        """
+        Subscribes this connection to the change channel
+        """
+        with self.database_connection.connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel};")
+        print(f"Listening for changes on channel '{self.channel}'")
+
+    def poll_changes(self, timeout: float) -> list[dict]:
+        """
+        Waits up to `timeout` seconds for notifications and returns every change received,
+        decoded into rows shaped like the products query. Returns an empty list on timeout.
+        """
+        connection = self.database_connection.connection
+        if select.select([connection], [], [], timeout) == ([], [], []):
+            return []
+        connection.poll()
+        changes = []
+        while connection.notifies:
+            notify = connection.notifies.pop(0)
+            changes.append(self._decode(notify.payload))
+        return changes
+
+    @staticmethod
+    def _decode(payload: str) -> dict:
+        row = json.loads(payload)
+        row['updated_timestamp'] = datetime.fromisoformat(row['updated_timestamp'])
+        return row
+
+    def close(self):
+        self.database_connection.close()
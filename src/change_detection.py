@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from kafka_setting import CHANGE_CACHE_MAX_ENTRIES, CHANGE_CACHE_FILE
+from src.instrumentation import metrics
+from src.logger import get_logger
+
+logger = get_logger("change_detection")
+
+
+def content_hash(row: dict) -> int:
+    """64-bit hash of the loaded columns of a row (everything but product_id and updated_timestamp)."""
+    price = row["price"]
+    # Decimal from psycopg2 and float from the COPY parsers hash the same
+    payload = f"{row['name']}\x1f{row['category']}\x1f{float(price) if price is not None else None!r}"
+    return int.from_bytes(hashlib.blake2b(payload.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ContentHashCache:
+    """
+    Remembers the content hash last produced for each product_id and flags rows whose payload didn't change,
+    e.g. touch-only updates, ORM saves that rewrite identical values, or rows re-read by the watermark query.
+
+    Bounded to `max_entries` with LRU eviction: an evicted product is simply produced again on its next change.
+    With `path`, the map is written on a clean shutdown and read back (then deleted) on start-up; a crash leaves
+    no file, so a restart can never suppress a row whose earlier version wasn't delivered.
+    """
+
+    def __init__(self, max_entries: int = CHANGE_CACHE_MAX_ENTRIES, path: Optional[str] = CHANGE_CACHE_FILE):
+        self.max_entries = max_entries
+        self.path = path
+        self.hashes: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.suppressed = 0
+        if path:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(file=self.path, mode='r') as file:
+                entries = json.load(file)
+            self.hashes = OrderedDict(entries[-self.max_entries:])
+            logger.info("Loaded %d content hashes from %s", len(self.hashes), self.path)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable change cache %s: %s", self.path, e)
+        # only valid until the next produce: a crash must not leave it behind
+        os.remove(self.path)
+
+    def save(self):
+        """Writes the map (least recently used first) atomically. Call only once every produce is delivered."""
+        if not self.path:
+            return
+        with self._lock:
+            entries = list(self.hashes.items())
+        temp_path = f"{self.path}.tmp"
+        with open(file=temp_path, mode='w') as file:
+            json.dump(entries, file)
+        os.replace(temp_path, self.path)
+        logger.info("Saved %d content hashes to %s", len(entries), self.path)
+
+    def changed(self, page: list[dict]) -> list[bool]:
+        """
+        Returns, per row, whether it has to be produced, and records the new hashes.
+        A row is unchanged when its product_id was last produced with the same content.
+        """
+        hashes = [content_hash(row) for row in page]
+        mask = []
+        with self._lock:
+            cache = self.hashes
+            for row, row_hash in zip(page, hashes):
+                product_id = row["product_id"]
+                previous = cache.get(product_id)
+                if previous is not None:
+                    cache.move_to_end(product_id)
+                if previous == row_hash:
+                    mask.append(False)
+                    continue
+                cache[product_id] = row_hash
+                mask.append(True)
+            while len(cache) > self.max_entries:
+                cache.popitem(last=False)
+            suppressed = mask.count(False)
+            self.checked += len(page)
+            self.suppressed += suppressed
+        metrics.inc("records_unchanged_total", suppressed)
+        return mask
+
+    def forget(self, product_id: str):
+        """Drops a product whose produce failed, so its next read is produced even if unchanged."""
+        with self._lock:
+            self.hashes.pop(product_id, None)
+
+    @property
+    def suppression_rate(self) -> float:
+        with self._lock:
+            return self.suppressed / self.checked if self.checked else 0.0
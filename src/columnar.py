@@ -0,0 +1,230 @@
+import sys
+from array import array
+from datetime import date, datetime, timezone
+from typing import Any, Iterable, Iterator
+
+# Column order of the staged files; matches the Avro schema and the Snowflake target table
+PRODUCT_COLUMNS = ["product_id", "name", "category", "price", "updated_timestamp"]
+
+
+def format_timestamps(millis: Iterable[int]) -> list[str]:
+    """
+    Formats epoch milliseconds as the ISO 8601 UTC strings Snowflake ingests ("2024-01-01T00:00:00.123Z").
+    Runs over a whole column: the date/time part is built once per distinct second and reused,
+    so most records only cost a dict lookup and the millisecond suffix.
+    """
+    seconds_cache: dict[int, str] = {}
+    formatted = []
+    for value in millis:
+        seconds, milliseconds = divmod(value, 1000)
+        prefix = seconds_cache.get(seconds)
+        if prefix is None:
+            prefix = datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            seconds_cache[seconds] = prefix
+        formatted.append(f"{prefix}.{milliseconds:03d}Z")
+    return formatted
+
+
+class ProductBatch:
+    """
+    Columnar batch of product records.
+
+    String columns are plain lists (categories interned, so each distinct value is stored once),
+    `price` is an array of doubles and `updated_timestamp` an array of epoch milliseconds. Compared with a
+    list of dicts this drops the per-record dict and boxed number objects, and lets the staging writers
+    encode a whole column at a time.
+    """
+    __slots__ = ("product_id", "name", "category", "price", "updated_timestamp")
+    columns = PRODUCT_COLUMNS
+    key = "product_id"
+
+    def __init__(self):
+        self.product_id: list[str] = []
+        self.name: list[str] = []
+        self.category: list[str] = []
+        self.price = array("d")
+        self.updated_timestamp = array("q")
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "ProductBatch":
+        batch = cls()
+        batch.extend(records)
+        return batch
+
+    @classmethod
+    def concat(cls, batches: list["ProductBatch"]) -> "ProductBatch":
+        """Joins batches end to end into one batch (the only batch itself if there is just one)."""
+        if len(batches) == 1:
+            return batches[0]
+        batch = cls()
+        for part in batches:
+            batch.product_id.extend(part.product_id)
+            batch.name.extend(part.name)
+            batch.category.extend(part.category)
+            batch.price.extend(part.price)
+            batch.updated_timestamp.extend(part.updated_timestamp)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.product_id)
+
+    def keys(self) -> list[str]:
+        return self.product_id
+
+    def extend(self, records: Iterable[dict]):
+        """
+        Appends decoded records. `updated_timestamp` is expected as epoch milliseconds
+        (BulkAvroDeserializer with logical_types=False); datetimes are converted.
+        """
+        intern = sys.intern
+        for record in records:
+            updated_timestamp = record["updated_timestamp"]
+            if isinstance(updated_timestamp, datetime):
+                updated_timestamp = int(updated_timestamp.timestamp() * 1000)
+            category = record["category"]
+            self.product_id.append(record["product_id"])
+            self.name.append(record["name"])
+            self.category.append(intern(category) if category is not None else None)
+            self.price.append(record["price"])
+            self.updated_timestamp.append(updated_timestamp)
+
+    def record(self, index: int) -> dict:
+        """Row `index` as a record dict (updated_timestamp in epoch milliseconds)."""
+        return {"product_id": self.product_id[index], "name": self.name[index], "category": self.category[index],
+                "price": self.price[index], "updated_timestamp": self.updated_timestamp[index]}
+
+    def take(self, indices: Iterable[int]) -> "ProductBatch":
+        """Returns a new batch holding the rows at `indices`, in that order."""
+        indices = list(indices)
+        batch = ProductBatch()
+        batch.product_id = [self.product_id[i] for i in indices]
+        batch.name = [self.name[i] for i in indices]
+        batch.category = [self.category[i] for i in indices]
+        batch.price = array("d", [self.price[i] for i in indices])
+        batch.updated_timestamp = array("q", [self.updated_timestamp[i] for i in indices])
+        return batch
+
+    def compact_latest(self) -> "ProductBatch":
+        """
+        Last-write-wins compaction: keeps only the newest row per product_id by updated_timestamp.
+        Ties go to the row consumed last. Output keeps the order in which product ids were first seen.
+        """
+        latest: dict[str, int] = {}
+        timestamps = self.updated_timestamp
+        for index, product_id in enumerate(self.product_id):
+            current = latest.get(product_id)
+            if current is None or timestamps[index] >= timestamps[current]:
+                latest[product_id] = index
+        if len(latest) == len(self):
+            return self
+        return self.take(latest.values())
+
+    def split(self, parts: int) -> list["ProductBatch"]:
+        """Splits the batch into `parts` contiguous batches of (nearly) equal length."""
+        size = -(-len(self) // max(parts, 1))
+        batches = []
+        for start in range(0, len(self), size or 1):
+            batch = ProductBatch()
+            batch.product_id = self.product_id[start:start + size]
+            batch.name = self.name[start:start + size]
+            batch.category = self.category[start:start + size]
+            batch.price = self.price[start:start + size]
+            batch.updated_timestamp = self.updated_timestamp[start:start + size]
+            batches.append(batch)
+        return batches
+
+    def estimated_bytes(self) -> int:
+        """Rough size of the batch once staged: string lengths plus fixed-width numbers and timestamps."""
+        return (sum(map(len, self.product_id)) + sum(map(len, self.name))
+                + sum(len(category) for category in self.category if category is not None) + 40 * len(self))
+
+    def rows(self) -> Iterator[tuple]:
+        """Rows as tuples in PRODUCT_COLUMNS order, with timestamps formatted for staging."""
+        return zip(self.product_id, self.name, self.category, self.price, format_timestamps(self.updated_timestamp))
+
+
+def _staged_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+class TableBatch:
+    """
+    Columnar batch of the records of one table of the multi-table pipeline: one list per column, values as
+    decoded with logical types (datetimes for timestamp columns). Same interface as ProductBatch, so the
+    consumer stages, compacts and splits both alike; `key` and `timestamp` drive last-write-wins compaction.
+    """
+    __slots__ = ("columns", "key", "timestamp", "values")
+
+    def __init__(self, columns: list[str], key: str, timestamp: str):
+        self.columns = columns
+        self.key = key
+        self.timestamp = timestamp
+        self.values: dict[str, list] = {column: [] for column in columns}
+
+    def empty(self) -> "TableBatch":
+        return TableBatch(self.columns, self.key, self.timestamp)
+
+    @classmethod
+    def concat(cls, batches: list["TableBatch"]) -> "TableBatch":
+        """Joins batches of the same table end to end (the only batch itself if there is just one)."""
+        if len(batches) == 1:
+            return batches[0]
+        batch = batches[0].empty()
+        for part in batches:
+            for column, values in batch.values.items():
+                values.extend(part.values[column])
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.values[self.key])
+
+    def keys(self) -> list:
+        return self.values[self.key]
+
+    def extend(self, records: Iterable[dict]):
+        records = list(records)
+        for column, values in self.values.items():
+            values.extend([record.get(column) for record in records])
+
+    def record(self, index: int) -> dict:
+        return {column: values[index] for column, values in self.values.items()}
+
+    def take(self, indices: Iterable[int]) -> "TableBatch":
+        indices = list(indices)
+        batch = self.empty()
+        batch.values = {column: [values[i] for i in indices] for column, values in self.values.items()}
+        return batch
+
+    def compact_latest(self) -> "TableBatch":
+        """Keeps only the newest row per key by the timestamp column; ties go to the row consumed last."""
+        latest: dict[Any, int] = {}
+        timestamps = self.values[self.timestamp]
+        for index, key in enumerate(self.values[self.key]):
+            current = latest.get(key)
+            if current is None or timestamps[index] >= timestamps[current]:
+                latest[key] = index
+        if len(latest) == len(self):
+            return self
+        return self.take(latest.values())
+
+    def split(self, parts: int) -> list["TableBatch"]:
+        size = -(-len(self) // max(parts, 1))
+        batches = []
+        for start in range(0, len(self), size or 1):
+            batch = self.empty()
+            batch.values = {column: values[start:start + size] for column, values in self.values.items()}
+            batches.append(batch)
+        return batches
+
+    def estimated_bytes(self) -> int:
+        """Rough staged size: string and bytes lengths plus 16 bytes per other value."""
+        return sum(len(value) if isinstance(value, (str, bytes)) else 16
+                   for values in self.values.values() for value in values)
+
+    def rows(self) -> Iterator[tuple]:
+        """Rows as tuples in column order, with dates/timestamps as ISO 8601 and bytes as hex for staging."""
+        return zip(*([_staged_value(value) for value in values] for values in self.values.values()))
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
 
@@ -6,6 +7,8 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_DB: str
     POSTGRES_PASSWORD: str
+    POSTGRES_HOST: str = "127.0.0.1"
+    POSTGRES_PORT: int = 5432
     KAFKA_SERVER: str
     KAFKA_USERNAME: str
     KAFKA_PASSWORD: str
@@ -19,7 +22,10 @@ class Settings(BaseSettings):
     SNOWFLAKE_DATABASE: str
     SNOWFLAKE_SCHEMA: str
     SNOWFLAKE_ROLE: str
+    LOG_LEVEL: str = "INFO"
     model_config = SettingsConfigDict(env_file=f"{Path(__file__).resolve().parents[1]}/.env", env_file_encoding='utf-8')
 
 
-env_setting = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
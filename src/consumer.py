@@ -1,218 +1,612 @@
-import io
-import json
+import argparse
 import sys
 import time
 import uuid
-from datetime import datetime, timezone
-from confluent_kafka import Consumer, KafkaError
-from confluent_kafka.serialization import (
-    SerializationContext,
-    MessageField, StringDeserializer,
-)
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Optional, Union
+from confluent_kafka import Consumer, KafkaError, KafkaException, TopicPartition
 from src.kafka_setting import (
     KAFKA_TOPIC_NAME,
+    KAFKA_SCHEMA_NAME,
     PRODUCT_AVRO_SCHEMA,
     SNOWFLAKE_ROLE,
-    BATCH_TIME_LIMIT_SECONDS,
     kafka_config, CONSUMER_GROUP_ID, SNOWFLAKE_WAREHOUSE, SNOWFLAKE_ACCOUNT, SNOWFLAKE_SCHEMA, SNOWFLAKE_DATABASE,
-    SNOWFLAKE_PASSWORD, SNOWFLAKE_STAGE_NAME, SNOWFLAKE_USERNAME, SNOWFLAKE_TABLE_NAME, BATCH_SIZE
+    SNOWFLAKE_PASSWORD, SNOWFLAKE_STAGE_NAME, SNOWFLAKE_USERNAME, SNOWFLAKE_TABLE_NAME, STAGING_FORMAT,
+    SNOWFLAKE_LOAD_MODE, STAGING_TARGET_FILE_BYTES, STAGING_MAX_FILES, STAGING_UPLOAD_THREADS, COPY_ON_ERROR,
+    CONSUME_BATCH_SIZE, CONSUME_TIMEOUT_SECONDS, MAX_IN_FLIGHT_BATCHES, DLQ_TOPIC_NAME, LOAD_RETRY_BACKOFF_SECONDS,
+    LOAD_RETRY_MAX_BACKOFF_SECONDS, LOAD_MAX_ATTEMPTS
 )
-from confluent_kafka.schema_registry.avro import AvroDeserializer
 
+from src.batching import AdaptiveBatchController
+from src.columnar import ProductBatch, TableBatch
+from src import instrumentation
+from src.dead_letter import DeadLetterQueue
+from src.instrumentation import metrics
+from src.logger import get_logger, RateLimitedLogger
 from src.schema import KafkaSchema
-import snowflake.connector
-import os
+from src.serialization import BulkAvroDeserializer, BulkAvroSerializer
+from src.staging import get_staging_writer
+from src.validation import ProductRecordValidator
+
+
+logger = get_logger("consumer")
+
+TARGET_TABLE = f"{SNOWFLAKE_DATABASE}.{SNOWFLAKE_SCHEMA}.{SNOWFLAKE_TABLE_NAME}"
+# Session-scoped (temporary) table, so concurrent consumer processes never share it
+MERGE_STAGING_TABLE = f"{SNOWFLAKE_DATABASE}.{SNOWFLAKE_SCHEMA}.{SNOWFLAKE_TABLE_NAME}_merge_staging"
+MERGE_SQL = f"""
+            MERGE INTO {TARGET_TABLE} AS target
+            USING {MERGE_STAGING_TABLE} AS source
+            ON target.product_id = source.product_id
+            WHEN MATCHED AND source.updated_timestamp >= target.updated_timestamp THEN UPDATE SET
+                name = source.name,
+                category = source.category,
+                price = source.price,
+                updated_timestamp = source.updated_timestamp
+            WHEN NOT MATCHED THEN INSERT (product_id, name, category, price, updated_timestamp)
+                VALUES (source.product_id, source.name, source.category, source.price, source.updated_timestamp)
+            ;
+            """
+
 
+def connect_snowflake():
+    """Opens the Snowflake connection of a consumer process; exits the process if it can't."""
+    # imported on first use: the connector takes a large share of process start-up time
+    import snowflake.connector
+    try:
+        connection = snowflake.connector.connect(
+            user=SNOWFLAKE_USERNAME,
+            password=SNOWFLAKE_PASSWORD,
+            account=SNOWFLAKE_ACCOUNT,
+            warehouse=SNOWFLAKE_WAREHOUSE,
+            database=SNOWFLAKE_DATABASE,
+            schema=SNOWFLAKE_SCHEMA,
+            role=SNOWFLAKE_ROLE
+        )
+        logger.info("Successfully connected to Snowflake.")
+        return connection
+    except Exception as e:
+        logger.critical("Could not connect to Snowflake: %s", e)
+        sys.exit(1)
 
-# Import the running flag and signal handler from utils
+
+class LoadTarget:
+    """
+    Where the records of one topic go: how they are decoded, validated and batched, and the Snowflake table
+    (and MERGE) a batch is loaded with. KafkaConsumer loads product_updates; the multi-table consumer
+    builds one target per table.
+    """
+
+    def __init__(self, topic: str, table: str, merge_staging_table: str, merge_sql: str,
+                 deserializer: BulkAvroDeserializer, validator: Callable[[dict], Optional[str]],
+                 new_batch: Callable[[], Union[ProductBatch, TableBatch]], subject: str = KAFKA_SCHEMA_NAME,
+                 schema_str: str = PRODUCT_AVRO_SCHEMA, convert: Optional[Callable[[dict], dict]] = None):
+        self.topic = topic
+        self.table = table
+        self.merge_staging_table = merge_staging_table
+        self.merge_sql = merge_sql
+        self.deserializer = deserializer
+        self.validator = validator
+        self.new_batch = new_batch
+        self.subject = subject
+        self.schema_str = schema_str
+        self.convert = convert
+        self._record_serializer: Optional[BulkAvroSerializer] = None
+
+    def record_serializer(self, schema_registry_client) -> Optional[BulkAvroSerializer]:
+        """Serializer for dead-lettering rows rejected by COPY; None means the dead-letter queue's default."""
+        if self.convert is None:
+            return None
+        if self._record_serializer is None:
+            self._record_serializer = BulkAvroSerializer(schema_registry_client, self.subject, self.schema_str,
+                                                         convert=self.convert)
+        return self._record_serializer
 
 
 class KafkaConsumer:
-    def __init__(self, group_id: str = CONSUMER_GROUP_ID):
+    def __init__(self, group_id: str = CONSUMER_GROUP_ID, load_mode: str = SNOWFLAKE_LOAD_MODE,
+                 batching: Optional[AdaptiveBatchController] = None, consumer_overrides: Optional[dict] = None,
+                 consume_batch_size: int = CONSUME_BATCH_SIZE, staging_max_files: int = STAGING_MAX_FILES,
+                 upload_threads: int = STAGING_UPLOAD_THREADS, dead_letter_topic: Optional[str] = DLQ_TOPIC_NAME):
         self.schema_registry_client = KafkaSchema()
-        self.avro_deserializer = AvroDeserializer(self.schema_registry_client.schema_reg_client, PRODUCT_AVRO_SCHEMA)
-        self.string_deserializer = StringDeserializer("utf-8")
+        # topic -> how its records are decoded, batched and loaded
+        self.targets: dict[str, LoadTarget] = self._load_targets()
+        # without a dead-letter topic, records that fail validation or COPY are logged and skipped
+        self.dead_letters = DeadLetterQueue(self.schema_registry_client.schema_reg_client,
+                                            dead_letter_topic) if dead_letter_topic else None
+        self.record_log = RateLimitedLogger(logger)
+        self.staging_writer = get_staging_writer(STAGING_FORMAT)
+        if load_mode not in ("append", "merge"):
+            raise ValueError(f"Unknown load mode '{load_mode}', expected 'append' or 'merge'")
+        self.load_mode = load_mode
         consumer_config = {
             **kafka_config,  # Create a copy and spread existing config
             "group.id": group_id,
             "auto.offset.reset": "earliest",
             "isolation.level": "read_committed",
-            "enable.auto.commit": False  # Ensure this is explicitly False for manual commits
+            # incremental rebalances: only the partitions that move are revoked, the rest keep streaming
+            "partition.assignment.strategy": "cooperative-sticky",
+            "enable.auto.commit": False,  # Ensure this is explicitly False for manual commits
+            **(consumer_overrides or {}),
         }
         self.snowflake_connection = None
         self._initiate_snowflake_connection()
         self.consumer = Consumer(consumer_config)
 
         # batch variable
-        self.current_batch = []
+        # records are buffered per partition, so a revoked partition can be flushed on its own
+        self.partition_batches: dict[tuple[str, int], Union[ProductBatch, TableBatch]] = {}
+        # (topic, partition) -> [first offset, last offset] of the buffered messages
+        self.current_offsets: dict[tuple[str, int], list[int]] = {}
+        self.partition_bytes: dict[tuple[str, int], int] = {}
+        self.buffered_records = 0
+        self.current_bytes = 0
         self.last_batch_time = time.time()
-        print(f"Consumer starting with group ID: {CONSUMER_GROUP_ID}")
+        self.batching = batching or AdaptiveBatchController()
+        self.consume_batch_size = consume_batch_size
+        self.staging_max_files = staging_max_files
+        # batches are loaded on a single background thread (one Snowflake connection) while the next accumulates
+        self.loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snowflake-loader")
+        self.in_flight: deque[tuple[Future, dict[tuple[str, int], list[int]]]] = deque()
+        # a batch is staged as several files encoded and PUT concurrently, so COPY can load them in parallel
+        self.uploader = ThreadPoolExecutor(max_workers=upload_threads, thread_name_prefix="snowflake-put")
+        self.records_loaded = 0  # total records copied into Snowflake by this consumer
+        # consecutive failed loads; each pauses the assigned partitions for an exponentially longer backoff
+        self.load_failures = 0
+        self.backoff_until = 0.0
+        self.backoff_paused: list[TopicPartition] = []
+        self.running = True
+        logger.info("Consumer starting with group ID: %s", group_id)
+
+    def _load_targets(self) -> dict[str, LoadTarget]:
+        # timestamps stay raw epoch millis: they go straight into the columnar batch
+        deserializer = BulkAvroDeserializer(self.schema_registry_client.schema_reg_client, PRODUCT_AVRO_SCHEMA,
+                                            logical_types=False)
+        return {KAFKA_TOPIC_NAME: LoadTarget(KAFKA_TOPIC_NAME, TARGET_TABLE, MERGE_STAGING_TABLE, MERGE_SQL,
+                                             deserializer, ProductRecordValidator(deserializer.reader_schema),
+                                             ProductBatch)}
 
     def _initiate_snowflake_connection(self):
+        self.snowflake_connection = connect_snowflake()
+
+    def _stage_batch(self, batch: Union[ProductBatch, TableBatch], stage_dir: str) -> int:
+        """
+        Splits a batch into files of about STAGING_TARGET_FILE_BYTES (at most `staging_max_files`) and
+        encodes and PUTs them concurrently under `stage_dir`. Returns the number of files staged.
+        """
+        file_count = max(1, min(self.staging_max_files, -(-batch.estimated_bytes() // STAGING_TARGET_FILE_BYTES)))
+
+        def upload(index: int, part: Union[ProductBatch, TableBatch]):
+            with metrics.timer("consumer_stage_seconds", stage="encode"):
+                stage_file = self.staging_writer.encode(part)
+            file_name = f"part_{index:03d}.{self.staging_writer.file_extension}"
+            # With file_stream the local path only names the staged file; the bytes come from memory
+            logger.debug("PUT %s/%s (%d bytes)", stage_dir, file_name, stage_file.getbuffer().nbytes)
+            cursor = self.snowflake_connection.cursor()
+            try:
+                with metrics.timer("consumer_stage_seconds", stage="put"):
+                    cursor.execute(f"PUT 'file://{file_name}' '{stage_dir}' AUTO_COMPRESS=FALSE OVERWRITE=TRUE",
+                                   file_stream=stage_file)
+            finally:
+                cursor.close()
+
+        parts = batch.split(file_count)
+        list(self.uploader.map(upload, range(len(parts)), parts))
+        return len(parts)
+
+    def _dead_letter_rejected(self, cursor, copy_target: str, batch: Union[ProductBatch, TableBatch],
+                              target: LoadTarget):
+        """
+        With ON_ERROR = CONTINUE, COPY loads the good rows and skips the bad ones. When its result reports
+        errors, the rejected rows are fetched with VALIDATE and routed to the dead-letter topic.
+        """
+        if COPY_ON_ERROR.upper() != "CONTINUE" or not cursor.description:
+            return
+        columns = [column[0].lower() for column in cursor.description]
+        if "errors_seen" not in columns:
+            return
+        errors_seen = sum(row[columns.index("errors_seen")] or 0 for row in cursor.fetchall())
+        if not errors_seen:
+            return
+        if self.dead_letters is None:
+            metrics.inc("records_skipped_total", errors_seen, reason="copy")
+            logger.warning("COPY rejected %d rows; skipped (no dead-letter topic)", errors_seen)
+            return
+        cursor.execute(f"SELECT error, rejected_record FROM TABLE(VALIDATE({copy_target}, JOB_ID => '{cursor.sfqid}'))")
+        # keys are compared as text: CSV rejected records carry every value as a string
+        row_index = {str(key): index for index, key in enumerate(batch.keys())}
+        serializer = target.record_serializer(self.schema_registry_client.schema_reg_client)
+        rejected = cursor.fetchall()
+        for error, rejected_record in rejected:
+            key = self.staging_writer.record_key(rejected_record, batch.columns, batch.key)
+            index = row_index.get(str(key)) if key is not None else None
+            if index is None:
+                # can't be matched to a batch row: keep the staged text so it's still inspectable
+                self.dead_letters.send(None, rejected_record.encode("utf-8"), f"COPY rejected (unparsed): {error}")
+            else:
+                self.dead_letters.send_record(batch.record(index), f"COPY rejected: {error}", serializer, batch.key)
+        metrics.inc("records_dead_lettered_total", len(rejected), reason="copy")
+        logger.warning("COPY rejected %d rows; routed to %s", len(rejected), self.dead_letters.topic_name)
+
+    def _remove_staged(self, stage_dir: str):
         try:
-            self.snowflake_connection = snowflake.connector.connect(
-                user=SNOWFLAKE_USERNAME,
-                password=SNOWFLAKE_PASSWORD,
-                account=SNOWFLAKE_ACCOUNT,
-                warehouse=SNOWFLAKE_WAREHOUSE,
-                database=SNOWFLAKE_DATABASE,
-                schema=SNOWFLAKE_SCHEMA,
-                role=SNOWFLAKE_ROLE
-            )
-            print("Successfully connected to Snowflake.")
+            cursor = self.snowflake_connection.cursor()
+            try:
+                cursor.execute(f"REMOVE {stage_dir}/")
+            finally:
+                cursor.close()
         except Exception as e:
-            print(f"ERROR: Could not connect to Snowflake: {e}", file=sys.stderr)
-            sys.exit(1)
+            logger.warning("Could not remove staged files under %s: %s", stage_dir, e)
 
-    def _load_batch_to_snowflake(self):
+    def _load_batch_to_snowflake(self, batch: Union[ProductBatch, TableBatch], target: LoadTarget) -> bool:
         """
-        Loads the accumulated batch of messages into Snowflake using a stage and COPY INTO.
+        Compacts a batch to the newest version of each key and loads it into the target's table: the batch is staged
+        as several files under its own stage prefix and loaded with a single COPY INTO over that prefix
+        (or, in merge mode, COPY into a temporary table followed by MERGE). Staged files are removed afterwards.
+        Returns True only when the load succeeded.
         """
-        if not self.current_batch:
-            return
-        temp_file_path = None
-        batch_size = len(self.current_batch)
-        print(f"Loading batch of {batch_size} records to Snowflake...")
+        from snowflake.connector.errors import ProgrammingError
+        if not batch:
+            return True
+        batch_size = len(batch)
+        # one stage prefix per batch, so COPY picks up exactly this batch's files
+        stage_dir = f"@{SNOWFLAKE_STAGE_NAME}/kafka_ingestion/batch_{uuid.uuid4()}"
         try:
-            # Prepare data as JSON Lines in an in -memory file
-            json_data = io.StringIO()
-            for record in self.current_batch:
-                processed_record = record.copy()
-                if isinstance(processed_record['updated_timestamp'], datetime):
-                    # Convert datetime object to ISO 8601 string
-                    processed_record['updated_timestamp'] = processed_record['updated_timestamp'].astimezone(
-                        timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
-                elif 'updated_timestamp' in processed_record and isinstance(processed_record['updated_timestamp'], int):
-                    # Convert Avro timestamp-millis (long) to ISO 8601 string for Snowflake JSON ingestion
-                    # You might need to adjust this formatting based on your Snowflake column type and format
-                    processed_record['updated_timestamp'] = (
-                        datetime.fromtimestamp(processed_record['updated_timestamp'] / 1000, tz=timezone.utc)
-                        .isoformat(timespec='milliseconds')
-                        .replace('+00:00', 'Z')
-                    )
-
-                json_data.write(json.dumps(processed_record) + '\n')
-            json_data.seek(0)
-            import tempfile
-            with tempfile.NamedTemporaryFile(mode='w+', delete=False, encoding='utf-8', suffix=".json") as temp_file:
-                temp_file.write(json_data.getvalue())
-                temp_file_path = temp_file.name
-            print(f"  [DEBUG] Temporary file created: {temp_file_path}")
-            if not os.path.exists(temp_file_path):
-                print(f"  [ERROR] Temp file DOES NOT EXIST locally: {temp_file_path}", file=sys.stderr)
-                raise FileNotFoundError(f"Local temporary file not found for Snowflake PUT: {temp_file_path}")
-
-                # Convert Windows backslashes to forward slashes for Snowflake PUT command
-            snowflake_compatible_path = temp_file_path.replace(os.sep, '/')
-            # Generate a unique file name for the stage
-            file_name = f"product_batch_{str(uuid.uuid4())}.json"
-            stage_path = f"@{SNOWFLAKE_STAGE_NAME}/kafka_ingestion/{file_name}"
-            print("[DEBUG] SNOWFLAKE STAGE PATH", stage_path)
-            # Upload the in-memory file to Snowflake stage
+            compacted = batch.compact_latest()
+            logger.info("Loading batch of %d records to Snowflake (%d after compaction, ratio %.2f)...",
+                        batch_size, len(compacted), batch_size / len(compacted))
+            metrics.set("consumer_compaction_ratio", batch_size / len(compacted))
+            with metrics.timer("consumer_stage_seconds", stage="stage"):
+                file_count = self._stage_batch(compacted, stage_dir)
+            logger.debug("Staged %d files under %s", file_count, stage_dir)
             cursor = self.snowflake_connection.cursor()
 
             try:
-                print(
-                    f"  [DEBUG] Initiating PUT operation for {file_name} from local path: {snowflake_compatible_path}...")
-                put_sql = f"PUT 'file://{snowflake_compatible_path}' '{stage_path}' AUTO_COMPRESS=TRUE OVERWRITE=TRUE"
-                cursor.execute(put_sql)
-                print(f"Uploaded {file_name} to {SNOWFLAKE_STAGE_NAME}/kafka_ingestion/")
-
-                # Copy data from stage into the target table
+                if self.load_mode == "merge":
+                    cursor.execute(f"CREATE OR REPLACE TEMPORARY TABLE {target.merge_staging_table} "
+                                   f"LIKE {target.table};")
+                copy_target = target.merge_staging_table if self.load_mode == "merge" else target.table
+                # Copy every file of the batch prefix into the target (or merge staging) table
                 copy_sql = f"""
-                            COPY INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_SCHEMA}.{SNOWFLAKE_TABLE_NAME}
-                            FROM {stage_path}
-                            FILE_FORMAT = (TYPE = JSON STRIP_OUTER_ARRAY = FALSE)
+                            COPY INTO {copy_target}
+                            FROM {stage_dir}/
+                            FILE_FORMAT = ({self.staging_writer.file_format})
                             MATCH_BY_COLUMN_NAME = 'CASE_INSENSITIVE'
-                            ON_ERROR = 'ABORT_STATEMENT'
+                            ON_ERROR = '{COPY_ON_ERROR}'
                             ;
                             """
-                cursor.execute(copy_sql)
+                with metrics.timer("consumer_stage_seconds", stage="copy"):
+                    cursor.execute(copy_sql)
+                self._dead_letter_rejected(cursor, copy_target, compacted, target)
+                if self.load_mode == "merge":
+                    with metrics.timer("consumer_stage_seconds", stage="merge"):
+                        cursor.execute(target.merge_sql)
                 self.snowflake_connection.commit()
-                self.current_batch = []
-                print(f"Successfully loaded {batch_size} records into Snowflake.")
-            except snowflake.connector.errors.ProgrammingError as e:
-                print(f"Snowflake SQL Error: {e}", file=sys.stderr)
-        except FileNotFoundError as e:
-            print(f"ERROR: Local file system issue: {e}", file=sys.stderr)
+                self.records_loaded += batch_size
+                metrics.inc("records_loaded_total", batch_size)
+                logger.info("Successfully loaded %d records from %d files into %s.", batch_size, file_count,
+                            target.table)
+                return True
+            except ProgrammingError as e:
+                logger.error("Snowflake SQL Error: %s", e)
         except Exception as e:
-            print(f"ERROR during batch loading to Snowflake: {e}", file=sys.stderr)
+            logger.error("Error during batch loading to Snowflake: %s", e)
         finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                print(f"  [DEBUG] Deleting temporary local file: {temp_file_path}")
-                os.remove(temp_file_path)
-            self.current_batch = []  # Clear the batch regardless of success
+            self._remove_staged(stage_dir)
+        metrics.inc("load_errors_total")
+        return False
+
+    def _append_messages(self, messages: list):
+        """
+        Handles errors and partition EOF for a fetched array of messages, then
+        deserializes all values in one pass and appends them to the current batch.
+        """
+        payloads: dict[str, list] = {}
+        sources: dict[str, list] = {}
+        for msg in messages:
+            if msg.error():
+                if msg.error().code() == KafkaError._PARTITION_EOF:
+                    # End of partition event, not an error
+                    logger.debug("Reached end of partition %d for topic %s", msg.partition(), msg.topic())
+                else:
+                    self.record_log.error(str(msg.error().code()), "Consumer error: %s", msg.error())
+                    metrics.inc("consume_errors_total")
+                    if msg.error().code() == KafkaError.AUTHENTICATION_FAILED:
+                        logger.critical("Authentication failed. Stopping consumer.")
+                continue
+            tp = (msg.topic(), msg.partition())
+            partition_offsets = self.current_offsets.get(tp)
+            if partition_offsets is None:
+                self.current_offsets[tp] = [msg.offset(), msg.offset()]
+            else:
+                partition_offsets[1] = msg.offset()
+            # the key is never loaded, so it is only checked for presence rather than decoded
+            if msg.key() is None:
+                continue
+            payloads.setdefault(msg.topic(), []).append(msg.value())
+            sources.setdefault(msg.topic(), []).append(msg)
+            size = len(msg.value() or b"")
+            self.partition_bytes[tp] = self.partition_bytes.get(tp, 0) + size
+            self.current_bytes += size
+        # validation pre-pass: records that can't be decoded or loaded go to the dead-letter topic
+        valid: dict[tuple[str, int], list[dict]] = {}
+        with metrics.timer("consumer_stage_seconds", stage="deserialize"):
+            for topic, topic_sources in sources.items():
+                target = self.targets[topic]
+                for msg, record in zip(topic_sources, target.deserializer.deserialize_values(payloads[topic])):
+                    reason = "Avro deserialization failed" if record is None else target.validator(record)
+                    if reason is None:
+                        valid.setdefault((msg.topic(), msg.partition()), []).append(record)
+                    elif self.dead_letters is None:
+                        metrics.inc("records_skipped_total", reason="validation")
+                        self.record_log.warning("invalid_record", "Skipping %s[%d]@%d: %s", msg.topic(),
+                                                msg.partition(), msg.offset(), reason)
+                    else:
+                        metrics.inc("records_dead_lettered_total", reason="validation")
+                        self.dead_letters.send(msg.key(), msg.value(), reason, msg.topic(), msg.partition(),
+                                               msg.offset())
+            for tp, records in valid.items():
+                batch = self.partition_batches.get(tp)
+                if batch is None:
+                    batch = self.partition_batches[tp] = self.targets[tp[0]].new_batch()
+                batch.extend(records)
+                self.buffered_records += len(records)
+        metrics.inc("records_consumed_total", sum(len(topic_sources) for topic_sources in sources.values()))
+        metrics.inc("bytes_consumed_total", sum(len(payload or b"") for topic_payloads in payloads.values()
+                                                for payload in topic_payloads))
+
+    def _timed_load(self, batch: Union[ProductBatch, TableBatch], target: LoadTarget) -> bool:
+        started = time.monotonic()
+        loaded = self._load_batch_to_snowflake(batch, target)
+        if loaded and batch:
+            self.batching.record_load(len(batch), time.monotonic() - started)
+        return loaded
+
+    def _record_flush_decision(self, reason: str):
+        """Exports and logs why the batching controller flushed and the figures its next sizing is based on."""
+        decisions = self.batching.snapshot()
+        metrics.inc("consumer_batch_flushes_total", reason=reason)
+        metrics.set("consumer_batch_last_load_seconds", decisions["last_load_seconds"])
+        metrics.set("consumer_batch_last_lag_messages", decisions["last_lag"])
+        logger.debug("Flushing batch of %d records (%s limit reached; target %d records, last load %.2fs, lag %d)",
+                     self.buffered_records, reason, decisions["target_size"], decisions["last_load_seconds"],
+                     decisions["last_lag"])
+
+    def _lag(self, offsets: dict[tuple[str, int], list[int]]) -> int:
+        """
+        Messages still behind the high watermark on the partitions of a batch, from cached fetch metadata
+        """
+        lag = 0
+        for (topic, partition), (_, last) in offsets.items():
+            try:
+                _, high = self.consumer.get_watermark_offsets(TopicPartition(topic, partition), cached=True)
+            except KafkaException:
+                continue
+            if high >= 0:
+                lag += max(high - (last + 1), 0)
+        return lag
+
+    def _submit_batch(self, partitions: Optional[set[tuple[str, int]]] = None):
+        """
+        Hands the buffered records of `partitions` (default: all) to the background loader, one batch per topic.
+        Blocks while more than MAX_IN_FLIGHT_BATCHES are waiting on Snowflake.
+        """
+        by_topic: dict[str, list[tuple[str, int]]] = {}
+        for tp in self.current_offsets:
+            if partitions is None or tp in partitions:
+                by_topic.setdefault(tp[0], []).append(tp)
+        for topic, tps in by_topic.items():
+            target = self.targets[topic]
+            offsets = {tp: self.current_offsets.pop(tp) for tp in tps}
+            batches = [self.partition_batches.pop(tp) for tp in tps if tp in self.partition_batches]
+            batch = type(batches[0]).concat(batches) if batches else target.new_batch()
+            batch_bytes = sum(self.partition_bytes.pop(tp, 0) for tp in tps)
+            self.buffered_records -= len(batch)
+            self.current_bytes -= batch_bytes
+            lag = self._lag(offsets)
+            self.batching.observe_lag(lag)
+            metrics.set("consumer_lag_messages", lag)
+            metrics.set("consumer_batch_records", len(batch))
+            metrics.set("consumer_batch_bytes", batch_bytes)
+            future = self.loader.submit(self._timed_load, batch, target)
+            self.in_flight.append((future, offsets))
+        if not self.current_offsets:
+            self.last_batch_time = time.time()  # Reset timer
+        metrics.set("consumer_in_flight_batches", len(self.in_flight))
+        while len(self.in_flight) > MAX_IN_FLIGHT_BATCHES:
+            self._commit_completed_batches(wait=True)
+
+    def _commit_completed_batches(self, wait: bool = False):
+        """
+        Commits the exact offsets of finished batches, oldest first.
+        With `wait`, blocks until at least the oldest in-flight batch finishes.
+        """
+        while self.in_flight and (wait or self.in_flight[0][0].done()):
+            wait = False
+            future, offsets = self.in_flight.popleft()
+            if not future.result():
+                self._rewind(offsets)
+                self._back_off()
+                return
+            # dead-lettered records of the batch must be durable before its offsets are committed
+            if self.dead_letters is not None and not self.dead_letters.flush():
+                logger.error("Dead-letter produce failed; reprocessing the batch")
+                self._rewind(offsets)
+                self._back_off()
+                return
+            self.load_failures = 0
+            self._commit_offsets(offsets)
+
+    def _back_off(self):
+        """
+        Pauses consumption after a failed load, for LOAD_RETRY_BACKOFF_SECONDS doubled with every consecutive
+        failure (up to LOAD_RETRY_MAX_BACKOFF_SECONDS), so a persistent Snowflake error doesn't reload the
+        batch in a hot loop. Raises once LOAD_MAX_ATTEMPTS loads in a row have failed.
+        """
+        if not self.running:
+            return  # shutting down: the rewound records are left to the next run
+        self.load_failures += 1
+        metrics.set("consumer_load_failures", self.load_failures)
+        if self.load_failures >= LOAD_MAX_ATTEMPTS:
+            logger.critical("%d consecutive batch loads failed. Stopping consumer.", self.load_failures)
+            raise RuntimeError(f"{self.load_failures} consecutive batch loads failed")
+        delay = min(LOAD_RETRY_BACKOFF_SECONDS * 2 ** (self.load_failures - 1), LOAD_RETRY_MAX_BACKOFF_SECONDS)
+        logger.warning("Load failed %d time(s) in a row; pausing consumption for %.1fs", self.load_failures, delay)
+        try:
+            self.backoff_paused = self.consumer.assignment()
+            self.consumer.pause(self.backoff_paused)
+        except KafkaException as e:
+            logger.error("Could not pause partitions: %s", e)
+        self.backoff_until = time.monotonic() + delay
+
+    def _resume_after_backoff(self):
+        if not self.backoff_paused or time.monotonic() < self.backoff_until:
+            return
+        try:
+            self.consumer.resume(self.backoff_paused)
+        except KafkaException as e:
+            # e.g. a partition revoked while it was paused
+            logger.warning("Could not resume partitions after backoff: %s", e)
+        self.backoff_paused = []
+
+    def _commit_offsets(self, offsets: dict[tuple[str, int], list[int]]):
+        """Commits the position after the last offset of each partition of a loaded batch."""
+        try:
+            with metrics.timer("consumer_stage_seconds", stage="commit"):
+                self.consumer.commit(offsets=[TopicPartition(topic, partition, last + 1)
+                                              for (topic, partition), (_, last) in offsets.items()],
+                                     asynchronous=False)
+        except KafkaException as e:
+            logger.error("Offset commit failed: %s", e)
+
+    def _rewind(self, failed_offsets: dict[tuple[str, int], list[int]]):
+        """
+        A batch failed to load: drop everything consumed after it and seek back to its first offsets,
+        so the failed records (and any later ones) are consumed again instead of being committed.
+        """
+        rewind_to = {tp: first for tp, (first, _) in failed_offsets.items()}
+        while self.in_flight:
+            future, offsets = self.in_flight.popleft()
+            future.result()
+            for tp, (first, _) in offsets.items():
+                rewind_to.setdefault(tp, first)
+        for tp, (first, _) in self.current_offsets.items():
+            rewind_to.setdefault(tp, first)
+        self._drop_buffers()
+        for (topic, partition), offset in rewind_to.items():
+            logger.warning("Rewinding %s[%d] to offset %d after failed load", topic, partition, offset)
+            try:
+                self.consumer.seek(TopicPartition(topic, partition, offset))
+            except KafkaException as e:
+                logger.error("Could not seek %s[%d]: %s", topic, partition, e)
+
+    def _drop_buffers(self, partitions: Optional[set[tuple[str, int]]] = None):
+        """Discards the buffered records and offsets of `partitions` (default: all) without loading them."""
+        for tp in [tp for tp in self.current_offsets if partitions is None or tp in partitions]:
+            del self.current_offsets[tp]
+            batch = self.partition_batches.pop(tp, None)
+            self.buffered_records -= len(batch) if batch is not None else 0
+            self.current_bytes -= self.partition_bytes.pop(tp, 0)
+
+    def _on_assign(self, consumer, partitions: list[TopicPartition]):
+        """
+        Incremental assignment (cooperative-sticky): `partitions` are added to the partitions already owned,
+        which keep their buffers and positions.
+        """
+        metrics.inc("consumer_rebalances_total", event="assign")
+        logger.info("Assigned %s", [f"{tp.topic}[{tp.partition}]" for tp in partitions])
+
+    def _on_revoke(self, consumer, partitions: list[TopicPartition]):
+        """
+        Incremental revocation: flushes and commits the records buffered for the revoked partitions before
+        they move, so the new owner starts exactly after them. Other partitions keep their buffers.
+        Batches already in flight are waited for, since they may hold records of the revoked partitions.
+        """
+        metrics.inc("consumer_rebalances_total", event="revoke")
+        revoked = {(tp.topic, tp.partition) for tp in partitions}
+        logger.info("Revoking %s", [f"{topic}[{partition}]" for topic, partition in sorted(revoked)])
+        if revoked & self.current_offsets.keys():
+            self._submit_batch(revoked)
+        while self.in_flight:
+            self._commit_completed_batches(wait=True)
+
+    def _on_lost(self, consumer, partitions: list[TopicPartition]):
+        """
+        Partitions were taken away without a revoke (e.g. session timeout): they may already be consumed
+        elsewhere, so their buffered records are dropped instead of loaded and committed.
+        """
+        metrics.inc("consumer_rebalances_total", event="lost")
+        lost = {(tp.topic, tp.partition) for tp in partitions}
+        logger.warning("Lost %s; dropping their buffered records", [f"{t}[{p}]" for t, p in sorted(lost)])
+        self._drop_buffers(lost)
+
+    def _check_end_of_input(self):
+        """Called after every fetch. Live consumption never ends; bounded readers stop here."""
+
+    def stop(self):
+        """
+        Asks the consume loop to exit; the current batch is flushed and committed on the way out.
+        Safe to call from a signal handler.
+        """
+        self.running = False
 
     def consume_message(self):
+        self.consumer.subscribe(list(self.targets), on_assign=self._on_assign, on_revoke=self._on_revoke,
+                                on_lost=self._on_lost)
+        logger.info("Subscribed to topics: %s", list(self.targets))
+        self._consume_loop()
+
+    def _consume_loop(self):
+        """
+        Consumes from the current subscription or assignment until `stop()`, loading and committing batches.
+        The consumer and the Snowflake connection are closed on the way out.
+        """
         try:
-            self.consumer.subscribe([KAFKA_TOPIC_NAME])
-            print(f"Subscribed to topic: {KAFKA_TOPIC_NAME}")
-            while True:
-                msg = self.consumer.poll(1.0)
-                if msg is None:
-                    # Check if time limit for current batch is reached
-                    if self.current_batch and (time.time() - self.last_batch_time >= BATCH_TIME_LIMIT_SECONDS):
-                        self._load_batch_to_snowflake()
-                        self.last_batch_time = time.time()  # Reset timer
-                        self.consumer.commit(asynchronous=False)
+            while self.running:
+                self._resume_after_backoff()
+                with metrics.timer("consumer_stage_seconds", stage="consume"):
+                    messages = self.consumer.consume(num_messages=self.consume_batch_size,
+                                                     timeout=CONSUME_TIMEOUT_SECONDS)
+                if messages:
+                    self._append_messages(messages)
+                self._check_end_of_input()
+                self._commit_completed_batches()
+                if not self.current_offsets:
+                    continue
+                # Check once per fetch whether the batch is full by count, bytes or age
+                reason = self.batching.flush_reason(self.buffered_records, self.current_bytes,
+                                                    time.time() - self.last_batch_time)
+                metrics.set("consumer_batch_target_records", self.batching.target_size)
+                if reason is None:
                     continue
-                if msg.error():
-                    if msg.error().code() == KafkaError._PARTITION_EOF:
-                        # End of partition event, not an error
-                        print(f"Reached end of partition {msg.partition()} for topic {msg.topic()}")
-                        continue
-                    elif msg.error():
-                        # Other Kafka errors
-                        print(f"Consumer error: {msg.error()}", file=sys.stderr)
-                        if msg.error().code() == KafkaError.AUTHENTICATION_FAILED:
-                            print("  Authentication failed. Stopping consumer.", file=sys.stderr)
-                        continue
-                try:
-                    # Deserialize message key and value
-                    # For value, context is important for AvroDeserializer to determine subject
-                    deserialized_key = self.string_deserializer(msg.key())
-                    deserialized_value = self.avro_deserializer(
-                        msg.value(),
-                        SerializationContext(msg.topic(), MessageField.VALUE)
-                    )
-
-                    if deserialized_key is not None and deserialized_value is not None:
-                        # Append deserialized record to current batch
-                        self.current_batch.append(deserialized_value)
-                        # Commit offset for the *last message of the batch* later,
-                        # after successful load to Snowflake. For now, we accumulate.
-                        # Offsets will be committed only when a batch successfully lands in Snowflake.
-
-                        # Check if batch size or time limit is reached
-                        if len(self.current_batch) >= BATCH_SIZE:
-                            print(f"Batch size {BATCH_SIZE} reached.")
-                            self._load_batch_to_snowflake()
-                            # If batch loaded successfully, commit offsets up to this point
-                            self.consumer.commit(asynchronous=False)  # Synchronous commit for reliability
-                            self.last_batch_time = time.time()  # Reset timer
-                        elif time.time() - self.last_batch_time >= BATCH_TIME_LIMIT_SECONDS:
-                            print(f"Batch time limit {BATCH_TIME_LIMIT_SECONDS}s reached.")
-                            self._load_batch_to_snowflake()
-                            # If batch loaded successfully, commit offsets
-                            self.consumer.commit(asynchronous=False)
-                            self.last_batch_time = time.time()  # Reset timer
-                except Exception as e:
-                    print(f"Error during message deserialization or processing: {e}", file=sys.stderr)
+                self._record_flush_decision(reason)
+                self._submit_batch()
         except KeyboardInterrupt:
-            print("consumer stopped")
+            logger.info("consumer stopped")
         finally:
-            if self.current_batch:
-                print("Flushing final batch to Snowflake...")
-                self._load_batch_to_snowflake()
-                self.consumer.commit(asynchronous=False)  # Final commit
+            if self.current_offsets:
+                logger.info("Flushing final batch to Snowflake...")
+                self._submit_batch()
+            while self.in_flight:
+                self._commit_completed_batches(wait=True)
+            self.loader.shutdown()
+            self.uploader.shutdown()
+            if self.dead_letters is not None:
+                self.dead_letters.close()
 
-            print("Closing consumer and Snowflake connection...")
+            logger.info("Closing consumer and Snowflake connection...")
             if self.snowflake_connection:
                 self.snowflake_connection.close()
             self.consumer.close()
-            print("Consumer and Snowflake connection closed.")
+            logger.info("Consumer and Snowflake connection closed.")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load product updates from Kafka into Snowflake")
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="profile all threads for the first SECONDS of the run (kill -USR1 <pid> profiles later)")
+    args = parser.parse_args()
+    instrumentation.start(args.profile)
     consumer = KafkaConsumer()
     consumer.consume_message()
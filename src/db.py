@@ -1,42 +1,133 @@
+import time
+from contextlib import contextmanager
 from psycopg2 import connect
 from psycopg2.extras import RealDictCursor, RealDictRow
-from psycopg2 import Error
-from typing import Optional, Union, Any, Tuple
-from config import env_setting
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2 import Error, OperationalError, InterfaceError
+from typing import Optional, Union, Any, Tuple, Iterator
+from uuid import uuid4
+from config import get_settings
+from kafka_setting import FETCH_PAGE_SIZE, DB_RECONNECT_ATTEMPTS, DB_RECONNECT_BACKOFF_SECONDS, COPY_BUFFER_BYTES
+from src.logger import get_logger
+
+logger = get_logger("db")
+
+
+def _connect_kwargs() -> dict:
+    env_setting = get_settings()
+    return dict(database=env_setting.POSTGRES_DB, user=env_setting.POSTGRES_USER,
+                password=env_setting.POSTGRES_PASSWORD, host=env_setting.POSTGRES_HOST, port=env_setting.POSTGRES_PORT)
 
 
 class DataBaseConnection:
-    def __init__(self):
+    def __init__(self, autocommit: bool = False):
+        self.autocommit = autocommit
         self.connection = None
         self.connect()
+        if self.connection is not None:
+            self.connection.autocommit = autocommit
         print("=" * 20)
         print("db connected successfully ")
         print("=" * 20)
 
     def connect(self):
         try:
-            self.connection = connect(database=env_setting.POSTGRES_DB, user=env_setting.POSTGRES_USER,
-                                      password=env_setting.POSTGRES_PASSWORD, host="127.0.0.1", port=5432)
+            self.connection = connect(**_connect_kwargs())
         except Error as e:
             print(f"Error connecting to PostgreSQL DB: {e}")
 
-    def fetch_query_all(self, query: str, params: Optional[Union[list[Any], Tuple[Any, ...]]] = None) -> list[
-                                                                                                             RealDictRow] | None:
+    def reconnect(self):
+        """
+        Replaces a dropped connection, backing off between tries.
+        Raises OperationalError once DB_RECONNECT_ATTEMPTS tries have failed.
+        """
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+        for attempt in range(DB_RECONNECT_ATTEMPTS):
+            try:
+                self.connection = connect(**_connect_kwargs())
+                self.connection.autocommit = self.autocommit
+                return
+            except OperationalError as e:
+                print(f"Reconnect attempt {attempt + 1} failed: {e}")
+                time.sleep(DB_RECONNECT_BACKOFF_SECONDS * 2 ** attempt)
+        raise OperationalError(f"could not reconnect after {DB_RECONNECT_ATTEMPTS} attempts")
+
+    def _execute(self, query: str, params, fetch):
+        # a dropped connection is replaced and the query retried once; other errors propagate
         try:
             with self.connection.cursor(cursor_factory=RealDictCursor) as conn:
                 conn.execute(query, params)
-                return conn.fetchall()
+                return fetch(conn)
+        except (OperationalError, InterfaceError) as e:
+            if self.connection is not None and not self.connection.closed:
+                raise
+            print("Connection lost, reconnecting:", e)
+            self.reconnect()
+            with self.connection.cursor(cursor_factory=RealDictCursor) as conn:
+                conn.execute(query, params)
+                return fetch(conn)
+
+    def fetch_query_all(self, query: str, params: Optional[Union[list[Any], Tuple[Any, ...]]] = None) -> list[
+                                                                                                             RealDictRow] | None:
+        try:
+            return self._execute(query, params, lambda conn: conn.fetchall())
         except Exception as e:
             print("Fetching failed:", e)
             return None
 
+    def fetch_query_stream(self, query: str, params: Optional[Union[list[Any], Tuple[Any, ...]]] = None,
+                           page_size: int = FETCH_PAGE_SIZE) -> Iterator[list[RealDictRow]]:
+        """
+        Streams the result set page by page through a named (server-side) cursor,
+        so only `page_size` rows are held in memory at a time. A failure mid-stream is re-raised after the
+        rollback: the caller must not mistake a truncated result for a finished one.
+        """
+        cursor_name = f"stream_{uuid4().hex}"
+        try:
+            with self.connection.cursor(name=cursor_name, cursor_factory=RealDictCursor) as conn:
+                conn.itersize = page_size
+                conn.execute(query, params)
+                while True:
+                    rows = conn.fetchmany(page_size)
+                    if not rows:
+                        break
+                    yield rows
+            # named cursors live inside a transaction; end it so the portal is released
+            self.connection.commit()
+        except Exception as e:
+            logger.error("Streaming fetch failed: %s", e)
+            self.connection.rollback()
+            raise
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Runs the block in one REPEATABLE READ, read-only transaction, so every query in it sees the same snapshot.
+        """
+        self.connection.rollback()  # isolation can only change between transactions
+        self.connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        try:
+            yield self
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            self.connection.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+
+    def copy_out(self, query: str, file, size: int = COPY_BUFFER_BYTES):
+        """
+        Runs a `COPY ... TO STDOUT` statement and writes its output to `file` (anything with a write method).
+        """
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(query, file, size=size)
+
     def fetch_query_once(self, query: str,
                          params: Optional[Union[list[Any], Tuple[Any, ...]]] = None) -> RealDictRow | None:
 
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as conn:
-                conn.execute(query, params)
-                return conn.fetchone()
+            return self._execute(query, params, lambda conn: conn.fetchone())
         except Exception as e:
             print("Fetching failed:", e)
             return None
@@ -46,3 +137,46 @@ class DataBaseConnection:
         print("=" * 10)
         print("Connection closed")
         print("=" * 10)
+
+
+class DataBaseConnectionPool:
+    """
+    Thread-safe pool of autocommit PostgreSQL connections for parallel extraction.
+    Connections dropped by the server are discarded instead of being handed out again.
+    """
+
+    def __init__(self, max_connections: int, min_connections: int = 1):
+        self.pool = ThreadedConnectionPool(min_connections, max_connections, **_connect_kwargs())
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.getconn()
+        conn.autocommit = True
+        broken = False
+        try:
+            yield conn
+        except (OperationalError, InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def fetch_page(self, query: str, params: Optional[Union[list[Any], Tuple[Any, ...]]] = None) -> list[RealDictRow]:
+        """
+        Runs a single-statement query on a pooled connection. A dropped connection is replaced and the query
+        retried with backoff; OperationalError is raised once DB_RECONNECT_ATTEMPTS tries have failed.
+        """
+        for attempt in range(DB_RECONNECT_ATTEMPTS):
+            try:
+                with self.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(query, params)
+                    return cursor.fetchall()
+            except (OperationalError, InterfaceError) as e:
+                if attempt == DB_RECONNECT_ATTEMPTS - 1:
+                    raise
+                print(f"Pooled query failed (attempt {attempt + 1}), retrying on a new connection: {e}")
+                time.sleep(DB_RECONNECT_BACKOFF_SECONDS * 2 ** attempt)
+        return []
+
+    def close(self):
+        self.pool.closeall()
@@ -0,0 +1,97 @@
+import threading
+from typing import Optional
+
+from confluent_kafka import Producer
+from confluent_kafka.schema_registry import SchemaRegistryClient
+from kafka_setting import kafka_config, DLQ_TOPIC_NAME, DLQ_PARTITIONS, DLQ_LINGER_MS, DLQ_FLUSH_TIMEOUT_SECONDS
+from src.admin import KafkaAdminSetting
+from src.logger import get_logger, RateLimitedLogger
+from src.metadata_cache import MetadataCache
+from src.serialization import BulkAvroSerializer
+
+logger = get_logger("dead_letter")
+
+
+class DeadLetterQueue:
+    """
+    Routes records that can't be loaded to the dead-letter topic.
+
+    Values stay in the Confluent Avro wire format of the source topic, so a dead-lettered record can be
+    replayed by producing it back unchanged. Headers carry the reason and the source topic/partition/offset.
+    Produces are asynchronous and batched by librdkafka (DLQ_LINGER_MS); `flush()` must succeed before the
+    offsets of the affected batch are committed.
+    """
+
+    def __init__(self, schema_registry_client: SchemaRegistryClient, topic_name: str = DLQ_TOPIC_NAME):
+        self.topic_name = topic_name
+        self.schema_registry_client = schema_registry_client
+        self.producer = Producer({**kafka_config, "linger.ms": DLQ_LINGER_MS})
+        self.record_log = RateLimitedLogger(logger)
+        self._serializer: Optional[BulkAvroSerializer] = None
+        self._lock = threading.Lock()
+        self._failed_deliveries = 0
+        self.sent = 0
+        self._ensure_topic()
+
+    def _ensure_topic(self):
+        metadata_cache = MetadataCache()
+        cache_key = f"topic:{self.topic_name}"
+        if metadata_cache.get(cache_key) is not None:
+            return
+        admin = KafkaAdminSetting()
+        partitions = admin.get_partition_count(self.topic_name)
+        if not partitions:
+            logger.info("creating dead-letter topic:%s", self.topic_name)
+            partitions = DLQ_PARTITIONS
+            admin.create_new_topic(self.topic_name, num_partitions=partitions)
+        metadata_cache.set(cache_key, {"partitions": partitions})
+
+    def _on_delivery(self, err, msg):
+        if err is not None:
+            with self._lock:
+                self._failed_deliveries += 1
+            self.record_log.error(str(err.code()), "Dead-letter delivery failed: %s", err)
+
+    def send(self, key: Optional[bytes], value: Optional[bytes], reason: str, source_topic: str = "",
+             source_partition: int = -1, source_offset: int = -1):
+        headers = [("dlq.reason", reason.encode("utf-8")), ("dlq.source.topic", source_topic.encode("utf-8")),
+                   ("dlq.source.partition", str(source_partition).encode()),
+                   ("dlq.source.offset", str(source_offset).encode())]
+        while True:
+            try:
+                self.producer.produce(self.topic_name, key=key, value=value, headers=headers,
+                                      on_delivery=self._on_delivery)
+                break
+            except BufferError:
+                self.producer.poll(0.1)
+        self.producer.poll(0)
+        with self._lock:
+            self.sent += 1
+        self.record_log.warning("dead_letter", "Dead-lettered record %s: %s", key, reason)
+
+    def send_record(self, record: dict, reason: str, serializer: Optional[BulkAvroSerializer] = None,
+                    key: str = "product_id"):
+        """
+        Dead-letters a record that no longer has its source message (e.g. a row rejected by COPY).
+        `serializer` encodes records of other topics than product_updates; `key` names their key column.
+        """
+        if serializer is None:
+            if self._serializer is None:
+                self._serializer = BulkAvroSerializer(self.schema_registry_client)
+            serializer = self._serializer
+        value = serializer.serialize_page([record])[0]
+        self.send(str(record[key]).encode("utf-8"), value, reason)
+
+    def flush(self, timeout: float = DLQ_FLUSH_TIMEOUT_SECONDS) -> bool:
+        """
+        Waits for outstanding dead-letter produces. Returns False if any were lost since the last flush.
+        """
+        remaining = self.producer.flush(timeout)
+        with self._lock:
+            failed, self._failed_deliveries = self._failed_deliveries, 0
+        return remaining == 0 and failed == 0
+
+    def close(self):
+        self.flush()
+        if self._serializer is not None:
+            self._serializer.close()
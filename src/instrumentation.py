@@ -0,0 +1,260 @@
+import bisect
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from kafka_setting import (
+    METRICS_PORT, METRICS_SNAPSHOT_INTERVAL_SECONDS, PROFILE_WINDOW_SECONDS, PROFILE_SAMPLE_INTERVAL_SECONDS,
+    PROFILE_OUTPUT_DIR,
+)
+from src.logger import get_logger
+
+logger = get_logger("instrumentation")
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRIC_PREFIX = "kafka_ingestion_"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and latency histograms, keyed by name and labels.
+    Cheap enough for per-page/per-batch use on the hot paths; exported as Prometheus text or a snapshot dict.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[str, dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self.gauges: dict[str, dict[tuple, float]] = defaultdict(dict)
+        self.histograms: dict[str, dict[tuple, Histogram]] = defaultdict(dict)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self.counters[name][_label_key(labels)] += value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[name][_label_key(labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            histogram = self.histograms[name].get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Times the block into histogram `name`, e.g. `with metrics.timer("producer_stage_seconds", stage="fetch")`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+                lines.extend(f"{METRIC_PREFIX}{name}{_format_labels(key)} {value}" for key, value in series.items())
+            for name, series in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+                lines.extend(f"{METRIC_PREFIX}{name}{_format_labels(key)} {value}" for key, value in series.items())
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(key, 'le="%s"' % bound)
+                        lines.append(f"{METRIC_PREFIX}{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Counters, gauges and per-histogram count/sum/p50/p99, keyed by `name{labels}`."""
+        with self._lock:
+            snapshot = {f"{name}{_format_labels(key)}": value
+                        for metrics in (self.counters, self.gauges) for name, series in metrics.items()
+                        for key, value in series.items()}
+            for name, series in self.histograms.items():
+                for key, histogram in series.items():
+                    snapshot[f"{name}{_format_labels(key)}"] = {
+                        "count": histogram.count, "sum": round(histogram.sum, 6),
+                        "p50": histogram.quantile(0.5), "p99": histogram.quantile(0.99),
+                    }
+        return snapshot
+
+
+# process-wide registry shared by every module
+metrics = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    """Serves the registry in Prometheus text format on http://0.0.0.0:<port>/metrics from a daemon thread."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Serving metrics on :%d/metrics", port)
+    return server
+
+
+def start_snapshot_logger(interval: float = METRICS_SNAPSHOT_INTERVAL_SECONDS) -> threading.Thread:
+    """Logs a JSON snapshot of the registry every `interval` seconds."""
+    def run():
+        while True:
+            time.sleep(interval)
+            logger.info("Metrics snapshot %s", json.dumps(metrics.snapshot(), sort_keys=True))
+
+    thread = threading.Thread(target=run, name="metrics-snapshot", daemon=True)
+    thread.start()
+    return thread
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread (sys._current_frames) for a fixed window. Unlike cProfile, which only
+    sees the thread that enabled it, this covers the pipeline's fetch/serialize/poll/loader threads too.
+    Writes collapsed stacks (`thread;outer;...;inner count`, the flamegraph.pl / speedscope input format)
+    and logs the functions with the most samples.
+    """
+
+    def __init__(self, window: float = PROFILE_WINDOW_SECONDS, interval: float = PROFILE_SAMPLE_INTERVAL_SECONDS,
+                 output_dir: str = PROFILE_OUTPUT_DIR):
+        self.window = window
+        self.interval = interval
+        self.output_dir = output_dir
+        self._running = threading.Lock()
+
+    def start(self) -> bool:
+        """Starts a profiling window in the background; returns False if one is already running."""
+        if not self._running.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._run, name="sampling-profiler", daemon=True).start()
+        return True
+
+    def _run(self):
+        try:
+            logger.info("Profiling all threads for %gs...", self.window)
+            stacks = Counter()
+            own_id = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            deadline = time.monotonic() + self.window
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    frames = [f"{entry.name} ({os.path.basename(entry.filename)}:{entry.lineno})"
+                              for entry in traceback.extract_stack(frame)]
+                    stacks[(names.get(thread_id, str(thread_id)), *frames)] += 1
+                time.sleep(self.interval)
+                names.update((thread.ident, thread.name) for thread in threading.enumerate())
+            self._write(stacks)
+        except Exception as e:
+            logger.error("Profiling failed: %s", e)
+        finally:
+            self._running.release()
+
+    def _write(self, stacks: Counter):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile_{os.getpid()}_{time.strftime('%Y%m%d_%H%M%S')}.folded")
+        with open(file=path, mode='w') as file:
+            for stack, count in stacks.most_common():
+                file.write(f"{';'.join(stack)} {count}\n")
+        leaf_samples = Counter()
+        for stack, count in stacks.items():
+            leaf_samples[stack[-1] if len(stack) > 1 else stack[0]] += count
+        total = sum(stacks.values()) or 1
+        top = "\n".join(f"  {count / total:6.1%}  {frame}" for frame, count in leaf_samples.most_common(15))
+        logger.info("Profile written to %s (%d samples). Top frames:\n%s", path, total, top)
+
+
+profiler = SamplingProfiler()
+
+
+def install_profile_signal(signum: int = getattr(signal, "SIGUSR1", 0)):
+    """`kill -USR1 <pid>` profiles the running process for PROFILE_WINDOW_SECONDS. Main thread only."""
+    if signum:
+        signal.signal(signum, lambda *_: profiler.start())
+
+
+def start(profile_seconds: Optional[float] = None, port_offset: int = 0):
+    """
+    Starts the exporters enabled in kafka_setting (METRICS_PORT, METRICS_SNAPSHOT_INTERVAL_SECONDS),
+    installs the profiling signal and, with `profile_seconds`, profiles the first seconds of the run.
+    Processes sharing a host pass distinct `port_offset`s.
+    """
+    if METRICS_PORT:
+        try:
+            start_metrics_server(METRICS_PORT + port_offset)
+        except OSError as e:
+            logger.warning("Metrics endpoint disabled, port %d unavailable: %s", METRICS_PORT + port_offset, e)
+    if METRICS_SNAPSHOT_INTERVAL_SECONDS:
+        start_snapshot_logger(METRICS_SNAPSHOT_INTERVAL_SECONDS)
+    if threading.current_thread() is threading.main_thread():
+        install_profile_signal()
+    if profile_seconds:
+        profiler.window = profile_seconds
+        profiler.start()
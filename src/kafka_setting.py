@@ -1,4 +1,6 @@
-from config import env_setting
+from config import get_settings
+
+env_setting = get_settings()
 
 kafka_config = {
     "bootstrap.servers": env_setting.KAFKA_SERVER,
@@ -21,6 +23,8 @@ DATABASE_URL = f""
 
 # Kafka Topic Name
 KAFKA_TOPIC_NAME = 'product_updates'
+TOPIC_PARTITIONS = 10  # Partitions of a newly created topic
+TOPIC_REPLICATION_FACTOR = 3  # Replication factor of newly created topics
 
 # Avro Schema Definition (JSON string)
 # This schema defines the structure of messages being sent to Kafka
@@ -41,9 +45,92 @@ PRODUCT_AVRO_SCHEMA = """
 
 KAFKA_SCHEMA_NAME = "product_updates-value"
 
+# Startup metadata cache
+METADATA_CACHE_FILE = ".metadata_cache.json"  # Topic/schema lookups cached between restarts
+METADATA_CACHE_TTL_SECONDS = 3600  # Re-check the broker and registry after this long
+
+# Producer extraction setting
+FETCH_PAGE_SIZE = 5000  # Rows pulled per round-trip from the server-side cursor
+EXTRACT_SHARDS = 4  # Parallel extraction workers in sharded mode, each owning a hash slice of product_id
+EXTRACT_IDLE_WAIT_SECONDS = 5  # Sleep of a shard worker after a cycle without new rows
+DB_RECONNECT_ATTEMPTS = 5  # Tries on a fresh connection before a dropped query is given up
+DB_RECONNECT_BACKOFF_SECONDS = 1  # Initial wait between reconnect tries, doubled each time
+
+# Snapshot (COPY TO STDOUT backfill) setting
+SNAPSHOT_FORMAT = "csv"  # COPY output format: "csv" or "binary"
+SNAPSHOT_PAGE_SIZE = 20000  # Parsed rows handed to the serializer at once
+SNAPSHOT_CHUNK_BYTES = 8 * 1024 * 1024  # COPY output gathered before it's parsed
+COPY_BUFFER_BYTES = 1024 * 1024  # Read buffer of copy_expert
+
+# Producer pipeline setting
+PIPELINE_QUEUE_PAGES = 4  # Pages buffered between the fetch, serialize and produce stages
+PIPELINE_POLL_INTERVAL_SECONDS = 0.1  # poll() timeout of the dedicated delivery-report thread
+PIPELINE_BACKPRESSURE_WAIT_SECONDS = 0.5  # Max wait for delivery progress when the producer queue is full
+PIPELINE_MAX_DELIVERY_RETRIES = 3  # Times a failed delivery is re-produced before it is logged and skipped
+
+# Bulk Avro serialization setting
+SERIALIZER_WORKERS = 0  # Processes used to encode large pages; 0 or 1 encodes inline
+SERIALIZER_PARALLEL_THRESHOLD = 20000  # Minimum page size before fanning out to the worker pool
+
+# Change detection setting
+CHANGE_DETECTION = True  # Skip rows whose name/category/price were already produced for that product_id
+CHANGE_CACHE_MAX_ENTRIES = 500000  # product_id -> content hash entries kept (LRU); roughly 100 bytes each
+CHANGE_CACHE_FILE = "change_cache.json"  # Written on clean shutdown, read back on start-up; "" keeps it in memory
+
+# Instrumentation setting
+METRICS_PORT = 9108  # Prometheus-style /metrics endpoint; 0 disables it (supervisor workers use port + worker id + 1)
+METRICS_SNAPSHOT_INTERVAL_SECONDS = 60  # Log a JSON snapshot of all metrics this often; 0 disables it
+PROFILE_WINDOW_SECONDS = 30  # Length of a profile captured on SIGUSR1 or --profile
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.01  # Stack sampling period of the profiler
+PROFILE_OUTPUT_DIR = "profiles"  # Where collapsed-stack profiles are written
+
+# Logging setting
+LOG_LEVEL = env_setting.LOG_LEVEL  # DEBUG enables per-batch consumer diagnostics
+LOG_SAMPLE_INTERVAL_SECONDS = 10  # Per-record warnings/errors are emitted at most once per interval per key
+DELIVERY_REPORT_INTERVAL_SECONDS = 10  # How often aggregated per-partition delivery counts are logged
+
+# Change capture (LISTEN/NOTIFY) setting
+CDC_CHANNEL_NAME = "product_changes"  # Postgres NOTIFY channel fed by the products trigger
+CDC_FALLBACK_POLL_SECONDS = 60  # Run a timestamp-polling pass if no notification arrives within this window
+
 # Consumer Group ID
 CONSUMER_GROUP_ID = 'product_analytics_group_v3'
 
+# Consumer supervisor setting
+SUPERVISOR_REPORT_INTERVAL_SECONDS = 10  # How often per-worker throughput is aggregated and logged
+SUPERVISOR_DRAIN_TIMEOUT_SECONDS = 120  # How long workers get to flush their last batch after SIGTERM
+SUPERVISOR_MAX_RESTART_BACKOFF_SECONDS = 60  # Cap for the delay before restarting a crashed worker
+SUPERVISOR_STABLE_UPTIME_SECONDS = 300  # A worker up this long is healthy again: its restart backoff resets
+
+# Replay setting (bulk reload of a time or offset window, see src/replay.py)
+REPLAY_GROUP_ID = f"{CONSUMER_GROUP_ID}_replay"  # Never joined or committed; only identifies the replay client
+REPLAY_BATCH_SIZE = 250000  # Fixed records per load: replays are throughput-bound, not latency-bound
+REPLAY_BATCH_MAX_BYTES = 256 * 1024 * 1024  # Flush once the batch's raw message bytes reach this size
+REPLAY_BATCH_TIME_LIMIT_SECONDS = 120  # Max age of a replay batch
+REPLAY_CONSUME_BATCH_SIZE = 10000  # Max messages fetched per Consumer.consume() call
+REPLAY_STAGING_MAX_FILES = 32  # Files per batch, loaded in parallel by one COPY
+REPLAY_UPLOAD_THREADS = 8  # Concurrent encode + PUT workers
+REPLAY_CONSUMER_CONFIG = {  # librdkafka fetch sizing for reading a backlog
+    "fetch.max.bytes": 100 * 1024 * 1024,
+    "max.partition.fetch.bytes": 8 * 1024 * 1024,
+    "queued.max.messages.kbytes": 512 * 1024,
+    "fetch.wait.max.ms": 100,
+}
+REPLAY_OFFSETS_TIMEOUT_SECONDS = 10  # Timeout of the offsets_for_times / watermark lookups
+REPLAY_DLQ_TOPIC_NAME = None  # None skips invalid records: the live consumer already dead-lettered them
+
+# Admin CLI setting
+ADMIN_SAMPLE_SECONDS = 10  # Window over which message and commit rates are measured
+ADMIN_SKEW_SAMPLE_MESSAGES = 1000  # Most recent messages read per partition to measure key skew
+ADMIN_PARTITION_RATE = 5000  # Messages/s a single partition (and its consumer) is sized for when no rate is measured
+ADMIN_HEADROOM = 1.5  # Recommended capacity over the target throughput
+
+# Dead-letter setting
+DLQ_TOPIC_NAME = f"{KAFKA_TOPIC_NAME}.dlq"  # Records that failed validation or were rejected by COPY
+DLQ_PARTITIONS = 3  # Partitions of the dead-letter topic when it has to be created
+DLQ_LINGER_MS = 200  # Dead-letter produces are batched by librdkafka for up to this long
+DLQ_FLUSH_TIMEOUT_SECONDS = 30  # Wait for dead-letter deliveries before a batch's offsets are committed
+
 # Output directory for JSON files
 OUTPUT_DIR = 'consumer_output'
 
@@ -54,8 +141,39 @@ SNOWFLAKE_ACCOUNT = env_setting.SNOWFLAKE_ACCOUNT
 SNOWFLAKE_WAREHOUSE = env_setting.SNOWFLAKE_WAREHOUSE
 SNOWFLAKE_DATABASE = env_setting.SNOWFLAKE_DATABASE
 SNOWFLAKE_SCHEMA = env_setting.SNOWFLAKE_SCHEMA
-SNOWFLAKE_ROLE=env_setting.SNOWFLAKE_ROLE
+SNOWFLAKE_ROLE = env_setting.SNOWFLAKE_ROLE
 SNOWFLAKE_STAGE_NAME = "product_ingestion_stage"  # Snowflake internal stage name
 SNOWFLAKE_TABLE_NAME = "products"  # Snowflake target table
-BATCH_SIZE = 100  # Number of messages to accumulate before loading
+SNOWFLAKE_LOAD_MODE = "append"  # append: COPY every version; merge: COPY into a temp table, then MERGE (upsert)
+STAGING_FORMAT = "csv"  # Staged file format: csv (gzip), json (gzip) or parquet (zstd, needs pyarrow)
+COPY_ON_ERROR = "CONTINUE"  # CONTINUE: load good rows, dead-letter rejected ones; ABORT_STATEMENT: fail the batch
+STAGING_TARGET_FILE_BYTES = 8 * 1024 * 1024  # Approximate raw bytes per staged file; larger batches are split
+STAGING_MAX_FILES = 8  # Upper bound on files per batch (1 stages every batch as a single file)
+STAGING_UPLOAD_THREADS = 4  # Concurrent encode + PUT workers per consumer
+BATCH_SIZE = 100  # Initial number of messages to accumulate before loading (adapted at runtime)
+BATCH_MIN_SIZE = 100  # Lower bound for the adaptive batch size
+BATCH_MAX_SIZE = 50000  # Upper bound for the adaptive batch size
+BATCH_MAX_BYTES = 64 * 1024 * 1024  # Flush once the batch's raw message bytes reach this size
 BATCH_TIME_LIMIT_SECONDS = 30  # Max time to wait (in seconds) before loading a batch
+BATCH_TARGET_LOAD_SECONDS = 20  # Shrink the batch size when a PUT/COPY takes longer than this
+CONSUME_BATCH_SIZE = 500  # Max messages fetched per Consumer.consume() call
+CONSUME_TIMEOUT_SECONDS = 1.0  # How long consume() waits to fill a fetch
+MAX_IN_FLIGHT_BATCHES = 2  # Batches queued/loading in the background before consumption blocks
+LOAD_RETRY_BACKOFF_SECONDS = 1  # Consumption pause after a failed load; doubles with each consecutive failure
+LOAD_RETRY_MAX_BACKOFF_SECONDS = 60  # Upper bound of that pause
+LOAD_MAX_ATTEMPTS = 8  # Consecutive failed loads before the consumer gives up and exits
+
+# Multi-table pipeline setting (src/multi_table.py)
+# One entry per source table. "key" is a unique column used for keyset paging and as the message key,
+# "timestamp" the change-tracking column. "topic" defaults to "table_pipeline.<table>" and "target_table" to
+# the table name. Avro schemas are generated from information_schema and registered under "<topic>-value".
+# KAFKA_TOPIC_NAME and SNOWFLAKE_TABLE_NAME belong to producer.py/consumer.py and can't be reused here.
+PIPELINE_TABLES = [
+    {"table": "products", "key": "product_id", "timestamp": "updated_timestamp",
+     "target_table": "products_table_pipeline"},
+]
+PIPELINE_SCHEMA_NAMESPACE = "com.buyonline"  # Namespace of the generated Avro records
+PIPELINE_EXTRACT_WORKERS = 4  # Threads (and pooled connections) shared by all tables' extraction
+PIPELINE_PAGES_PER_TURN = 10  # Pages a table extracts before yielding its worker to the next table
+PIPELINE_GROUP_ID = "table_pipeline_group_v1"  # Consumer group of the multi-table consumer
+PIPELINE_DLQ_TOPIC_NAME = "table_pipeline.dlq"  # Undecodable or rejected records of every table
@@ -0,0 +1,116 @@
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener
+
+from kafka_setting import LOG_LEVEL, LOG_SAMPLE_INTERVAL_SECONDS, DELIVERY_REPORT_INTERVAL_SECONDS
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _start_listener() -> QueueHandler:
+    """
+    Starts the single background thread that owns stdout/stderr.
+    Hot paths only enqueue records; the terminal I/O happens on the listener thread.
+    """
+    global _listener
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return QueueHandler(log_queue)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns a logger that writes through the shared non-blocking queue handler.
+    The level is taken from the LOG_LEVEL setting.
+    """
+    with _listener_lock:
+        root = logging.getLogger("kafka_ingestion")
+        if _listener is None:
+            root.addHandler(_start_listener())
+            root.setLevel(LOG_LEVEL.upper())
+            root.propagate = False
+    return root.getChild(name)
+
+
+class RateLimitedLogger:
+    """
+    Emits at most one record per key every `interval` seconds and reports how many were suppressed.
+    Used for per-record messages that would otherwise flood the log under load.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float = LOG_SAMPLE_INTERVAL_SECONDS):
+        self.logger = logger
+        self.interval = interval
+        self._last_emitted: dict[str, float] = {}
+        self._suppressed: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def log(self, level: int, key: str, msg: str, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_emitted.get(key, 0.0) < self.interval:
+                self._suppressed[key] += 1
+                return
+            self._last_emitted[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            msg = f"{msg} ({suppressed} similar messages suppressed)"
+        self.logger.log(level, msg, *args)
+
+    def warning(self, key: str, msg: str, *args):
+        self.log(logging.WARNING, key, msg, *args)
+
+    def error(self, key: str, msg: str, *args):
+        self.log(logging.ERROR, key, msg, *args)
+
+
+class DeliveryReportAggregator:
+    """
+    Delivery callback that counts reports per topic-partition instead of logging each message.
+    Totals are logged every `interval` seconds (checked on each report) and on `flush()`.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float = DELIVERY_REPORT_INTERVAL_SECONDS):
+        self.logger = logger
+        self.interval = interval
+        self.failure_log = RateLimitedLogger(logger)
+        self._delivered: dict[tuple[str, int], int] = defaultdict(int)
+        self._failed: dict[tuple[str, int], int] = defaultdict(int)
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, err, msg):
+        partition = (msg.topic(), msg.partition())
+        with self._lock:
+            if err is None:
+                self._delivered[partition] += 1
+            else:
+                self._failed[partition] += 1
+        if err is not None:
+            self.failure_log.error(str(err.code()), "Message delivery failed for key %s: %s",
+                                   msg.key().decode('utf-8') if msg.key() else 'N/A', err)
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            delivered, self._delivered = self._delivered, defaultdict(int)
+            failed, self._failed = self._failed, defaultdict(int)
+            self._last_flush = time.monotonic()
+        for topic, partition in sorted(set(delivered) | set(failed)):
+            self.logger.info("Delivery report topic=%s partition=%d delivered=%d failed=%d",
+                             topic, partition, delivered[(topic, partition)], failed[(topic, partition)])
@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+import time
+from typing import Any, Optional
+
+from kafka_setting import METADATA_CACHE_FILE, METADATA_CACHE_TTL_SECONDS
+
+
+class MetadataCache:
+    """
+    Small JSON file of broker/registry lookups (topic partitions, schema ids) with a TTL,
+    so restarts skip the round-trips while the entries are fresh.
+    """
+
+    def __init__(self, path: str = METADATA_CACHE_FILE, ttl: float = METADATA_CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.entries: dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(file=path, mode='r') as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached value, None if missing or older than the TTL."""
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry["cached_at"] > self.ttl:
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any):
+        """Stores a value and rewrites the cache file atomically."""
+        self.entries[key] = {"value": value, "cached_at": time.time()}
+        # a temp file of its own per write, so concurrent processes never interleave into one
+        with tempfile.NamedTemporaryFile(mode='w', dir=os.path.dirname(os.path.abspath(self.path)),
+                                         prefix=f"{os.path.basename(self.path)}.", suffix=".tmp",
+                                         delete=False) as file:
+            try:
+                json.dump(self.entries, file)
+            except BaseException:
+                file.close()
+                os.unlink(file.name)
+                raise
+        os.replace(file.name, self.path)
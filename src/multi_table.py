@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import heapq
+import json
+import signal
+import threading
+import time
+from functools import partial
+from typing import Iterator, Optional
+
+from confluent_kafka import Producer
+from kafka_setting import (
+    kafka_config,
+    FETCH_PAGE_SIZE,
+    EXTRACT_IDLE_WAIT_SECONDS,
+    TOPIC_PARTITIONS,
+    SNOWFLAKE_DATABASE,
+    SNOWFLAKE_SCHEMA,
+    SNOWFLAKE_LOAD_MODE,
+    PIPELINE_EXTRACT_WORKERS,
+    PIPELINE_PAGES_PER_TURN,
+    PIPELINE_GROUP_ID,
+    PIPELINE_DLQ_TOPIC_NAME,
+)
+from src import instrumentation
+from src.admin import KafkaAdminSetting
+from src.columnar import TableBatch
+from src.consumer import KafkaConsumer, LoadTarget
+from src.db import DataBaseConnectionPool
+from src.logger import get_logger, DeliveryReportAggregator
+from src.metadata_cache import MetadataCache
+from src.pipeline import DeliveryWatermark, ProducerPipeline
+from src.schema import KafkaSchema
+from src.serialization import BulkAvroDeserializer, BulkAvroSerializer, to_avro_values
+from src.tables import TableConfig, load_table_configs, snowflake_ident
+from src.validation import TableRecordValidator
+from src.utils import get_table_position, set_table_position
+
+logger = get_logger("multi_table")
+
+
+class MultiTableProducer:
+    """
+    Extracts every table of PIPELINE_TABLES in one process, over one connection pool and one Producer.
+
+    Each table has its own topic, registry subject (schema generated from information_schema), delivery
+    watermark and durable keyset position (last_update_<table>.txt). PIPELINE_EXTRACT_WORKERS threads take
+    turns over the tables, earliest due first: a turn reads up to PIPELINE_PAGES_PER_TURN keyset pages through the
+    shared ProducerPipeline, then the table goes back in the queue, immediately if it has more rows and after
+    EXTRACT_IDLE_WAIT_SECONDS if it's caught up. Adding a table costs a schedule entry, not a process.
+    """
+
+    def __init__(self, tables: list[TableConfig], workers: int = PIPELINE_EXTRACT_WORKERS,
+                 page_size: int = FETCH_PAGE_SIZE, pages_per_turn: int = PIPELINE_PAGES_PER_TURN):
+        self.tables = tables
+        self.workers = workers
+        self.page_size = page_size
+        self.pages_per_turn = pages_per_turn
+        self.producer = Producer(kafka_config)
+        self.delivery_reports = DeliveryReportAggregator(logger)
+        self.pool = DataBaseConnectionPool(max_connections=workers)
+        self.schema_manager = KafkaSchema()
+        self.metadata_cache = MetadataCache()
+        self.serializers: list[BulkAvroSerializer] = []
+        self.fetch_positions = []
+        self.watermarks: list[DeliveryWatermark] = []
+        for table in tables:
+            table.load_columns(self.pool.fetch_page)
+            self._ensure_topic(table)
+            self.serializers.append(BulkAvroSerializer(self.schema_manager.schema_reg_client, table.subject,
+                                                       table.schema_str, schema_id=self._ensure_schema(table),
+                                                       convert=to_avro_values))
+            persisted = get_table_position(table.table)
+            position = table.parse_position(persisted) if persisted else table.initial_position()
+            self.fetch_positions.append(position)
+            self.watermarks.append(DeliveryWatermark(position, table.position))
+        self.persisted = list(self.fetch_positions)
+        self.records_fetched = [0] * len(tables)
+        self.pipeline = ProducerPipeline(self.producer, self.serializers[0], self.delivery_reports,
+                                         self.watermarks[0])
+        # (due time, table index) of the tables waiting for a worker
+        self._due = [(0.0, index) for index in range(len(tables))]
+        self._schedule = threading.Condition()
+        self.stop_event = threading.Event()
+        logger.info("Multi-table producer starting for %d tables: %s", len(tables),
+                    ", ".join(f"{table.table}->{table.topic}" for table in tables))
+
+    def _ensure_topic(self, table: TableConfig):
+        cache_key = f"topic:{table.topic}"
+        if self.metadata_cache.get(cache_key) is not None:
+            return
+        admin = KafkaAdminSetting()
+        partitions = admin.get_partition_count(table.topic)
+        if not partitions:
+            logger.info("creating topic:%s", table.topic)
+            partitions = TOPIC_PARTITIONS
+            admin.create_new_topic(table.topic, num_partitions=partitions)
+        self.metadata_cache.set(cache_key, {"partitions": partitions})
+
+    def _ensure_schema(self, table: TableConfig) -> int:
+        """
+        Registry id of the table's generated schema. Cached per schema content, so an altered table
+        registers its new schema on the next start.
+        """
+        digest = hashlib.sha256(table.schema_str.encode("utf-8")).hexdigest()[:16]
+        cache_key = f"schema:{table.subject}:{digest}"
+        schema_id = self.metadata_cache.get(cache_key)
+        if schema_id is None:
+            schema_id = self.schema_manager.get_schema_id(table.subject, table.schema_str)
+            if schema_id is None:
+                logger.info("Registering generated schema for %s under %s", table.table, table.subject)
+                schema_id = self.schema_manager.create_schema(table.subject, table.schema_str)
+            self.metadata_cache.set(cache_key, schema_id)
+        return schema_id
+
+    def _pages(self, index: int) -> Iterator[list[dict]]:
+        table = self.tables[index]
+        position = self.fetch_positions[index]
+        for _ in range(self.pages_per_turn):
+            if self.stop_event.is_set():
+                return
+            rows = self.pool.fetch_page(*table.keyset_page(position, self.page_size))
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.page_size:
+                return
+            position = table.position(rows[-1])
+
+    def persist(self, index: int):
+        safe_position = self.watermarks[index].safe_timestamp
+        if safe_position > self.persisted[index]:
+            set_table_position(self.tables[index].table, safe_position)
+            self.persisted[index] = safe_position
+
+    def _next_table(self) -> Optional[int]:
+        """Blocks until a table is due, returns its index (None once stopped). The table is owned until rescheduled."""
+        with self._schedule:
+            while not self.stop_event.is_set():
+                if not self._due:
+                    self._schedule.wait()
+                    continue
+                due, index = self._due[0]
+                wait = due - time.monotonic()
+                if wait <= 0:
+                    heapq.heappop(self._due)
+                    return index
+                self._schedule.wait(wait)
+        return None
+
+    def _reschedule(self, index: int, delay: float):
+        with self._schedule:
+            heapq.heappush(self._due, (time.monotonic() + delay, index))
+            self._schedule.notify()
+
+    def _run_worker(self, topic_turns: list[int]):
+        while (index := self._next_table()) is not None:
+            table = self.tables[index]
+            total_records = 0
+            rewind_position = self.watermarks[index].rewind()
+            if rewind_position is not None:
+                logger.warning("Table %s re-reading from %s: records after it failed to deliver", table.table,
+                               rewind_position)
+                self.fetch_positions[index] = rewind_position
+            try:
+                total_records, last_position = self.pipeline.run(
+                    table.topic, self._pages(index), self.watermarks[index], detect_changes=False,
+                    serializer=self.serializers[index], key=table.message_key)
+                if total_records:
+                    self.fetch_positions[index] = last_position
+                    self.records_fetched[index] += total_records
+                    logger.debug("Table %s produced %d records up to %s", table.table, total_records, last_position)
+            except Exception as e:
+                logger.error("Table %s extraction failed: %s", table.table, e)
+            finally:
+                self.persist(index)
+            topic_turns[index] += 1
+            # a full turn means the table likely has more rows: requeue it right behind the other due tables
+            caught_up = total_records < self.page_size * self.pages_per_turn
+            self._reschedule(index, EXTRACT_IDLE_WAIT_SECONDS if caught_up else 0)
+
+    def run(self):
+        """
+        Extracts every table until `stop()` is called. Blocks the calling thread, which stays responsive to Ctrl+C.
+        """
+        turns = [0] * len(self.tables)
+        workers = [threading.Thread(target=self._run_worker, args=(turns,), name=f"extract-table-{worker}",
+                                    daemon=True) for worker in range(self.workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(1)
+        finally:
+            self.stop()
+            for worker in workers:
+                worker.join()
+
+    def stop(self):
+        self.stop_event.set()
+        with self._schedule:
+            self._schedule.notify_all()
+
+    def close(self):
+        """Waits for outstanding deliveries, persists every table's delivered position and releases resources."""
+        remaining_messages = self.pipeline.close(timeout=30)
+        if remaining_messages > 0:
+            logger.warning("%d messages still in queue after flush timeout.", remaining_messages)
+        for index in range(len(self.tables)):
+            self.persist(index)
+        logger.info("Multi-table extraction fetched %s", {table.table: count for table, count in
+                                                          zip(self.tables, self.records_fetched)})
+        for serializer in self.serializers:
+            serializer.close()
+        self.pool.close()
+
+
+def table_load_target(client, table: TableConfig) -> LoadTarget:
+    """LoadTarget of one table's topic, decoded with the latest registered version of its generated schema."""
+    # the producer registers the generated schema; the latest version is the reader schema
+    schema_str = client.get_latest_version(table.subject).schema.schema_str
+    columns = [field["name"] for field in json.loads(schema_str)["fields"]]
+    deserializer = BulkAvroDeserializer(client, schema_str)
+    database = f"{SNOWFLAKE_DATABASE}.{SNOWFLAKE_SCHEMA}"
+    target = f"{database}.{snowflake_ident(table.target_table)}"
+    # Session-scoped (temporary) table, so concurrent consumer processes never share it
+    staging = f"{database}.{snowflake_ident(table.target_table + '_merge_staging')}"
+    return LoadTarget(table.topic, target, staging, table.merge_sql(target, staging, columns), deserializer,
+                      TableRecordValidator(deserializer.reader_schema, required=(table.key, table.timestamp)),
+                      partial(TableBatch, columns, table.key, table.timestamp), table.subject, schema_str,
+                      convert=to_avro_values)
+
+
+class MultiTableConsumer(KafkaConsumer):
+    """
+    Loads every table of PIPELINE_TABLES into Snowflake from one consumer process.
+
+    One Consumer subscribes to all the tables' topics; KafkaConsumer's load path routes each message by topic
+    to that table's LoadTarget, so every table gets the same validation, staging formats, multi-file staging,
+    adaptive batching and offset handling as product_updates. A batch holds one table's records
+    (a TableBatch over the columns of its registered schema) and is loaded with COPY, or COPY + MERGE on the
+    table's key and timestamp columns in merge mode.
+    """
+
+    def __init__(self, tables: list[TableConfig], group_id: str = PIPELINE_GROUP_ID,
+                 load_mode: str = SNOWFLAKE_LOAD_MODE):
+        self.tables = tables
+        super().__init__(group_id=group_id, load_mode=load_mode, dead_letter_topic=PIPELINE_DLQ_TOPIC_NAME)
+
+    def _load_targets(self) -> dict[str, LoadTarget]:
+        client = self.schema_registry_client.schema_reg_client
+        targets = {table.topic: table_load_target(client, table) for table in self.tables}
+        logger.info("Loading %d tables: %s", len(self.tables),
+                    ", ".join(f"{table.topic}->{table.target_table}" for table in self.tables))
+        return targets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the table-driven pipeline over every table of PIPELINE_TABLES")
+    parser.add_argument("role", choices=["produce", "consume", "schemas"],
+                        help="produce: extract every table to its topic, consume: load every topic into Snowflake, "
+                             "schemas: print the Avro schemas generated from the catalog")
+    parser.add_argument("--workers", type=int, default=PIPELINE_EXTRACT_WORKERS, help="extraction threads")
+    parser.add_argument("--load-mode", choices=["append", "merge"], default=SNOWFLAKE_LOAD_MODE)
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="profile all threads for the first SECONDS of the run (kill -USR1 <pid> profiles later)")
+    args = parser.parse_args()
+    configs = load_table_configs()
+    if args.role == "schemas":
+        pool = DataBaseConnectionPool(max_connections=1)
+        for config in configs:
+            config.load_columns(pool.fetch_page)
+            print(f"# {config.table} -> {config.topic} ({config.subject})")
+            print(config.schema_str)
+        pool.close()
+    elif args.role == "produce":
+        instrumentation.start(args.profile)
+        producer = MultiTableProducer(configs, args.workers)
+        signal.signal(signal.SIGTERM, lambda signum, frame: producer.stop())
+        try:
+            producer.run()
+        except KeyboardInterrupt:
+            logger.info("Producer stopped by user.")
+        finally:
+            producer.close()
+    else:
+        instrumentation.start(args.profile)
+        consumer = MultiTableConsumer(configs, load_mode=args.load_mode)
+        signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
+        consumer.consume_message()
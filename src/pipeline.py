@@ -0,0 +1,372 @@
+import queue
+import sys
+import threading
+import time
+from functools import partial
+from itertools import repeat
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Optional
+
+from confluent_kafka import Producer, KafkaException, KafkaError
+from kafka_setting import (
+    PIPELINE_QUEUE_PAGES,
+    PIPELINE_POLL_INTERVAL_SECONDS,
+    PIPELINE_BACKPRESSURE_WAIT_SECONDS,
+    PIPELINE_MAX_DELIVERY_RETRIES,
+)
+from src.change_detection import ContentHashCache
+from src.instrumentation import metrics
+from src.logger import get_logger, RateLimitedLogger, DeliveryReportAggregator
+from src.serialization import BulkAvroSerializer
+
+logger = get_logger("pipeline")
+
+# marks the end of a cycle's pages on the stage queues
+_END = object()
+
+
+def _get(stage_queue: queue.Queue, cancelled: threading.Event):
+    """Next item of a stage queue, or _END once the run is cancelled."""
+    while not cancelled.is_set():
+        try:
+            return stage_queue.get(timeout=PIPELINE_POLL_INTERVAL_SECONDS)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def _drain(stage_queue: queue.Queue):
+    while True:
+        try:
+            stage_queue.get_nowait()
+        except queue.Empty:
+            return
+
+
+class DeliveryWatermark:
+    """
+    Tracks which produced records have been delivered and derives the highest position (by default the
+    `updated_timestamp`) that is safe to persist: every record up to and including it has been delivered.
+
+    Records are registered in query order (ascending position). Because the incremental query uses
+    `updated_timestamp > watermark`, a timestamp only becomes safe once *all* records carrying it are
+    delivered, so the watermark trails the contiguous delivered prefix by one timestamp group until
+    the fetch is finished. Keyset readers pass `position` returning a unique (updated_timestamp, product_id).
+
+    A record that could not be delivered stalls the watermark just before its timestamp group. Once every
+    record registered so far is resolved, `rewind()` returns that position so the reader re-reads from there.
+    """
+
+    def __init__(self, initial: Any, position: Callable[[dict], Any] = itemgetter("updated_timestamp")):
+        self.position = position
+        self._lock = threading.Lock()
+        self._timestamps: dict[int, Any] = {}
+        self._delivered: set[int] = set()
+        self._failed: set[int] = set()
+        self._stalled = False
+        self._next_seq = 0
+        self._contiguous = 0  # lowest sequence number not yet delivered
+        self._last_timestamp = initial  # timestamp of the last record of the delivered prefix
+        self._safe_timestamp = initial
+        self._fetch_complete = True
+
+    def begin_fetch(self):
+        with self._lock:
+            self._fetch_complete = False
+
+    def end_fetch(self):
+        with self._lock:
+            self._fetch_complete = True
+            self._advance()
+
+    def register(self, timestamp: Any) -> int:
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._timestamps[seq] = timestamp
+            return seq
+
+    def delivered(self, seq: int):
+        with self._lock:
+            self._delivered.add(seq)
+            self._advance()
+
+    def failed(self, seq: int):
+        """Marks a record that was given up on: the watermark never moves past it until `rewind()`."""
+        with self._lock:
+            self._failed.add(seq)
+            self._advance()
+
+    def _advance(self):
+        while self._contiguous in self._delivered or self._contiguous in self._failed:
+            timestamp = self._timestamps.pop(self._contiguous)
+            if self._contiguous in self._failed:
+                self._failed.remove(self._contiguous)
+                if not self._stalled and timestamp > self._last_timestamp:
+                    self._safe_timestamp = self._last_timestamp
+                self._stalled = True
+            else:
+                self._delivered.remove(self._contiguous)
+                if not self._stalled and timestamp > self._last_timestamp:
+                    # a newer timestamp was reached, so the previous group is fully delivered
+                    self._safe_timestamp = self._last_timestamp
+                    self._last_timestamp = timestamp
+            self._contiguous += 1
+        if self._fetch_complete and not self._stalled and self._contiguous == self._next_seq:
+            self._safe_timestamp = self._last_timestamp
+
+    def rewind(self) -> Optional[Any]:
+        """
+        Returns the position to re-read from if a record failed and nothing registered is still in flight
+        (and clears the stall), None otherwise.
+        """
+        with self._lock:
+            if not self._stalled or self._contiguous != self._next_seq:
+                return None
+            self._stalled = False
+            self._last_timestamp = self._safe_timestamp
+            return self._safe_timestamp
+
+    @property
+    def stalled(self) -> bool:
+        with self._lock:
+            return self._stalled
+
+    @property
+    def safe_timestamp(self) -> Any:
+        with self._lock:
+            return self._safe_timestamp
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return self._next_seq - self._contiguous
+
+
+class ProducerPipeline:
+    """
+    Runs DB fetch, Avro serialization and produce() as concurrent stages connected by bounded queues.
+
+    A dedicated thread calls poll() continuously so delivery reports are served while the other stages run.
+    When librdkafka's queue is full the produce stage waits for delivery progress instead of draining it
+    with flush(). Failed deliveries are re-produced by the poll thread up to PIPELINE_MAX_DELIVERY_RETRIES
+    times; records given up on stall their watermark so the reader re-reads them.
+    With a `change_detector`, rows whose content was already produced are dropped before serialization.
+    """
+
+    def __init__(self, producer: Producer, serializer: BulkAvroSerializer,
+                 delivery_reports: DeliveryReportAggregator, watermark: DeliveryWatermark,
+                 change_detector: Optional[ContentHashCache] = None):
+        self.producer = producer
+        self.serializer = serializer
+        self.delivery_reports = delivery_reports
+        self.watermark = watermark
+        self.change_detector = change_detector
+        self.record_log = RateLimitedLogger(logger)
+        self._progress = threading.Condition()
+        self._retries: queue.SimpleQueue = queue.SimpleQueue()
+        self._running = True
+        self._poll_thread = threading.Thread(target=self._poll_loop, name="producer-poll", daemon=True)
+        self._poll_thread.start()
+
+    def _poll_loop(self):
+        while self._running:
+            with metrics.timer("producer_stage_seconds", stage="poll"):
+                self.producer.poll(PIPELINE_POLL_INTERVAL_SECONDS)
+            self._produce_retries()
+            metrics.set("producer_queue_messages", len(self.producer))
+            metrics.set("producer_watermark_pending", self.watermark.pending)
+
+    def _on_delivery(self, watermark: DeliveryWatermark, seq: int, attempt: int, err, msg):
+        self.delivery_reports(err, msg)
+        metrics.inc("records_delivered_total" if err is None else "delivery_errors_total")
+        if err is not None and attempt < PIPELINE_MAX_DELIVERY_RETRIES:
+            self._retries.put((watermark, seq, attempt + 1, msg.topic(), msg.key(), msg.value()))
+        elif err is not None:
+            self.record_log.error("delivery_gave_up", "Giving up on key %s after %d attempts: %s",
+                                  msg.key(), attempt + 1, err)
+            if self.change_detector is not None:
+                self.change_detector.forget(msg.key().decode("utf-8"))
+            watermark.failed(seq)
+        else:
+            watermark.delivered(seq)
+        with self._progress:
+            self._progress.notify_all()
+
+    def _fetch_stage(self, pages: Iterable[list[dict]], fetched: queue.Queue, errors: list[Exception],
+                     cancelled: threading.Event):
+        try:
+            pages = iter(pages)
+            while not cancelled.is_set():
+                with metrics.timer("producer_stage_seconds", stage="fetch"):
+                    page = next(pages, _END)
+                if page is _END:
+                    break
+                metrics.inc("records_fetched_total", len(page))
+                fetched.put(page)
+        except Exception as e:
+            logger.error("Fetch stage failed: %s", e)
+            errors.append(e)
+        finally:
+            fetched.put(_END)
+
+    def _serialize_stage(self, fetched: queue.Queue, serialized: queue.Queue, errors: list[Exception],
+                         serializer: BulkAvroSerializer, detect_changes: bool, cancelled: threading.Event):
+        try:
+            while (page := _get(fetched, cancelled)) is not _END:
+                changed = None
+                if detect_changes and self.change_detector is not None:
+                    changed = self.change_detector.changed(page)
+                rows = page if changed is None else [row for row, keep in zip(page, changed) if keep]
+                with metrics.timer("producer_stage_seconds", stage="serialize"):
+                    avro_values = serializer.serialize_page(rows) if rows else []
+                serialized.put((page, changed, avro_values))
+        except Exception as e:
+            logger.error("Serialization stage failed: %s", e)
+            errors.append(e)
+            # keep draining so the fetch stage never blocks on a full queue
+            while _get(fetched, cancelled) is not _END:
+                pass
+        finally:
+            serialized.put(_END)
+
+    def _produce(self, topic_name: str, key: bytes, value: bytes, watermark: DeliveryWatermark, seq: int,
+                 attempt: int = 0):
+        while True:
+            try:
+                self.producer.produce(topic=topic_name, key=key, value=value,
+                                      on_delivery=partial(self._on_delivery, watermark, seq, attempt))
+                return
+            except BufferError:
+                # queue full: wait for the poll thread to report deliveries, then retry
+                self.record_log.warning("queue_full", "Producer queue full. Waiting for delivery progress...")
+                with self._progress:
+                    self._progress.wait(PIPELINE_BACKPRESSURE_WAIT_SECONDS)
+
+    def _produce_retries(self):
+        """Re-produces failed deliveries. Never blocks: on a full queue the rest waits for the next poll."""
+        while True:
+            try:
+                retry = self._retries.get_nowait()
+            except queue.Empty:
+                return
+            watermark, seq, attempt, topic_name, key, value = retry
+            try:
+                self.producer.produce(topic=topic_name, key=key, value=value,
+                                      on_delivery=partial(self._on_delivery, watermark, seq, attempt))
+            except BufferError:
+                self._retries.put(retry)
+                return
+            except KafkaException as e:
+                self.record_log.error("retry_failed", "Could not re-produce key %s: %s", key, e)
+                watermark.failed(seq)
+
+    def run(self, topic_name: str, pages: Iterable[list[dict]],
+            watermark: Optional[DeliveryWatermark] = None, detect_changes: bool = True,
+            serializer: Optional[BulkAvroSerializer] = None,
+            key: Callable[[dict], Any] = itemgetter("product_id")) -> tuple[int, Any]:
+        """
+        Streams `pages` through fetch -> serialize -> produce and returns once every record has been handed
+        to the producer (deliveries keep completing in the background).
+        `watermark` overrides the pipeline's own tracker, so several readers can share one producer;
+        `serializer` and `key` (the message key of a row) do the same for readers of other tables.
+        `detect_changes=False` produces every row even if unchanged (full re-syncs).
+        Returns the number of records fetched and the position of the last fetched record; re-raises the error
+        of a failed fetch or serialize stage once the records read before it have been handed over.
+        """
+        watermark = watermark or self.watermark
+        serializer = serializer or self.serializer
+        fetched = queue.Queue(maxsize=PIPELINE_QUEUE_PAGES)
+        serialized = queue.Queue(maxsize=PIPELINE_QUEUE_PAGES)
+        errors = []
+        cancelled = threading.Event()
+        stages = [
+            threading.Thread(target=self._fetch_stage, args=(pages, fetched, errors, cancelled),
+                             name="producer-fetch", daemon=True),
+            threading.Thread(target=self._serialize_stage,
+                             args=(fetched, serialized, errors, serializer, detect_changes, cancelled),
+                             name="producer-serialize", daemon=True),
+        ]
+        total_records = 0
+        last_position = None
+        fetched_all = False
+        watermark.begin_fetch()
+        for stage in stages:
+            stage.start()
+        try:
+            while (item := serialized.get()) is not _END:
+                page, changed, avro_values = item
+                total_records += len(page)
+                last_position = watermark.position(page[-1])
+                started = time.perf_counter()
+                produced_bytes = 0
+                avro_values = iter(avro_values)
+                for product_data, keep in zip(page, changed or repeat(True)):
+                    seq = watermark.register(watermark.position(product_data))
+                    if not keep:
+                        # unchanged since it was last produced: nothing to deliver
+                        watermark.delivered(seq)
+                        continue
+                    avro_value = next(avro_values)
+                    if avro_value is None:
+                        self.record_log.warning("serialize", "Failed to serialize record: %s. Skipping.", product_data)
+                        metrics.inc("serialize_errors_total")
+                        if changed is not None:
+                            # its hash was recorded before serializing: don't suppress the row's next read
+                            self.change_detector.forget(product_data["product_id"])
+                        watermark.delivered(seq)
+                        continue
+                    try:
+                        self._produce(topic_name, str(key(product_data)).encode("utf-8"), avro_value,
+                                      watermark, seq)
+                        produced_bytes += len(avro_value)
+                    except KafkaException as e:
+                        kafka_error = e.args[0]
+                        metrics.inc("produce_errors_total")
+                        if changed is not None:
+                            self.change_detector.forget(product_data["product_id"])
+                        self.record_log.error(str(kafka_error.code()), "Producer error for key %s: %s (Code: %s)",
+                                              key(product_data), kafka_error.str(),
+                                              kafka_error.code())
+                        watermark.failed(seq)
+                        if kafka_error.code() == KafkaError.AUTHENTICATION_FAILED:
+                            logger.critical("Authentication failed. Stopping producer.")
+                            sys.exit(1)
+                metrics.observe("producer_stage_seconds", time.perf_counter() - started, stage="produce")
+                metrics.inc("records_produced_total", len(page) if changed is None else changed.count(True))
+                metrics.inc("bytes_produced_total", produced_bytes)
+                metrics.set("producer_page_records", len(page))
+            fetched_all = not errors
+        finally:
+            # on an early exit the stages may be blocked on full queues: stop them and drain what they put
+            cancelled.set()
+            for stage in stages:
+                while stage.is_alive():
+                    for stage_queue in (fetched, serialized):
+                        _drain(stage_queue)
+                    stage.join(0.1)
+            # a fetch cut short may have stopped inside a timestamp group: leave it open, so the watermark
+            # stays before the last group read and the next cycle re-reads its remaining rows
+            if fetched_all:
+                watermark.end_fetch()
+        if errors:
+            raise errors[0]
+        return total_records, last_position
+
+    def wait_for_deliveries(self, timeout: float) -> int:
+        """
+        Waits up to `timeout` seconds for outstanding deliveries (re-producing failed ones).
+        Returns the number still pending.
+        """
+        remaining = self.producer.flush(timeout)
+        while remaining == 0 and not self._retries.empty():
+            self._produce_retries()
+            remaining = self.producer.flush(timeout)
+        return remaining
+
+    def close(self, timeout: float = 30):
+        remaining = self.wait_for_deliveries(timeout)
+        self._running = False
+        self._poll_thread.join()
+        self.delivery_reports.flush()
+        return remaining
@@ -1,117 +1,258 @@
-import sys
+import argparse
 import time
-from confluent_kafka import Producer, KafkaException, KafkaError
-from kafka_setting import kafka_config, KAFKA_TOPIC_NAME, KAFKA_SCHEMA_NAME, PRODUCT_AVRO_SCHEMA
-from confluent_kafka.serialization import (
-    StringSerializer,
-    SerializationContext,
-    MessageField,
-)
-from confluent_kafka.schema_registry.avro import AvroSerializer
+from datetime import datetime
+from confluent_kafka import Producer
+from kafka_setting import kafka_config, KAFKA_TOPIC_NAME, KAFKA_SCHEMA_NAME, PRODUCT_AVRO_SCHEMA, \
+    CDC_FALLBACK_POLL_SECONDS, EXTRACT_SHARDS, SNAPSHOT_FORMAT, TOPIC_PARTITIONS, CHANGE_DETECTION
+from psycopg2 import Error as DatabaseError
+from src import instrumentation
 from src.admin import KafkaAdminSetting
+from src.cdc import ProductChangeListener
+from src.change_detection import ContentHashCache
 from src.db import DataBaseConnection
 from src.schema import KafkaSchema
-from src.utils import get_last_successful_timestamp, delivery_callback, set_last_successful_timestamp
-from datetime import datetime
-from decimal import Decimal
+from src.serialization import BulkAvroSerializer
+from src.metadata_cache import MetadataCache
+from src.logger import get_logger, DeliveryReportAggregator
+from src.pipeline import DeliveryWatermark, ProducerPipeline
+from src.sharding import ShardedExtractor
+from src.snapshot import copy_pages, take_snapshot_position
+from src.utils import get_last_successful_timestamp, set_last_successful_timestamp
+
+logger = get_logger("producer")
 
 
 class KafkaProducerApp:
     def __init__(self):
         self.producer = Producer(kafka_config)
+        self.delivery_reports = DeliveryReportAggregator(logger)
         self.database_connection = DataBaseConnection()
         self.schema_manager = KafkaSchema()
+        self.metadata_cache = MetadataCache()
+        self._ensure_topic()
+        schema_id = self._ensure_schema()
+        self.avro_serializer = BulkAvroSerializer(self.schema_manager.schema_reg_client, KAFKA_SCHEMA_NAME,
+                                                  PRODUCT_AVRO_SCHEMA, schema_id=schema_id)
+        # durable high-watermark: only advances once everything up to it is delivered
+        self.last_successful_read_timestamp = get_last_successful_timestamp()
+        # in-memory fetch position: everything up to it has been handed to the producer
+        self.fetch_position = self.last_successful_read_timestamp
+        self.watermark = DeliveryWatermark(self.last_successful_read_timestamp)
+        # skips rows whose content was already produced (touch-only updates, re-read rows)
+        self.change_cache = ContentHashCache() if CHANGE_DETECTION else None
+        self.pipeline = ProducerPipeline(self.producer, self.avro_serializer, self.delivery_reports, self.watermark,
+                                         self.change_cache)
+        logger.info("Producer starting with high-watermark: %s", self.last_successful_read_timestamp)
+
+    def _ensure_topic(self):
+        """
+        Creates the topic unless it's known to exist, either from the metadata cache or a single-topic lookup
+        """
+        cache_key = f"topic:{KAFKA_TOPIC_NAME}"
+        if self.metadata_cache.get(cache_key) is not None:
+            logger.info("Topic exists (cached)....")
+            return
         admin = KafkaAdminSetting()
-        if admin.check_topic_existence(KAFKA_TOPIC_NAME):
-            print("Topic exists....")
+        partitions = admin.get_partition_count(KAFKA_TOPIC_NAME)
+        if partitions:
+            logger.info("Topic exists....")
         else:
-            print(f"creating topic:{KAFKA_TOPIC_NAME}")
-            admin.create_new_topic(KAFKA_TOPIC_NAME, num_partitions=10, replication_factor=3)
-        if self.schema_manager.check_schema_existence(KAFKA_SCHEMA_NAME):
-            print("Schema exists....")
+            logger.info("creating topic:%s", KAFKA_TOPIC_NAME)
+            partitions = TOPIC_PARTITIONS
+            admin.create_new_topic(KAFKA_TOPIC_NAME, num_partitions=partitions)
+        self.metadata_cache.set(cache_key, {"partitions": partitions})
+
+    def _ensure_schema(self) -> int:
+        """
+        Returns the registry id of PRODUCT_AVRO_SCHEMA, registering it if needed.
+        Uses the metadata cache first, then a single lookup for this subject.
+        """
+        cache_key = f"schema:{KAFKA_SCHEMA_NAME}"
+        schema_id = self.metadata_cache.get(cache_key)
+        if schema_id is not None:
+            logger.info("Schema exists (cached id %d)....", schema_id)
+            return schema_id
+        schema_id = self.schema_manager.get_schema_id(KAFKA_SCHEMA_NAME, PRODUCT_AVRO_SCHEMA)
+        if schema_id is not None:
+            logger.info("Schema exists....")
         else:
-            print(f"Creating new schema:{KAFKA_SCHEMA_NAME}")
-            self.schema_manager.create_schema(KAFKA_SCHEMA_NAME)
-        self.avro_serializer = AvroSerializer(schema_registry_client=self.schema_manager.schema_reg_client,
-                                              schema_str=PRODUCT_AVRO_SCHEMA)
-        self.string_serializer = StringSerializer("utf-8")
-        self.last_successful_read_timestamp = get_last_successful_timestamp()
-        print(f"Producer starting with high-watermark: {self.last_successful_read_timestamp}")
+            logger.info("Creating new schema:%s", KAFKA_SCHEMA_NAME)
+            schema_id = self.schema_manager.create_schema(KAFKA_SCHEMA_NAME)
+        self.metadata_cache.set(cache_key, schema_id)
+        return schema_id
 
     def produce_message(
             self,
             topic_name: str,
+            idle_wait: int = 10,
     ):
         """
         Fetches incremental data from PostgreSQL and produces Avro-serialized messages to Kafka.
+        Sleeps `idle_wait` seconds when there is nothing new.
         """
-        self.producer.poll(0.0)
+        rewind_position = self.watermark.rewind()
+        if rewind_position is not None:
+            logger.warning("Re-reading from %s: records after it failed to deliver", rewind_position)
+            self.fetch_position = rewind_position
         try:
-            # Query PostgreSQL for records newer than the last successful read timestamp
+            # Query PostgreSQL for records newer than everything already handed to the producer.
             # PostgreSQL can compare datetime objects directly.
-            query = "SELECT product_id, name, category, price, updated_timestamp FROM products WHERE updated_timestamp > %s ORDER BY updated_timestamp ASC;"
-            products = self.database_connection.fetch_query_all(query, (self.last_successful_read_timestamp,))
-            if not products:
-                print("...No new data to load...")
-                time.sleep(10)
+            query = ("SELECT product_id, name, category, price, updated_timestamp FROM products "
+                     "WHERE updated_timestamp > %s ORDER BY updated_timestamp ASC, product_id ASC;")
+            pages = self.database_connection.fetch_query_stream(query, (self.fetch_position,))
+            suppressed_before = self.change_cache.suppressed if self.change_cache else 0
+            total_records, last_timestamp = self.pipeline.run(topic_name, pages)
+            if total_records == 0:
+                logger.info("...No new data to load...")
+                time.sleep(idle_wait)
                 return
-            print(f"Found {len(products)} new/updated records since {self.last_successful_read_timestamp}")
-            current_max_timestamp = self.last_successful_read_timestamp
-            for product_data in products:
-                # Convert datetime object to milliseconds since epoch for Avro 'timestamp-millis'
-                if isinstance(product_data['updated_timestamp'], datetime):
-                    product_data['updated_timestamp'] = int(
-                        product_data['updated_timestamp'].timestamp() * 1000)  # Store original for high-watermark
-                # Convert Decimal type (from PostgreSQL NUMERIC) to float for Avro 'double'
-                if isinstance(product_data['price'], Decimal):
-                    product_data['price'] = float(product_data['price'])
-                avro_value = self.avro_serializer(
-                    product_data,
-                    SerializationContext(topic_name, MessageField.VALUE),
-                )
-                if avro_value is None:
-                    print(f"WARNING: Failed to serialize record: {product_data}. Skipping.", file=sys.stderr)
-                    continue
-                try:
-                    self.producer.produce(
-                        topic=topic_name,
-                        key=self.string_serializer(str(product_data["product_id"])),
-                        value=avro_value,
-                        on_delivery=delivery_callback,
-                    )
-                except BufferError:
-                    print("Producer queue full. Flushing and retrying...", file=sys.stderr)
-                    self.producer.flush(timeout=10)
-                    self.producer.poll(0)
-                    self.producer.produce(
-                        topic=topic_name,
-                        key=self.string_serializer(str(product_data["product_id"])),
-                        value=avro_value,
-                        on_delivery=delivery_callback,
-                    )
-                except KafkaException as e:
-                    kafka_error = e.args[0]
-                    print(
-                        f"ERROR: Producer error for key {product_data.get('product_id', 'N/A')}: {kafka_error.str()} (Code: {kafka_error.code()})",
-                        file=sys.stderr)
-                    if kafka_error.code() == KafkaError.AUTHENTICATION_FAILED:
-                        print("  Authentication failed. Stopping producer.", file=sys.stderr)
-                        sys.exit(1)
-                except Exception as e:
-                    print(
-                        f"ERROR: Unexpected error during data processing for record {product_data.get('product_id', 'N/A')}: {e}",
-                        file=sys.stderr)
-            query = "SELECT max(updated_timestamp) as updated_timestamp FROM products;"
-            current_max_timestamp = self.database_connection.fetch_query_once(query)["updated_timestamp"]
-            set_last_successful_timestamp(current_max_timestamp)
-            self.last_successful_read_timestamp = current_max_timestamp
-            print("Current Time Update", self.last_successful_read_timestamp)
+            suppressed = (self.change_cache.suppressed if self.change_cache else 0) - suppressed_before
+            logger.info("Produced %d new/updated records since %s (%d unchanged skipped, %.1f%%)",
+                        total_records - suppressed, self.fetch_position, suppressed, 100 * suppressed / total_records)
+            self.fetch_position = last_timestamp
         except Exception as e:
-            print("Error while producing message:", e, file=sys.stderr)
+            logger.error("Error while producing message: %s", e)
         finally:
-            remaining_messages = self.producer.flush(timeout=30)
+            self._persist_watermark()
+
+    def _persist_watermark(self):
+        """
+        Writes the high-watermark up to the highest updated_timestamp whose records are all delivered.
+        """
+        safe_timestamp = self.watermark.safe_timestamp
+        if safe_timestamp > self.last_successful_read_timestamp:
+            set_last_successful_timestamp(safe_timestamp)
+            self.last_successful_read_timestamp = safe_timestamp
+            logger.info("Current Time Update %s", self.last_successful_read_timestamp)
+
+    def _advance_watermark(self, timestamp: datetime):
+        """Moves the fetch position and the durable high-watermark forward to a timestamp known to be delivered."""
+        if timestamp > self.fetch_position:
+            self.fetch_position = timestamp
+        if timestamp > self.last_successful_read_timestamp:
+            self.watermark = self.pipeline.watermark = DeliveryWatermark(timestamp)
+            self._persist_watermark()
+
+    def produce_changes(self, topic_name: str, changes: list[dict]):
+        """
+        Produces rows received from the change channel and advances the fetch position so the fallback
+        polling pass doesn't re-send them. Deliveries complete in the background: the high-watermark
+        only moves up to what the delivery watermark reports as delivered.
+        """
+        changes.sort(key=lambda change: change['updated_timestamp'])
+        self.pipeline.run(topic_name, [changes])
+        self.fetch_position = max(self.fetch_position, changes[-1]['updated_timestamp'])
+        self._persist_watermark()
+
+    def close(self):
+        remaining_messages = self.pipeline.close(timeout=30)
+        if remaining_messages > 0:
+            logger.warning("%d messages still in queue after flush timeout.", remaining_messages)
+        self._persist_watermark()
+        if self.change_cache is not None:
+            logger.info("Change detection skipped %d of %d records (%.1f%%)", self.change_cache.suppressed,
+                        self.change_cache.checked, 100 * self.change_cache.suppression_rate)
+            # hashes of undelivered records must not survive a restart
+            if remaining_messages == 0:
+                self.change_cache.save()
+        self.database_connection.close()
+        self.avro_serializer.close()
+
+    def run_change_capture(self):
+        """
+        Streams changes pushed by the products trigger over LISTEN/NOTIFY.
+        A timestamp-polling pass runs on start-up and whenever the channel is idle for
+        CDC_FALLBACK_POLL_SECONDS, so nothing is lost while the listener is down.
+        """
+        try:
+            listener = ProductChangeListener()
+            listener.install_trigger()
+            listener.listen()
+        except DatabaseError as e:
+            logger.warning("Change capture unavailable (%s). Falling back to polling.", e)
+            self.run_producer()
+            return
+        try:
+            # catch up on everything changed before LISTEN was issued
+            self.produce_message(KAFKA_TOPIC_NAME, idle_wait=0)
+            while True:
+                changes = listener.poll_changes(timeout=CDC_FALLBACK_POLL_SECONDS)
+                if changes:
+                    self.produce_changes(KAFKA_TOPIC_NAME, changes)
+                else:
+                    self.produce_message(KAFKA_TOPIC_NAME, idle_wait=0)
+        except KeyboardInterrupt:
+            logger.info("Producer stopped by user.")
+        except Exception as e:
+            logger.error("Error happened in change capture loop: %s", e)
+        finally:
+            listener.close()
+            self.close()
+            logger.info("Producer stopped....")
+
+    def run_sharded(self, num_shards: int = EXTRACT_SHARDS):
+        """
+        Extracts with `num_shards` parallel keyset readers over a connection pool instead of one serial query.
+        Each shard keeps its own durable position in last_update_shard_<n>_of_<num_shards>.txt; on exit the
+        high-watermark in last_update.txt advances to the timestamp every shard has delivered.
+        """
+        extractor = ShardedExtractor(self.pipeline, num_shards)
+        try:
+            extractor.run(KAFKA_TOPIC_NAME)
+        except KeyboardInterrupt:
+            logger.info("Producer stopped by user.")
+        except Exception as e:
+            logger.error("Error happened in sharded extraction: %s", e)
+        finally:
+            remaining_messages = self.pipeline.wait_for_deliveries(timeout=30)
             if remaining_messages > 0:
-                print(f"WARNING: {remaining_messages} messages still in queue after flush timeout.", file=sys.stderr)
+                logger.warning("%d messages still in queue after flush timeout.", remaining_messages)
+            extractor.close()
+            self._advance_watermark(extractor.delivered_timestamp())
+            self.close()
+            logger.info("Producer stopped....")
+
+    def snapshot(self, topic_name: str, fmt: str = SNAPSHOT_FORMAT) -> int:
+        """
+        Backfills the whole table with COPY ... TO STDOUT inside one REPEATABLE READ snapshot.
+        Once every record is delivered, the snapshot's max(updated_timestamp) becomes the high-watermark
+        the incremental modes continue from. Returns the number of records produced.
+        """
+        started = time.monotonic()
+        # COPY output is unordered, so this tracker only counts deliveries; it never touches the high-watermark
+        snapshot_watermark = DeliveryWatermark(0, lambda row: 0)
+        with self.database_connection.snapshot():
+            position = take_snapshot_position(self.database_connection)
+            logger.info("Snapshot at LSN %s, max updated_timestamp %s", position.get('lsn'),
+                        position.get('updated_timestamp'))
+            # a snapshot re-syncs the topic, so every row is produced even if unchanged
+            total_records, _ = self.pipeline.run(topic_name, copy_pages(self.database_connection, fmt),
+                                                 snapshot_watermark, detect_changes=False)
+        remaining_messages = self.pipeline.wait_for_deliveries(timeout=60)
+        if remaining_messages > 0:
+            raise RuntimeError(f"{remaining_messages} snapshot messages undelivered; high-watermark left unchanged")
+        if snapshot_watermark.stalled:
+            raise RuntimeError("Snapshot records failed to deliver; high-watermark left unchanged")
+        elapsed = time.monotonic() - started
+        logger.info("Snapshot produced %d records in %.1fs (%.0f records/s)", total_records, elapsed,
+                    total_records / elapsed if elapsed else 0)
+        if position.get('updated_timestamp') is not None:
+            self.fetch_position = self.last_successful_read_timestamp = position['updated_timestamp']
+            self.watermark = self.pipeline.watermark = DeliveryWatermark(self.last_successful_read_timestamp)
+            set_last_successful_timestamp(self.last_successful_read_timestamp)
+            logger.info("Current Time Update %s", self.last_successful_read_timestamp)
+        return total_records
+
+    def run_snapshot(self, fmt: str = SNAPSHOT_FORMAT):
+        try:
+            self.snapshot(KAFKA_TOPIC_NAME, fmt)
+        except KeyboardInterrupt:
+            logger.info("Snapshot stopped by user; high-watermark left unchanged.")
+        except Exception as e:
+            logger.error("Snapshot failed: %s", e)
+        finally:
+            self.close()
+            logger.info("Producer stopped....")
 
     def run_producer(self):
         try:
@@ -119,14 +260,33 @@ class KafkaProducerApp:
                 self.produce_message(KAFKA_TOPIC_NAME)
                 time.sleep(5)  # poll for updates every 5 seconds
         except KeyboardInterrupt:
-            print("Producer stopped by user.")
+            logger.info("Producer stopped by user.")
         except Exception as e:
-            print("Error happened in main loop:", e)
+            logger.error("Error happened in main loop: %s", e)
         finally:
-            self.database_connection.close()
-            print("Producer stopped....")
+            self.close()
+            logger.info("Producer stopped....")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream product updates from PostgreSQL to Kafka")
+    parser.add_argument("--mode", choices=["poll", "cdc", "sharded", "snapshot"], default="poll",
+                        help="poll: timestamp polling, cdc: LISTEN/NOTIFY change capture with polling fallback, "
+                             "sharded: parallel keyset extraction over a connection pool, "
+                             "snapshot: one-off COPY TO STDOUT backfill that sets the starting high-watermark")
+    parser.add_argument("--shards", type=int, default=EXTRACT_SHARDS, help="extraction workers in sharded mode")
+    parser.add_argument("--snapshot-format", choices=["csv", "binary"], default=SNAPSHOT_FORMAT,
+                        help="COPY output format in snapshot mode")
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="profile all threads for the first SECONDS of the run (kill -USR1 <pid> profiles later)")
+    args = parser.parse_args()
+    instrumentation.start(args.profile)
     app = KafkaProducerApp()
-    app.run_producer()
+    if args.mode == "cdc":
+        app.run_change_capture()
+    elif args.mode == "sharded":
+        app.run_sharded(args.shards)
+    elif args.mode == "snapshot":
+        app.run_snapshot(args.snapshot_format)
+    else:
+        app.run_producer()
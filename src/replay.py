@@ -0,0 +1,240 @@
+import argparse
+import signal
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from confluent_kafka import KafkaException, TopicPartition
+from kafka_setting import (
+    KAFKA_TOPIC_NAME,
+    SNOWFLAKE_LOAD_MODE,
+    REPLAY_GROUP_ID,
+    REPLAY_BATCH_SIZE,
+    REPLAY_BATCH_MAX_BYTES,
+    REPLAY_BATCH_TIME_LIMIT_SECONDS,
+    REPLAY_CONSUME_BATCH_SIZE,
+    REPLAY_STAGING_MAX_FILES,
+    REPLAY_UPLOAD_THREADS,
+    REPLAY_CONSUMER_CONFIG,
+    REPLAY_OFFSETS_TIMEOUT_SECONDS,
+    REPLAY_DLQ_TOPIC_NAME,
+)
+from src import instrumentation
+from src.batching import AdaptiveBatchController
+from src.consumer import KafkaConsumer, LoadTarget
+from src.logger import get_logger
+from src.multi_table import table_load_target
+from src.tables import load_table_configs
+
+logger = get_logger("replay")
+
+
+def parse_time(value: str) -> int:
+    """Epoch milliseconds from an integer or an ISO 8601 time (UTC unless it carries an offset)."""
+    if value.isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def parse_offsets(value: str) -> dict[Optional[int], int]:
+    """
+    `1000` (the same offset on every partition) or `0:1000,3:250` (per partition)
+    -> {partition: offset}, with None as the partition of the every-partition form
+    """
+    if value.isdigit():
+        return {None: int(value)}
+    offsets = {}
+    for item in value.split(","):
+        partition, _, offset = item.partition(":")
+        offsets[int(partition)] = int(offset)
+    return offsets
+
+
+class ReplayConsumer(KafkaConsumer):
+    """
+    Reloads a bounded window of the topic into Snowflake, to recover from failed loads or rebuild the table
+    without switching CONSUMER_GROUP_ID and reconsuming from `earliest`.
+
+    Partitions are assign()ed directly, so the replay never joins the live consumer group or triggers a
+    rebalance, and its offsets are never committed: the live group's position is left untouched and a replay
+    can simply be re-run. Batches are fixed at REPLAY_BATCH_SIZE records, staged as up to
+    REPLAY_STAGING_MAX_FILES files, and fetched with REPLAY_CONSUMER_CONFIG. Every partition stops at its
+    (exclusive) end offset and the replay finishes once all of them have.
+    Invalid records are skipped rather than dead-lettered again, unless REPLAY_DLQ_TOPIC_NAME names a topic.
+    The topic is product_updates or the topic of one of the PIPELINE_TABLES, loaded into that table's target.
+    """
+
+    def __init__(self, topic_name: str = KAFKA_TOPIC_NAME, load_mode: str = SNOWFLAKE_LOAD_MODE):
+        batching = AdaptiveBatchController(initial_size=REPLAY_BATCH_SIZE, min_size=REPLAY_BATCH_SIZE,
+                                           max_size=REPLAY_BATCH_SIZE, max_bytes=REPLAY_BATCH_MAX_BYTES,
+                                           max_age=REPLAY_BATCH_TIME_LIMIT_SECONDS)
+        # read by _load_targets during KafkaConsumer.__init__
+        self.topic_name = topic_name
+        super().__init__(group_id=REPLAY_GROUP_ID, load_mode=load_mode, batching=batching,
+                         consumer_overrides=REPLAY_CONSUMER_CONFIG, consume_batch_size=REPLAY_CONSUME_BATCH_SIZE,
+                         staging_max_files=REPLAY_STAGING_MAX_FILES, upload_threads=REPLAY_UPLOAD_THREADS,
+                         dead_letter_topic=REPLAY_DLQ_TOPIC_NAME)
+        self.window: list[TopicPartition] = []
+        # (topic, partition) -> exclusive end offset
+        self.end_offsets: dict[tuple[str, int], int] = {}
+        self.remaining: set[tuple[str, int]] = set()
+        self.complete = True
+
+    def _load_targets(self) -> dict[str, LoadTarget]:
+        if self.topic_name == KAFKA_TOPIC_NAME:
+            return super()._load_targets()
+        tables = {table.topic: table for table in load_table_configs()}
+        if self.topic_name not in tables:
+            raise ValueError(f"Topic {self.topic_name} is neither {KAFKA_TOPIC_NAME} nor a PIPELINE_TABLES topic: "
+                             f"{', '.join(tables) or 'none configured'}")
+        return {self.topic_name: table_load_target(self.schema_registry_client.schema_reg_client,
+                                                   tables[self.topic_name])}
+
+    def _partitions(self) -> list[int]:
+        topic = self.consumer.list_topics(self.topic_name, timeout=REPLAY_OFFSETS_TIMEOUT_SECONDS).topics.get(
+            self.topic_name)
+        if topic is None or topic.error is not None or not topic.partitions:
+            raise ValueError(f"Topic {self.topic_name} does not exist")
+        return sorted(topic.partitions)
+
+    def _offsets_for_time(self, partitions: list[int], timestamp_ms: int, high: dict[int, int]) -> dict[int, int]:
+        """Earliest offset whose timestamp is >= `timestamp_ms`, per partition; the high watermark if none is."""
+        found = self.consumer.offsets_for_times([TopicPartition(self.topic_name, partition, timestamp_ms)
+                                                 for partition in partitions],
+                                                timeout=REPLAY_OFFSETS_TIMEOUT_SECONDS)
+        offsets = {}
+        for tp in found:
+            if tp.error is not None:
+                raise KafkaException(tp.error)
+            offsets[tp.partition] = tp.offset if tp.offset >= 0 else high[tp.partition]
+        return offsets
+
+    def resolve_window(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                       start_offsets: Optional[dict[Optional[int], int]] = None,
+                       end_offsets: Optional[dict[Optional[int], int]] = None) -> list[TopicPartition]:
+        """
+        Resolves the replay window to a start and end offset per partition. Bounds are timestamps
+        (via offsets_for_times) or explicit offsets; a missing start means the earliest retained offset and a
+        missing end the high watermark at resolution time, so a replay always terminates.
+        Per-partition start offsets limit the replay to the partitions listed.
+        """
+        partitions = self._partitions()
+        if start_offsets and None not in start_offsets:
+            partitions = [partition for partition in partitions if partition in start_offsets]
+        low, high = {}, {}
+        for partition in partitions:
+            low[partition], high[partition] = self.consumer.get_watermark_offsets(
+                TopicPartition(self.topic_name, partition), timeout=REPLAY_OFFSETS_TIMEOUT_SECONDS)
+
+        if start_offsets is not None:
+            start = {partition: start_offsets.get(partition, start_offsets.get(None, low[partition]))
+                     for partition in partitions}
+        elif start_ms is not None:
+            start = self._offsets_for_time(partitions, start_ms, high)
+        else:
+            start = low
+        if end_offsets is not None:
+            end = {partition: end_offsets.get(partition, end_offsets.get(None, high[partition]))
+                   for partition in partitions}
+        elif end_ms is not None:
+            end = self._offsets_for_time(partitions, end_ms, high)
+        else:
+            end = high
+
+        self.window = []
+        self.end_offsets = {}
+        for partition in partitions:
+            # offsets outside the retained log can't be read: clamp to it
+            first = max(start[partition], low[partition])
+            last = min(end[partition], high[partition])
+            if first < last:
+                self.window.append(TopicPartition(self.topic_name, partition, first))
+                self.end_offsets[(self.topic_name, partition)] = last
+            logger.info("%s[%d]: replaying offsets %d..%d (%d messages)", self.topic_name, partition,
+                        first, last, max(last - first, 0))
+        return self.window
+
+    def replay(self) -> bool:
+        """
+        Loads the resolved window and returns True once every partition reached its end offset and every batch
+        was loaded. Returns False if the replay was stopped early or its last batches failed to load.
+        """
+        self.remaining = set(self.end_offsets)
+        self.running = bool(self.window)
+        if not self.window:
+            logger.info("Nothing to replay")
+        else:
+            self.consumer.assign(self.window)
+            logger.info("Replaying %d messages from %d partitions of %s",
+                        sum(self.end_offsets[(tp.topic, tp.partition)] - tp.offset for tp in self.window),
+                        len(self.window), self.topic_name)
+        self._consume_loop()
+        complete = self.complete and not self.remaining
+        logger.info("Replay %s: %d records loaded", "complete" if complete else "INCOMPLETE", self.records_loaded)
+        return complete
+
+    def _append_messages(self, messages: list):
+        # a fetch can run past the end bound of a partition: drop what lies beyond it
+        super()._append_messages([msg for msg in messages if msg.error() or
+                                  msg.offset() < self.end_offsets[(msg.topic(), msg.partition())]])
+
+    def _check_end_of_input(self):
+        """
+        Pauses partitions whose fetch position reached their end offset and stops the replay when all have.
+        Uses the position rather than the last offset seen, which also covers transaction markers and
+        compacted-away offsets at the end of the window.
+        """
+        if not self.remaining:
+            return
+        positions = self.consumer.position([TopicPartition(topic, partition) for topic, partition in self.remaining])
+        finished = [tp for tp in positions if tp.offset >= self.end_offsets[(tp.topic, tp.partition)]]
+        if finished:
+            self.consumer.pause(finished)
+            for tp in finished:
+                self.remaining.discard((tp.topic, tp.partition))
+                logger.info("%s[%d] reached end offset %d", tp.topic, tp.partition,
+                            self.end_offsets[(tp.topic, tp.partition)])
+        if not self.remaining:
+            logger.info("All partitions reached their end offsets; flushing the last batch")
+            self.running = False
+
+    def _commit_offsets(self, offsets: dict[tuple[str, int], list[int]]):
+        # never commit: the replay must not move the live group's offsets
+        logger.debug("Loaded replay batch up to %s", {tp: last for tp, (_, last) in offsets.items()})
+
+    def _rewind(self, failed_offsets: dict[tuple[str, int], list[int]]):
+        super()._rewind(failed_offsets)
+        if not self.running:
+            # the failure surfaced while draining the last batches: nothing is left to reconsume them
+            self.complete = False
+            return
+        # the seek may move partitions back before their end offset: track and fetch them again
+        self.remaining = set(self.end_offsets)
+        self.consumer.resume([TopicPartition(topic, partition) for topic, partition in self.end_offsets])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Reload a time or offset window of the topic into Snowflake without joining or committing "
+                    "the live consumer group")
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument("--start", type=parse_time, help="ISO 8601 time (UTC unless given) or epoch millis")
+    start.add_argument("--start-offsets", type=parse_offsets, help="OFFSET or PARTITION:OFFSET,...")
+    end = parser.add_mutually_exclusive_group()
+    end.add_argument("--end", type=parse_time, help="exclusive end time (default: now)")
+    end.add_argument("--end-offsets", type=parse_offsets, help="exclusive end OFFSET or PARTITION:OFFSET,...")
+    parser.add_argument("--topic", default=KAFKA_TOPIC_NAME,
+                        help="product_updates (default) or the topic of a PIPELINE_TABLES entry")
+    parser.add_argument("--load-mode", choices=["append", "merge"], default=SNOWFLAKE_LOAD_MODE,
+                        help="merge upserts the latest version, so replaying rows already loaded is idempotent")
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="profile all threads for the first SECONDS of the run (kill -USR1 <pid> profiles later)")
+    args = parser.parse_args()
+    instrumentation.start(args.profile)
+    replay = ReplayConsumer(args.topic, args.load_mode)
+    signal.signal(signal.SIGTERM, lambda signum, frame: replay.stop())
+    replay.resolve_window(args.start, args.end, args.start_offsets, args.end_offsets)
+    sys.exit(0 if replay.replay() else 1)
@@ -1,4 +1,5 @@
 import sys
+from typing import Optional
 
 from confluent_kafka.schema_registry import SchemaRegistryClient, Schema, SchemaRegistryError
 from kafka_setting import schema_reg_conf, PRODUCT_AVRO_SCHEMA
@@ -12,16 +13,29 @@ class KafkaSchema:
         """
         Returns true if schema exists in cluster
         """
-        subjects = self.schema_reg_client.get_subjects()
-        for schema_n in iter(subjects):
-            if schema_n == schema_name:
-                return True
-        else:
-            return False
+        try:
+            self.schema_reg_client.get_latest_version(schema_name)
+            return True
+        except SchemaRegistryError as e:
+            if e.http_status_code == 404:
+                return False
+            raise
+
+    def get_schema_id(self, schema_name: str, schema_str: str = PRODUCT_AVRO_SCHEMA) -> Optional[int]:
+        """
+        Returns the id under which this exact schema is registered for the subject, None if it isn't
+        """
+        try:
+            schema = Schema(schema_str=schema_str, schema_type="AVRO")
+            return self.schema_reg_client.lookup_schema(schema_name, schema).schema_id
+        except SchemaRegistryError as e:
+            if e.http_status_code == 404:
+                return None
+            raise
 
     def create_schema(self, schema_name: str, schema_str: str = PRODUCT_AVRO_SCHEMA):
         """
-        create a new schema for a topic
+        create a new schema for a topic, returns its id
         """
 
         try:
@@ -30,9 +44,11 @@ class KafkaSchema:
             print("=" * 10)
             print("⚠️ new schema created:", schema_id)
             print("=" * 10)
+            return schema_id
         except SchemaRegistryError as e:
             if e.http_status_code == 409:  # Conflict: schema already exists
                 print(f"⚠️ Schema '{schema_name}' already exists. Skipping registration.")
+                return self.get_schema_id(schema_name, schema_str)
             else:
                 print(f"❌ Error registering schema: {e}", file=sys.stderr)
                 raise
@@ -0,0 +1,157 @@
+import io
+import json
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Optional
+
+from confluent_kafka.schema_registry import SchemaRegistryClient, Schema
+from fastavro import parse_schema, schemaless_reader, schemaless_writer
+from kafka_setting import KAFKA_SCHEMA_NAME, PRODUCT_AVRO_SCHEMA, SERIALIZER_WORKERS, SERIALIZER_PARALLEL_THRESHOLD
+
+# Confluent wire format: magic byte 0 followed by the 4-byte big-endian schema id
+_MAGIC_BYTE = 0
+
+
+def _to_avro_record(row: dict) -> dict:
+    """Folds the PostgreSQL -> Avro type conversions into one pass over the row."""
+    record = dict(row)
+    updated_timestamp = record['updated_timestamp']
+    if isinstance(updated_timestamp, datetime):
+        record['updated_timestamp'] = int(updated_timestamp.timestamp() * 1000)
+    price = record['price']
+    if isinstance(price, Decimal):
+        record['price'] = float(price)
+    return record
+
+
+def to_avro_values(row: dict) -> dict:
+    """
+    Type conversions for rows of any table with a catalog-generated schema (see src/tables.py):
+    timestamps to epoch millis, numerics to double, json/jsonb to text, bytea to bytes, anything else
+    without an Avro mapping (uuid, interval, time, ...) to its text form.
+    """
+    record = {}
+    for column, value in row.items():
+        if isinstance(value, datetime):
+            value = int(value.timestamp() * 1000)
+        elif isinstance(value, Decimal):
+            value = float(value)
+        elif isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        elif isinstance(value, memoryview):
+            value = value.tobytes()
+        elif value is not None and not isinstance(value, (str, int, float, bytes, date)):
+            value = str(value)
+        record[column] = value
+    return record
+
+
+def _encode_rows(parsed_schema: dict, header: bytes, rows: list[dict],
+                 convert: Callable[[dict], dict] = _to_avro_record) -> list[Optional[bytes]]:
+    """
+    Encodes rows into Confluent wire-format bytes, reusing one buffer for the whole page.
+    Rows that don't match the schema are returned as None so the caller can skip them.
+    """
+    buffer = io.BytesIO()
+    encoded = []
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        buffer.write(header)
+        try:
+            schemaless_writer(buffer, parsed_schema, convert(row))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            encoded.append(None)
+            continue
+        encoded.append(buffer.getvalue())
+    return encoded
+
+
+class BulkAvroSerializer:
+    def __init__(self, schema_registry_client: SchemaRegistryClient, schema_name: str = KAFKA_SCHEMA_NAME,
+                 schema_str: str = PRODUCT_AVRO_SCHEMA, workers: int = SERIALIZER_WORKERS,
+                 parallel_threshold: int = SERIALIZER_PARALLEL_THRESHOLD, schema_id: Optional[int] = None,
+                 convert: Callable[[dict], dict] = _to_avro_record):
+        if schema_id is None:
+            # register_schema is idempotent and returns the existing id when the schema is already registered
+            schema_id = schema_registry_client.register_schema(schema_name,
+                                                               Schema(schema_str=schema_str, schema_type="AVRO"))
+        self.schema_id: int = schema_id
+        self.parsed_schema = parse_schema(json.loads(schema_str))
+        self.header = struct.pack('>bI', _MAGIC_BYTE, self.schema_id)
+        # row -> Avro record conversion; module-level functions only, so pages can go to the process pool
+        self.convert = convert
+        self.parallel_threshold = parallel_threshold
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def serialize_page(self, rows: list[dict]) -> list[Optional[bytes]]:
+        """
+        Returns the wire-format value for every row, in order (None for rows that failed to encode).
+        Pages larger than the parallel threshold are split across the worker pool.
+        """
+        if self._pool is None or len(rows) < self.parallel_threshold:
+            return _encode_rows(self.parsed_schema, self.header, rows, self.convert)
+        chunk_size = -(-len(rows) // self.workers)
+        chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+        futures = [self._pool.submit(_encode_rows, self.parsed_schema, self.header, chunk, self.convert)
+                   for chunk in chunks]
+        encoded = []
+        for future in futures:
+            encoded.extend(future.result())
+        return encoded
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def _without_logical_types(schema):
+    """Drops logicalType annotations, so e.g. timestamp-millis decodes to its raw long."""
+    if isinstance(schema, dict):
+        return {key: _without_logical_types(value) for key, value in schema.items() if key != "logicalType"}
+    if isinstance(schema, list):
+        return [_without_logical_types(value) for value in schema]
+    return schema
+
+
+class BulkAvroDeserializer:
+    def __init__(self, schema_registry_client: SchemaRegistryClient, schema_str: str = PRODUCT_AVRO_SCHEMA,
+                 logical_types: bool = True):
+        self.schema_registry_client = schema_registry_client
+        self.logical_types = logical_types
+        self.reader_schema = self._parse(schema_str)
+        self._writer_schemas: dict[int, dict] = {}
+
+    def _writer_schema(self, schema_id: int) -> dict:
+        writer_schema = self._writer_schemas.get(schema_id)
+        if writer_schema is None:
+            registered = self.schema_registry_client.get_schema(schema_id)
+            writer_schema = self._parse(registered.schema_str)
+            self._writer_schemas[schema_id] = writer_schema
+        return writer_schema
+
+    def _parse(self, schema_str: str) -> dict:
+        schema = json.loads(schema_str)
+        return parse_schema(schema if self.logical_types else _without_logical_types(schema))
+
+    def deserialize_values(self, payloads: list[Optional[bytes]]) -> list[Optional[dict]]:
+        """
+        Decodes a batch of Confluent wire-format values in one pass.
+        Writer schemas are fetched once per schema id; payloads that can't be decoded come back as None.
+        """
+        records = []
+        for payload in payloads:
+            if payload is None or len(payload) < 5 or payload[0] != _MAGIC_BYTE:
+                records.append(None)
+                continue
+            try:
+                writer_schema = self._writer_schema(struct.unpack('>I', payload[1:5])[0])
+                buffer = io.BytesIO(payload)
+                buffer.seek(5)
+                records.append(schemaless_reader(buffer, writer_schema, self.reader_schema))
+            except Exception:
+                records.append(None)
+        return records
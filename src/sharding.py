@@ -0,0 +1,123 @@
+import threading
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Iterator, Optional
+
+from kafka_setting import FETCH_PAGE_SIZE, EXTRACT_IDLE_WAIT_SECONDS
+from src.db import DataBaseConnectionPool
+from src.logger import get_logger
+from src.pipeline import DeliveryWatermark, ProducerPipeline
+from src.utils import get_shard_position, set_shard_position
+
+logger = get_logger("sharding")
+
+# Keyset page of one hash shard. `(updated_timestamp, product_id) > (%s, %s)` resumes exactly after the last row
+# read and is served by an index on (updated_timestamp, product_id); the mask keeps the hash non-negative.
+SHARD_QUERY = ("SELECT product_id, name, category, price, updated_timestamp FROM products "
+               "WHERE mod(hashtext(product_id) & 2147483647, %s) = %s "
+               "AND (updated_timestamp, product_id) > (%s, %s) "
+               "ORDER BY updated_timestamp ASC, product_id ASC LIMIT %s;")
+
+keyset_position = itemgetter("updated_timestamp", "product_id")
+
+
+class ShardedExtractor:
+    """
+    Extracts `products` with `num_shards` worker threads, each owning a hash slice of product_id.
+
+    Workers draw connections from a shared pool and read index-friendly keyset pages into the shared
+    ProducerPipeline. Every shard keeps its own delivery watermark and durable keyset position, so a dropped
+    connection or a restart resumes each shard exactly where its delivered prefix ends.
+    """
+
+    def __init__(self, pipeline: ProducerPipeline, num_shards: int, page_size: int = FETCH_PAGE_SIZE,
+                 pool: Optional[DataBaseConnectionPool] = None):
+        self.pipeline = pipeline
+        self.num_shards = num_shards
+        self.page_size = page_size
+        self.pool = pool or DataBaseConnectionPool(max_connections=num_shards)
+        self.stop_event = threading.Event()
+        positions = [get_shard_position(shard, num_shards) for shard in range(num_shards)]
+        # in-memory fetch position per shard: everything up to it has been handed to the producer
+        self.fetch_positions: list[tuple[datetime, str]] = positions
+        self.watermarks = [DeliveryWatermark(position, keyset_position) for position in positions]
+        self.persisted = list(positions)
+        self.records_fetched = [0] * num_shards
+
+    def _pages(self, shard: int, position: tuple[datetime, str]) -> Iterator[list[dict]]:
+        while not self.stop_event.is_set():
+            timestamp, product_id = position
+            rows = self.pool.fetch_page(SHARD_QUERY, (self.num_shards, shard, timestamp, product_id, self.page_size))
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.page_size:
+                return
+            position = keyset_position(rows[-1])
+
+    def persist(self, shard: int):
+        safe_position = self.watermarks[shard].safe_timestamp
+        if safe_position > self.persisted[shard]:
+            set_shard_position(shard, self.num_shards, safe_position)
+            self.persisted[shard] = safe_position
+
+    def delivered_timestamp(self) -> datetime:
+        """
+        Highest `updated_timestamp` whose records every shard has delivered, in the `updated_timestamp > %s` sense
+        of the serial high-watermark. A shard's keyset position may stop inside a timestamp group, so only the
+        instant before it is complete for that shard.
+        """
+        return min(watermark.safe_timestamp[0] for watermark in self.watermarks) - timedelta(microseconds=1)
+
+    def _run_shard(self, topic_name: str, shard: int):
+        logger.info("Shard %d/%d starting at %s", shard, self.num_shards, self.fetch_positions[shard])
+        while not self.stop_event.is_set():
+            rewind_position = self.watermarks[shard].rewind()
+            if rewind_position is not None:
+                logger.warning("Shard %d re-reading from %s: records after it failed to deliver", shard,
+                               rewind_position)
+                self.fetch_positions[shard] = rewind_position
+            try:
+                total_records, last_position = self.pipeline.run(
+                    topic_name, self._pages(shard, self.fetch_positions[shard]), self.watermarks[shard])
+                if total_records:
+                    self.fetch_positions[shard] = last_position
+                    self.records_fetched[shard] += total_records
+                    logger.debug("Shard %d produced %d records up to %s", shard, total_records, last_position)
+            except Exception as e:
+                logger.error("Shard %d extraction failed: %s", shard, e)
+                total_records = 0
+            finally:
+                self.persist(shard)
+            if not total_records:
+                self.stop_event.wait(EXTRACT_IDLE_WAIT_SECONDS)
+
+    def run(self, topic_name: str):
+        """
+        Runs every shard until `stop()` is called. Blocks the calling thread, which stays responsive to Ctrl+C.
+        """
+        workers = [threading.Thread(target=self._run_shard, args=(topic_name, shard), name=f"extract-shard-{shard}",
+                                    daemon=True) for shard in range(self.num_shards)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(1)
+        finally:
+            self.stop()
+            for worker in workers:
+                worker.join()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        """
+        Persists every shard's delivered position; call after the pipeline has drained.
+        """
+        for shard in range(self.num_shards):
+            self.persist(shard)
+        logger.info("Sharded extraction fetched %d records (%s per shard)", sum(self.records_fetched),
+                    self.records_fetched)
+        self.pool.close()
@@ -0,0 +1,182 @@
+import csv
+import io
+import queue
+import struct
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Iterator, Optional
+
+from kafka_setting import SNAPSHOT_CHUNK_BYTES, SNAPSHOT_PAGE_SIZE, PIPELINE_QUEUE_PAGES
+from src.db import DataBaseConnection
+
+SNAPSHOT_COLUMNS = ("product_id", "name", "category", "price", "updated_timestamp")
+
+# Whole-table export; `NULL '\N'` keeps NULLs apart from empty strings in CSV
+COPY_QUERY = {
+    "csv": f"COPY (SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM products) TO STDOUT WITH (FORMAT csv, NULL '\\N')",
+    "binary": f"COPY (SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM products) TO STDOUT WITH (FORMAT binary)",
+}
+
+# Position of the snapshot: the incremental modes continue from its max(updated_timestamp)
+SNAPSHOT_POSITION_QUERY = ("SELECT max(updated_timestamp) AS updated_timestamp, pg_current_wal_lsn() AS lsn "
+                           "FROM products;")
+
+_BINARY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_POSTGRES_EPOCH = datetime(2000, 1, 1)
+_NUMERIC_NEGATIVE = 0x4000
+
+# marks the end of the COPY stream on the chunk queue
+_END = object()
+
+
+class CsvCopyParser:
+    """Parses `COPY ... (FORMAT csv)` output. Chunks always end on a row boundary."""
+
+    def feed(self, chunk: bytes) -> list[dict]:
+        rows = []
+        for product_id, name, category, price, updated_timestamp in csv.reader(io.StringIO(chunk.decode("utf-8"))):
+            rows.append({
+                "product_id": product_id,
+                "name": name,
+                "category": None if category == "\\N" else category,
+                "price": Decimal(price),
+                "updated_timestamp": None if updated_timestamp == "\\N" else datetime.fromisoformat(updated_timestamp),
+            })
+        return rows
+
+
+def _decode_numeric(data: bytes) -> Decimal:
+    ndigits, weight, sign, dscale = struct.unpack_from(">hhHH", data)
+    digits = struct.unpack_from(f">{ndigits}h", data, 8)
+    value = Decimal(int("".join(f"{digit:04d}" for digit in digits) or "0")).scaleb((weight - ndigits + 1) * 4)
+    value = value.quantize(Decimal(1).scaleb(-dscale))
+    return -value if sign == _NUMERIC_NEGATIVE else value
+
+
+def _decode_timestamp(data: bytes) -> datetime:
+    return _POSTGRES_EPOCH + timedelta(microseconds=struct.unpack(">q", data)[0])
+
+
+def _decode_text(data: bytes) -> str:
+    return data.decode("utf-8")
+
+
+class BinaryCopyParser:
+    """
+    Parses `COPY ... (FORMAT binary)` output for SNAPSHOT_COLUMNS. Avoids the text round-trip of numeric and
+    timestamp values; a tuple split across chunks is kept until the next chunk arrives.
+    """
+
+    decoders = (_decode_text, _decode_text, _decode_text, _decode_numeric, _decode_timestamp)
+
+    def __init__(self):
+        self._buffer = b""
+        self._header_read = False
+
+    def feed(self, chunk: bytes) -> list[dict]:
+        data = self._buffer + chunk
+        offset = 0
+        if not self._header_read:
+            if len(data) < 19:
+                self._buffer = data
+                return []
+            if not data.startswith(_BINARY_SIGNATURE):
+                raise ValueError("not a PostgreSQL binary COPY stream")
+            extension_length = struct.unpack_from(">I", data, 15)[0]
+            offset = 19 + extension_length
+            self._header_read = True
+        rows = []
+        while len(data) - offset >= 2:
+            field_count = struct.unpack_from(">h", data, offset)[0]
+            if field_count == -1:  # trailer
+                offset = len(data)
+                break
+            position = offset + 2
+            values = []
+            for decoder in self.decoders[:field_count]:
+                if len(data) - position < 4:
+                    break
+                length = struct.unpack_from(">i", data, position)[0]
+                position += 4
+                if length == -1:
+                    values.append(None)
+                    continue
+                if len(data) - position < length:
+                    break
+                values.append(decoder(data[position:position + length]))
+                position += length
+            if len(values) < field_count:  # incomplete tuple: wait for the next chunk
+                break
+            rows.append(dict(zip(SNAPSHOT_COLUMNS, values)))
+            offset = position
+        self._buffer = data[offset:]
+        return rows
+
+
+COPY_PARSERS = {"csv": CsvCopyParser, "binary": BinaryCopyParser}
+
+
+class _ChunkWriter:
+    """
+    File-like target for copy_expert: collects the COPY stream into SNAPSHOT_CHUNK_BYTES chunks.
+    psycopg2 writes one row per call, so chunks always end on a row boundary.
+    """
+
+    def __init__(self, chunks: queue.Queue):
+        self.chunks = chunks
+        self._parts = []
+        self._size = 0
+
+    def write(self, data: bytes):
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= SNAPSHOT_CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.chunks.put(b"".join(self._parts))
+            self._parts, self._size = [], 0
+
+
+def take_snapshot_position(database_connection: DataBaseConnection) -> dict:
+    """
+    Returns the max(updated_timestamp) and WAL LSN visible to the current snapshot transaction.
+    """
+    return database_connection.fetch_query_once(SNAPSHOT_POSITION_QUERY) or {}
+
+
+def copy_pages(database_connection: DataBaseConnection, fmt: str = "csv",
+               page_size: int = SNAPSHOT_PAGE_SIZE) -> Iterator[list[dict]]:
+    """
+    Streams `products` with COPY TO STDOUT and yields it as pages of `page_size` row dicts.
+    The COPY runs on its own thread, so reading from PostgreSQL overlaps with parsing.
+    """
+    if fmt not in COPY_PARSERS:
+        raise ValueError(f"Unknown snapshot format {fmt!r}, expected one of {sorted(COPY_PARSERS)}")
+    parser = COPY_PARSERS[fmt]()
+    chunks = queue.Queue(maxsize=PIPELINE_QUEUE_PAGES)
+    failure: list[Optional[Exception]] = [None]
+
+    def copy():
+        writer = _ChunkWriter(chunks)
+        try:
+            database_connection.copy_out(COPY_QUERY[fmt], writer)
+            writer.flush()
+        except Exception as e:
+            failure[0] = e
+        finally:
+            chunks.put(_END)
+
+    threading.Thread(target=copy, name="snapshot-copy", daemon=True).start()
+    page = []
+    while (chunk := chunks.get()) is not _END:
+        page.extend(parser.feed(chunk))
+        while len(page) >= page_size:
+            yield page[:page_size]
+            page = page[page_size:]
+    if failure[0] is not None:
+        raise failure[0]
+    if page:
+        yield page
@@ -0,0 +1,151 @@
+import csv
+import gzip
+import io
+import json
+from abc import ABC, abstractmethod
+from typing import Optional, Union
+
+from src.columnar import PRODUCT_COLUMNS, ProductBatch, TableBatch, format_timestamps
+
+# One JSON Lines record; string values are pre-escaped with json.dumps
+_JSON_LINE = '{{"product_id": {}, "name": {}, "category": {}, "price": {}, "updated_timestamp": "{}"}}\n'
+
+
+class StagingWriter(ABC):
+    """
+    Encodes a columnar batch into one in-memory file ready for a `file_stream` PUT.
+    Subclasses set the staged file extension and the matching COPY INTO file format. A ProductBatch takes
+    each writer's column-at-a-time path; a TableBatch (multi-table pipeline) is written row by row.
+    """
+    file_extension = ""
+    file_format = ""
+
+    @abstractmethod
+    def encode(self, batch: Union[ProductBatch, TableBatch]) -> io.BytesIO:
+        """Returns the batch as one staged file, positioned at its start."""
+
+    def record_key(self, rejected_record: str, columns: list[str] = PRODUCT_COLUMNS,
+                   key: str = "product_id") -> Optional[str]:
+        """
+        Extracts the `key` column from a REJECTED_RECORD returned by COPY VALIDATE, None if it can't be parsed.
+        """
+        try:
+            return json.loads(rejected_record).get(key)
+        except (ValueError, AttributeError):
+            return None
+
+
+class JsonStagingWriter(StagingWriter):
+    """gzip-compressed JSON Lines, the format the loader originally staged."""
+    file_extension = "json.gz"
+    file_format = "TYPE = JSON COMPRESSION = GZIP STRIP_OUTER_ARRAY = FALSE"
+
+    def encode(self, batch: Union[ProductBatch, TableBatch]) -> io.BytesIO:
+        if isinstance(batch, TableBatch):
+            lines = (json.dumps(dict(zip(batch.columns, row))) + "\n" for row in batch.rows())
+            return self._compress(lines)
+        # categories are few and interned, so each distinct one is escaped once
+        categories = {category: json.dumps(category) for category in set(batch.category)}
+        lines = map(_JSON_LINE.format,
+                    map(json.dumps, batch.product_id),
+                    map(json.dumps, batch.name),
+                    map(categories.__getitem__, batch.category),
+                    map(float.__repr__, batch.price),
+                    format_timestamps(batch.updated_timestamp))
+        return self._compress(lines)
+
+    @staticmethod
+    def _compress(lines) -> io.BytesIO:
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=1) as gz:
+            gz.write("".join(lines).encode("utf-8"))
+        buffer.seek(0)
+        return buffer
+
+
+class CsvStagingWriter(StagingWriter):
+    """gzip-compressed CSV with a header row, matched to table columns by name."""
+    file_extension = "csv.gz"
+    file_format = "TYPE = CSV COMPRESSION = GZIP PARSE_HEADER = TRUE FIELD_OPTIONALLY_ENCLOSED_BY = '\"'"
+
+    def encode(self, batch: Union[ProductBatch, TableBatch]) -> io.BytesIO:
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=1) as gz:
+            text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+            writer = csv.writer(text)
+            writer.writerow(batch.columns)
+            writer.writerows(batch.rows())
+            text.flush()
+            text.detach()
+        buffer.seek(0)
+        return buffer
+
+    def record_key(self, rejected_record: str, columns: list[str] = PRODUCT_COLUMNS,
+                   key: str = "product_id") -> Optional[str]:
+        row = next(csv.reader([rejected_record]), None)
+        index = columns.index(key)
+        return row[index] if row and len(row) > index else None
+
+
+class ParquetStagingWriter(StagingWriter):
+    """Columnar Parquet file; needs the optional `pyarrow` package."""
+    file_extension = "parquet"
+    file_format = "TYPE = PARQUET"
+
+    def __init__(self, compression: str = "zstd"):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("STAGING_FORMAT 'parquet' requires pyarrow: pip install pyarrow") from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.compression = compression
+        self.schema = pyarrow.schema([
+            ("product_id", pyarrow.string()),
+            ("name", pyarrow.string()),
+            ("category", pyarrow.string()),
+            ("price", pyarrow.float64()),
+            ("updated_timestamp", pyarrow.timestamp("ms", tz="UTC")),
+        ])
+
+    def _numeric_column(self, values, data_type):
+        # array('d')/array('q') already hold the Arrow memory layout, so the buffer is wrapped without copying
+        return self._pa.Array.from_buffers(data_type, len(values), [None, self._pa.py_buffer(values)])
+
+    def encode(self, batch: Union[ProductBatch, TableBatch]) -> io.BytesIO:
+        pa = self._pa
+        if isinstance(batch, TableBatch):
+            # column types are inferred from the decoded values (timestamps stay timestamps)
+            return self._write(pa.Table.from_pydict(batch.values))
+        table = pa.Table.from_arrays([
+            pa.array(batch.product_id, pa.string()),
+            pa.array(batch.name, pa.string()),
+            pa.array(batch.category, pa.string()),
+            self._numeric_column(batch.price, pa.float64()),
+            self._numeric_column(batch.updated_timestamp, self.schema.field("updated_timestamp").type),
+        ], schema=self.schema)
+        return self._write(table)
+
+    def _write(self, table) -> io.BytesIO:
+        buffer = io.BytesIO()
+        self._pq.write_table(table, buffer, compression=self.compression)
+        buffer.seek(0)
+        return buffer
+
+
+STAGING_WRITERS = {
+    "json": JsonStagingWriter,
+    "csv": CsvStagingWriter,
+    "parquet": ParquetStagingWriter,
+}
+
+
+def get_staging_writer(staging_format: str) -> StagingWriter:
+    """
+    Returns the writer registered for `staging_format` (json, csv or parquet)
+    """
+    try:
+        return STAGING_WRITERS[staging_format]()
+    except KeyError:
+        raise ValueError(f"Unknown staging format '{staging_format}', expected one of {sorted(STAGING_WRITERS)}")
@@ -0,0 +1,169 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from kafka_setting import (
+    KAFKA_TOPIC_NAME,
+    CONSUMER_GROUP_ID,
+    SUPERVISOR_REPORT_INTERVAL_SECONDS,
+    SUPERVISOR_DRAIN_TIMEOUT_SECONDS,
+    SUPERVISOR_MAX_RESTART_BACKOFF_SECONDS,
+    SUPERVISOR_STABLE_UPTIME_SECONDS,
+)
+from src import instrumentation
+from src.logger import get_logger
+
+logger = get_logger("supervisor")
+
+
+def _worker_main(worker_id: int, group_id: str, records_loaded):
+    """
+    Entry point of one worker process: a KafkaConsumer with its own Snowflake connection.
+    SIGTERM asks the consumer to stop so it flushes and commits its last batch before exiting.
+    """
+    # imported here so the supervisor process itself never opens Kafka/Snowflake connections
+    from src.consumer import KafkaConsumer
+
+    # Ctrl+C reaches the whole process group; the supervisor turns it into a coordinated SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # each worker exports its own metrics on METRICS_PORT + worker_id + 1
+    instrumentation.start(port_offset=worker_id + 1)
+    consumer = KafkaConsumer(group_id=group_id)
+    signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
+
+    published = 0
+
+    def publish_progress():
+        # adds only what was loaded since the last call: the counter is shared by every run of this worker slot,
+        # and a restarted worker's own count starts again at 0
+        nonlocal published
+        loaded = consumer.records_loaded
+        with records_loaded.get_lock():
+            records_loaded.value += loaded - published
+        published = loaded
+
+    def publish_periodically():
+        while consumer.running:
+            publish_progress()
+            time.sleep(1)
+
+    progress = threading.Thread(target=publish_periodically, name=f"worker-{worker_id}-progress", daemon=True)
+    progress.start()
+    try:
+        consumer.consume_message()
+    finally:
+        consumer.running = False
+        progress.join()
+        publish_progress()
+
+
+class ConsumerSupervisor:
+    def __init__(self, num_workers: int, group_id: str = CONSUMER_GROUP_ID):
+        self.num_workers = num_workers
+        self.group_id = group_id
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: dict[int, multiprocessing.Process] = {}
+        # records loaded per worker slot, accumulated across restarts of its process
+        self.records_loaded = {worker_id: self.context.Value('q', 0) for worker_id in range(num_workers)}
+        self.restarts = {worker_id: 0 for worker_id in range(num_workers)}
+        self.next_start = {worker_id: 0.0 for worker_id in range(num_workers)}
+        self.started_at = {worker_id: 0.0 for worker_id in range(num_workers)}
+        self.running = True
+
+    def _start_worker(self, worker_id: int):
+        process = self.context.Process(target=_worker_main, name=f"consumer-worker-{worker_id}",
+                                       args=(worker_id, self.group_id, self.records_loaded[worker_id]))
+        process.start()
+        self.workers[worker_id] = process
+        self.started_at[worker_id] = time.monotonic()
+        logger.info("Started worker %d (pid %d)", worker_id, process.pid)
+
+    def _restart_crashed_workers(self):
+        now = time.monotonic()
+        for worker_id, process in list(self.workers.items()):
+            if process.is_alive():
+                if self.restarts[worker_id] and now - self.started_at[worker_id] >= SUPERVISOR_STABLE_UPTIME_SECONDS:
+                    # stayed up long enough: the next crash starts the backoff from scratch
+                    self.restarts[worker_id] = 0
+                continue
+            if now < self.next_start[worker_id]:
+                continue
+            if self.next_start[worker_id] == 0.0:
+                # first time we notice the crash: schedule a restart with exponential backoff
+                self.restarts[worker_id] += 1
+                backoff = min(2 ** self.restarts[worker_id], SUPERVISOR_MAX_RESTART_BACKOFF_SECONDS)
+                logger.warning("Worker %d exited with code %s, restarting in %ds",
+                               worker_id, process.exitcode, backoff)
+                self.next_start[worker_id] = now + backoff
+                continue
+            self.next_start[worker_id] = 0.0
+            self._start_worker(worker_id)
+
+    def _report(self, previous: dict[int, int], interval: float) -> dict[int, int]:
+        current = {worker_id: counter.value for worker_id, counter in self.records_loaded.items()}
+        rates = {worker_id: (current[worker_id] - previous.get(worker_id, 0)) / interval for worker_id in current}
+        logger.info("Throughput %.1f records/s total | %s", sum(rates.values()),
+                    " ".join(f"w{worker_id}={rate:.1f}" for worker_id, rate in sorted(rates.items())))
+        return current
+
+    def stop(self, signum=None, frame=None):
+        self.running = False
+
+    def shutdown(self):
+        """
+        Propagates SIGTERM so every worker drains its batch, then waits for them (killing stragglers).
+        """
+        logger.info("Stopping %d workers...", len(self.workers))
+        for process in self.workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + SUPERVISOR_DRAIN_TIMEOUT_SECONDS
+        for worker_id, process in self.workers.items():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error("Worker %d did not drain in time, killing it", worker_id)
+                process.kill()
+                process.join()
+        logger.info("All workers stopped. Total records loaded: %d",
+                    sum(counter.value for counter in self.records_loaded.values()))
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for worker_id in range(self.num_workers):
+            self._start_worker(worker_id)
+        previous = {}
+        last_report = time.monotonic()
+        try:
+            while self.running:
+                time.sleep(1)
+                self._restart_crashed_workers()
+                elapsed = time.monotonic() - last_report
+                if elapsed >= SUPERVISOR_REPORT_INTERVAL_SECONDS:
+                    previous = self._report(previous, elapsed)
+                    last_report = time.monotonic()
+        finally:
+            self.shutdown()
+
+
+def default_worker_count() -> int:
+    """
+    One worker per partition of the topic, capped at the number of cores
+    """
+    from src.admin import KafkaAdminSetting
+
+    partitions = KafkaAdminSetting().get_partition_count(KAFKA_TOPIC_NAME)
+    return max(1, min(partitions or 1, os.cpu_count() or 1))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several consumer processes in one consumer group")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: partition count, capped at CPU count)")
+    parser.add_argument("--group-id", default=CONSUMER_GROUP_ID)
+    args = parser.parse_args()
+    supervisor = ConsumerSupervisor(args.workers or default_worker_count(), args.group_id)
+    supervisor.run()
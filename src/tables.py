@@ -0,0 +1,186 @@
+import json
+import re
+from datetime import datetime
+from operator import itemgetter
+from typing import Any, Callable, Optional
+
+from kafka_setting import KAFKA_TOPIC_NAME, SNOWFLAKE_TABLE_NAME, PIPELINE_TABLES, PIPELINE_SCHEMA_NAMESPACE
+from src.logger import get_logger
+
+logger = get_logger("tables")
+
+CATALOG_QUERY = ("SELECT column_name, data_type, is_nullable FROM information_schema.columns "
+                 "WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position;")
+
+# information_schema.columns.data_type -> Avro type; unlisted types are sent as their text form
+AVRO_TYPES = {
+    "smallint": "int",
+    "integer": "int",
+    "bigint": "long",
+    "real": "double",
+    "double precision": "double",
+    "numeric": "double",  # like products.price: NUMERIC is loaded as a double
+    "boolean": "boolean",
+    "character varying": "string",
+    "character": "string",
+    "text": "string",
+    "uuid": "string",
+    "json": "string",
+    "jsonb": "string",
+    "bytea": "bytes",
+    "date": {"type": "int", "logicalType": "date"},
+    "timestamp without time zone": {"type": "long", "logicalType": "timestamp-millis"},
+    "timestamp with time zone": {"type": "long", "logicalType": "timestamp-millis"},
+}
+INTEGER_TYPES = {"smallint", "integer", "bigint"}
+# Avro names: https://avro.apache.org/docs/current/specification/#names
+_AVRO_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def quote_ident(name: str) -> str:
+    """Double-quotes a PostgreSQL (or Snowflake) identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def snowflake_ident(name: str) -> str:
+    """Quotes a Snowflake identifier created unquoted, which Snowflake stores (and resolves) in upper case."""
+    return quote_ident(name.upper())
+
+
+def avro_schema(table: str, columns: list[dict], required: tuple = ()) -> str:
+    """
+    Builds the Avro record schema of a table from its information_schema.columns rows.
+    Nullable columns become `["null", type]` with a null default, except those listed in `required`.
+    """
+    fields = []
+    for column in columns:
+        name, data_type = column["column_name"], column["data_type"]
+        if not _AVRO_NAME.fullmatch(name):
+            raise ValueError(f"Column {table}.{name} is not a valid Avro field name")
+        avro_type = AVRO_TYPES.get(data_type)
+        if avro_type is None:
+            logger.warning("Column %s.%s has unmapped type %s; sending it as text", table, name, data_type)
+            avro_type = "string"
+        if column["is_nullable"] == "YES" and name not in required:
+            fields.append({"name": name, "type": ["null", avro_type], "default": None})
+        else:
+            fields.append({"name": name, "type": avro_type})
+    record_name = "".join(part.capitalize() for part in re.split(r"\W|_", table) if part)
+    return json.dumps({"type": "record", "name": record_name, "namespace": f"{PIPELINE_SCHEMA_NAMESPACE}.{table}",
+                       "fields": fields}, indent=2)
+
+
+class TableConfig:
+    """
+    One source table of the multi-table pipeline (an entry of PIPELINE_TABLES): the key and timestamp columns
+    it's extracted by, its topic and registry subject, and its Snowflake target table.
+    Columns and the Avro schema are filled in from the PostgreSQL catalog by `load_columns`.
+    Rows are extracted in (timestamp, key) order, so rows whose timestamp is NULL are never extracted.
+    """
+
+    def __init__(self, table: str, key: str, timestamp: str, topic: Optional[str] = None,
+                 target_table: Optional[str] = None, schema: str = "public"):
+        self.table = table
+        self.key = key
+        self.timestamp = timestamp
+        self.topic = topic or f"table_pipeline.{table}"
+        self.target_table = target_table or table
+        self.schema = schema
+        self.subject = f"{self.topic}-value"
+        self.columns: list[dict] = []
+        self.schema_str: Optional[str] = None
+        self.position: Callable[[dict], tuple] = itemgetter(timestamp, key)
+        self.message_key: Callable[[dict], Any] = itemgetter(key)
+
+    @classmethod
+    def from_setting(cls, entry: dict) -> "TableConfig":
+        return cls(**entry)
+
+    @property
+    def column_names(self) -> list[str]:
+        return [column["column_name"] for column in self.columns]
+
+    def load_columns(self, fetch: Callable[[str, tuple], list[dict]]):
+        """Reads the table's columns with `fetch(query, params)` and generates its Avro schema."""
+        columns = fetch(CATALOG_QUERY, (self.schema, self.table))
+        if not columns:
+            raise ValueError(f"Table {self.schema}.{self.table} not found in information_schema")
+        names = {column["column_name"] for column in columns}
+        for column in (self.key, self.timestamp):
+            if column not in names:
+                raise ValueError(f"Table {self.table} has no column {column}")
+        self.columns = columns
+        if any(column["column_name"] == self.timestamp and column["is_nullable"] == "YES" for column in columns):
+            logger.warning("%s.%s is nullable: rows where it is NULL are skipped by the extraction",
+                           self.table, self.timestamp)
+        # the key and the timestamp are never null in what the keyset query returns
+        self.schema_str = avro_schema(self.table, columns, required=(self.key, self.timestamp))
+
+    def _key_is_integer(self) -> bool:
+        return any(column["column_name"] == self.key and column["data_type"] in INTEGER_TYPES
+                   for column in self.columns)
+
+    def initial_position(self) -> tuple[datetime, Any]:
+        """
+        Keyset position before the first row. It has no key: no value of an arbitrary key type (uuid, date, ...)
+        sorts before every other, so the first page is bounded by the timestamp alone.
+        """
+        return datetime.min, None
+
+    def parse_position(self, position: tuple[datetime, str]) -> tuple[datetime, Any]:
+        """Converts a persisted (timestamp, key text) position back to the key column's type."""
+        timestamp, key = position
+        return timestamp, int(key) if self._key_is_integer() else key
+
+    def keyset_query(self, first: bool = False) -> str:
+        """
+        Next page after a (timestamp, key) position, or with `first` the first page from `initial_position`.
+        Postgres casts the key parameter to the key column's type. An index on (timestamp, key) serves both
+        like the products index in init.sql.
+        """
+        timestamp, key = quote_ident(self.timestamp), quote_ident(self.key)
+        after = f"{timestamp} >= %s" if first else f"({timestamp} > %s OR ({timestamp} = %s AND {key} > %s))"
+        return (f"SELECT {', '.join(map(quote_ident, self.column_names))} "
+                f"FROM {quote_ident(self.schema)}.{quote_ident(self.table)} "
+                f"WHERE {after} ORDER BY {timestamp} ASC, {key} ASC LIMIT %s;")
+
+    def keyset_page(self, position: tuple[datetime, Any], limit: int) -> tuple[str, tuple]:
+        """Query and parameters of the page after `position`."""
+        timestamp, key = position
+        if key is None:
+            return self.keyset_query(first=True), (timestamp, limit)
+        return self.keyset_query(), (timestamp, timestamp, key, limit)
+
+    def merge_sql(self, target: str, staging: str, columns: list[str]) -> str:
+        """
+        Upserts the merge staging table into the target on the key column, keeping the newer row by the
+        timestamp column, like MERGE_SQL in src/consumer.py does for products.
+        """
+        key, timestamp = snowflake_ident(self.key), snowflake_ident(self.timestamp)
+        names = [snowflake_ident(column) for column in columns]
+        updates = ", ".join(f"{name} = source.{name}" for name in names if name != key)
+        return f"""
+            MERGE INTO {target} AS target
+            USING {staging} AS source
+            ON target.{key} = source.{key}
+            WHEN MATCHED AND source.{timestamp} >= target.{timestamp} THEN UPDATE SET {updates}
+            WHEN NOT MATCHED THEN INSERT ({", ".join(names)})
+                VALUES ({", ".join(f"source.{name}" for name in names)})
+            ;
+            """
+
+
+def load_table_configs(entries: list[dict] = PIPELINE_TABLES) -> list[TableConfig]:
+    tables = [TableConfig.from_setting(entry) for entry in entries]
+    topics = [table.topic for table in tables]
+    duplicates = {topic for topic in topics if topics.count(topic) > 1}
+    if duplicates:
+        raise ValueError(f"Tables must not share a topic: {sorted(duplicates)}")
+    for table in tables:
+        # the single-table pipeline owns these with PRODUCT_AVRO_SCHEMA: a generated schema would break its readers
+        if table.topic == KAFKA_TOPIC_NAME:
+            raise ValueError(f"Table {table.table} can't use {KAFKA_TOPIC_NAME}, the topic of src/producer.py")
+        if table.target_table.lower() == SNOWFLAKE_TABLE_NAME.lower():
+            raise ValueError(f"Table {table.table} can't load into {SNOWFLAKE_TABLE_NAME}, "
+                             f"the table of src/consumer.py")
+    return tables
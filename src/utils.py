@@ -1,7 +1,7 @@
-import sys
 import datetime
 import os
 import signal
+from typing import Any, Optional
 
 # --- High-Watermark (Last Read Timestamp) Management ---
 LAST_UPDATE_FILE = "last_update.txt"
@@ -24,15 +24,56 @@ def set_last_successful_timestamp(timestamp: datetime):
         file.write(timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"))
 
 
-# --- Producer Delivery Report Callback ---
-def delivery_callback(err, msg):
-    """Callback function for message delivery."""
-    if err is not None:
-        print(f"Message delivery failed for key {msg.key().decode('utf-8') if msg.key() else 'N/A'}: {err}",
-              file=sys.stderr)
-    else:
-        print(
-            f"Message record {msg.key().decode('utf-8') if msg.key() else 'N/A'} successfully produced to Topic:{msg.topic()} Partition:[{msg.partition()}] at Offset:{msg.offset()}")
+# --- Per-shard keyset position (sharded extraction) ---
+SHARD_UPDATE_FILE = "last_update_shard_{shard}_of_{num_shards}.txt"
+
+
+def get_shard_position(shard: int, num_shards: int) -> tuple[datetime.datetime, str]:
+    """
+    Reads the (updated_timestamp, product_id) keyset position of a shard.
+    A shard without a file starts from the global high-watermark.
+    """
+    path = SHARD_UPDATE_FILE.format(shard=shard, num_shards=num_shards)
+    if os.path.exists(path):
+        with open(file=path, mode='r') as file:
+            content = file.read().strip()
+            if content:
+                timestamp, product_id = content.split("\t", 1)
+                return datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f"), product_id
+    return get_last_successful_timestamp(), ""
+
+
+def set_shard_position(shard: int, num_shards: int, position: tuple[datetime.datetime, str]):
+    """Writes the keyset position of a shard to its own file."""
+    timestamp, product_id = position
+    with open(file=SHARD_UPDATE_FILE.format(shard=shard, num_shards=num_shards), mode='w') as file:
+        file.write(f"{timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')}\t{product_id}")
+
+
+# --- Per-table keyset position (multi-table pipeline) ---
+TABLE_UPDATE_FILE = "last_update_{table}.txt"
+
+
+def get_table_position(table: str) -> Optional[tuple[datetime.datetime, str]]:
+    """
+    Reads the (timestamp, key) keyset position of a table of the multi-table pipeline, None if it has none yet.
+    The key is returned as text; the caller converts it to the key column's type.
+    """
+    path = TABLE_UPDATE_FILE.format(table=table)
+    if os.path.exists(path):
+        with open(file=path, mode='r') as file:
+            content = file.read().strip()
+            if content:
+                timestamp, key = content.split("\t", 1)
+                return datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f"), key
+    return None
+
+
+def set_table_position(table: str, position: tuple[datetime.datetime, Any]):
+    """Writes the keyset position of a table to its own file."""
+    timestamp, key = position
+    with open(file=TABLE_UPDATE_FILE.format(table=table), mode='w') as file:
+        file.write(f"{timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')}\t{key}")
 
 
 running = True  # Global flag for graceful shutdown
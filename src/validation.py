@@ -0,0 +1,56 @@
+import math
+from typing import Optional
+
+from fastavro.validation import validate
+
+# VARCHAR lengths of the products table (init.sql) and its Snowflake copy
+PRODUCT_COLUMN_LENGTHS = {"product_id": 50, "name": 255, "category": 100}
+PRODUCT_REQUIRED_COLUMNS = ("product_id", "name", "price")
+# price is NUMERIC(10, 2)
+PRICE_LIMIT = 10 ** 8
+
+
+class ProductRecordValidator:
+    """
+    Pre-load check of a decoded record against the Avro schema and the target table's columns.
+    Returns the reason a record would be rejected, or None if it can be loaded.
+    """
+
+    def __init__(self, parsed_schema: dict):
+        self.parsed_schema = parsed_schema
+
+    def __call__(self, record: dict) -> Optional[str]:
+        if not validate(record, self.parsed_schema, raise_errors=False):
+            return "record does not match the Avro schema"
+        for column in PRODUCT_REQUIRED_COLUMNS:
+            if record.get(column) is None:
+                return f"{column} is null"
+        for column, max_length in PRODUCT_COLUMN_LENGTHS.items():
+            value = record.get(column)
+            if value is not None and len(value) > max_length:
+                return f"{column} longer than {max_length} characters"
+        if not record["product_id"].strip():
+            return "product_id is empty"
+        price = record["price"]
+        if not math.isfinite(price) or abs(price) >= PRICE_LIMIT:
+            return f"price {price} does not fit NUMERIC(10, 2)"
+        return None
+
+
+class TableRecordValidator:
+    """
+    Pre-load check of a record of the multi-table pipeline: it must match its table's generated Avro schema
+    and carry the key and timestamp columns it is merged on.
+    """
+
+    def __init__(self, parsed_schema: dict, required: tuple = ()):
+        self.parsed_schema = parsed_schema
+        self.required = required
+
+    def __call__(self, record: dict) -> Optional[str]:
+        if not validate(record, self.parsed_schema, raise_errors=False):
+            return "record does not match the Avro schema"
+        for column in self.required:
+            if record.get(column) is None:
+                return f"{column} is null"
+        return None
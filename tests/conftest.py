@@ -0,0 +1,15 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# modules import each other both as `src.x` and as top-level `kafka_setting`, like the scripts run them
+sys.path[:0] = [str(ROOT), str(ROOT / "src")]
+
+# the settings are read at import time; unit tests never connect, so placeholders do without a .env
+if not (ROOT / ".env").exists():
+    for name in ("POSTGRES_USER", "POSTGRES_DB", "POSTGRES_PASSWORD", "KAFKA_SERVER", "KAFKA_USERNAME",
+                 "KAFKA_PASSWORD", "SCHEMA_SERVER", "SCHEMA_USERNAME", "SCHEMA_PASSWORD", "SNOWFLAKE_ACCOUNT",
+                 "SNOWFLAKE_USER", "SNOWFLAKE_PASSWORD", "SNOWFLAKE_WAREHOUSE", "SNOWFLAKE_DATABASE",
+                 "SNOWFLAKE_SCHEMA", "SNOWFLAKE_ROLE"):
+        os.environ.setdefault(name, "test")
@@ -0,0 +1,18 @@
+from src.admin import recommend_capacity
+
+
+def test_recommend_capacity_even_load():
+    assert recommend_capacity(10_000, 4_000, 6, headroom=1.0) == {"consumers": 3, "partitions": 6,
+                                                                  "skew_factor": 1.0}
+
+
+def test_recommend_capacity_adds_partitions_for_consumers():
+    assert recommend_capacity(10_000, 1_000, 6, headroom=1.5) == {"consumers": 15, "partitions": 15,
+                                                                  "skew_factor": 1.0}
+
+
+def test_recommend_capacity_scales_with_skew():
+    # the hottest of 4 partitions carries half the load: twice an even share
+    assert recommend_capacity(4_000, 2_000, 4, max_share=0.5, headroom=1.0) == {"consumers": 4, "partitions": 4,
+                                                                                "skew_factor": 2.0}
+    assert recommend_capacity(100, 1_000, 0, max_share=0.5)["consumers"] == 1
@@ -0,0 +1,47 @@
+from decimal import Decimal
+
+from src.change_detection import ContentHashCache, content_hash
+
+
+def product(product_id, name="Lamp", price=Decimal("12.50"), updated_timestamp=1):
+    return {"product_id": product_id, "name": name, "category": "home", "price": price,
+            "updated_timestamp": updated_timestamp}
+
+
+def test_content_hash_ignores_key_timestamp_and_price_type():
+    assert content_hash(product("a")) == content_hash(product("b", price=12.5, updated_timestamp=2))
+    assert content_hash(product("a")) != content_hash(product("a", name="Desk"))
+
+
+def test_unchanged_rows_are_suppressed():
+    cache = ContentHashCache(path=None)
+    assert cache.changed([product("a"), product("b")]) == [True, True]
+    assert cache.changed([product("a", updated_timestamp=2), product("b", name="Desk")]) == [False, True]
+    assert cache.suppression_rate == 0.25
+
+
+def test_forget_produces_the_row_again():
+    cache = ContentHashCache(path=None)
+    cache.changed([product("a")])
+    cache.forget("a")
+    assert cache.changed([product("a")]) == [True]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ContentHashCache(max_entries=2, path=None)
+    cache.changed([product("a"), product("b")])
+    cache.changed([product("a")])  # touches a, so b is the oldest
+    cache.changed([product("c")])
+    assert list(cache.hashes) == ["a", "c"]
+    assert cache.changed([product("b")]) == [True]
+
+
+def test_saved_map_is_loaded_once(tmp_path):
+    path = str(tmp_path / "hashes.json")
+    cache = ContentHashCache(path=path)
+    cache.changed([product("a")])
+    cache.save()
+    restored = ContentHashCache(path=path)
+    assert restored.changed([product("a")]) == [False]
+    # the file is deleted on load, so a crash after this point can't suppress anything
+    assert ContentHashCache(path=path).changed([product("a")]) == [True]
@@ -0,0 +1,53 @@
+from datetime import date, datetime
+
+from src.columnar import ProductBatch, TableBatch, format_timestamps
+
+
+def product(product_id, updated_timestamp, name="name", category="toys", price=1.5):
+    return {"product_id": product_id, "name": name, "category": category, "price": price,
+            "updated_timestamp": updated_timestamp}
+
+
+def test_format_timestamps():
+    assert format_timestamps([0, 1_704_067_200_123]) == ["1970-01-01T00:00:00.000Z", "2024-01-01T00:00:00.123Z"]
+
+
+def test_compact_latest_keeps_newest_row_per_product():
+    batch = ProductBatch.from_records([product("a", 2, name="a2"), product("b", 1), product("a", 1, name="a1"),
+                                       product("b", 1, name="b-last")])
+    compacted = batch.compact_latest()
+    assert compacted.product_id == ["a", "b"]
+    assert compacted.name == ["a2", "b-last"]  # older rows lose, ties go to the row consumed last
+    assert list(compacted.updated_timestamp) == [2, 1]
+
+
+def test_compact_latest_without_duplicates_returns_batch():
+    batch = ProductBatch.from_records([product("a", 1), product("b", 1)])
+    assert batch.compact_latest() is batch
+
+
+def test_extend_converts_datetimes_to_millis():
+    batch = ProductBatch.from_records([product("a", datetime.fromisoformat("2024-01-01T00:00:00.5+00:00"))])
+    assert list(batch.updated_timestamp) == [1_704_067_200_500]
+
+
+def test_split_is_contiguous_and_complete():
+    batch = ProductBatch.from_records([product(str(i), i) for i in range(10)])
+    parts = batch.split(3)
+    assert [len(part) for part in parts] == [4, 4, 2]
+    assert [product_id for part in parts for product_id in part.product_id] == batch.product_id
+    assert [timestamp for part in parts for timestamp in part.updated_timestamp] == list(batch.updated_timestamp)
+    assert len(batch.split(20)) == 10
+    assert ProductBatch().split(4) == []
+
+
+def test_table_batch_compacts_splits_and_stages():
+    batch = TableBatch(["order_id", "day", "updated_timestamp"], "order_id", "updated_timestamp")
+    batch.extend([{"order_id": 1, "day": date(2024, 1, 1), "updated_timestamp": datetime(2024, 1, 1, 0, 0, 2)},
+                  {"order_id": 2, "day": None, "updated_timestamp": datetime(2024, 1, 1, 0, 0, 1)},
+                  {"order_id": 1, "day": date(2024, 1, 2), "updated_timestamp": datetime(2024, 1, 1, 0, 0, 1)}])
+    compacted = batch.compact_latest()
+    assert compacted.keys() == [1, 2]
+    assert list(compacted.rows())[0] == (1, "2024-01-01", "2024-01-01T00:00:02")
+    assert [len(part) for part in batch.split(2)] == [2, 1]
+    assert TableBatch.concat(batch.split(2)).values == batch.values
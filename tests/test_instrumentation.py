@@ -0,0 +1,33 @@
+from src.instrumentation import Histogram, MetricsRegistry
+
+
+def test_histogram_quantile_is_bucket_upper_bound():
+    histogram = Histogram(buckets=(0.1, 1, 10))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.99) == 10
+    histogram.observe(60)
+    assert histogram.quantile(1.0) == float("inf")
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.inc("records_total", 3, stage="fetch")
+    registry.inc("records_total", 2, stage="fetch")
+    registry.set("lag_messages", 7)
+    registry.observe("stage_seconds", 0.002, stage="copy")
+    text = registry.render_prometheus()
+    assert 'kafka_ingestion_records_total{stage="fetch"} 5' in text
+    assert "kafka_ingestion_lag_messages 7" in text
+    assert 'kafka_ingestion_stage_seconds_bucket{stage="copy",le="0.0025"} 1' in text
+    assert 'kafka_ingestion_stage_seconds_count{stage="copy"} 1' in text
+
+
+def test_timer_records_into_snapshot():
+    registry = MetricsRegistry()
+    with registry.timer("stage_seconds", stage="put"):
+        pass
+    snapshot = registry.snapshot()
+    assert snapshot['stage_seconds{stage="put"}']["count"] == 1
@@ -0,0 +1,143 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import sharding
+from src.logger import get_logger, DeliveryReportAggregator
+from src.pipeline import DeliveryWatermark, ProducerPipeline
+
+
+class StubMessage:
+    def __init__(self, topic, key, value):
+        self._topic, self._key, self._value = topic, key, value
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return 0
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+
+class StubProducer:
+    """Delivers every produced message on the next poll()."""
+
+    def __init__(self):
+        self.pending = []
+
+    def produce(self, topic, key=None, value=None, on_delivery=None):
+        self.pending.append((on_delivery, StubMessage(topic, key, value)))
+
+    def poll(self, timeout=None):
+        pending, self.pending = self.pending, []
+        for on_delivery, message in pending:
+            on_delivery(None, message)
+        if not pending and timeout:
+            time.sleep(min(timeout, 0.01))
+        return len(pending)
+
+    def flush(self, timeout=None):
+        self.poll()
+        return 0
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class StubSerializer:
+    def serialize_page(self, rows):
+        return [b"value"] * len(rows)
+
+
+def register(watermark, timestamps):
+    return [watermark.register(timestamp) for timestamp in timestamps]
+
+
+def test_watermark_follows_contiguous_delivered_prefix():
+    watermark = DeliveryWatermark(0)
+    watermark.begin_fetch()
+    seqs = register(watermark, [1, 2, 3, 4])
+    watermark.delivered(seqs[1])
+    assert watermark.safe_timestamp == 0  # record 1 is still in flight
+    watermark.delivered(seqs[0])
+    assert watermark.safe_timestamp == 1
+    watermark.delivered(seqs[3])
+    watermark.delivered(seqs[2])
+    assert watermark.safe_timestamp == 3  # the last group may still grow while the fetch runs
+    watermark.end_fetch()
+    assert watermark.safe_timestamp == 4
+    assert watermark.pending == 0
+
+
+def test_watermark_waits_for_whole_timestamp_group():
+    watermark = DeliveryWatermark(0)
+    watermark.begin_fetch()
+    seqs = register(watermark, [1, 2, 2, 3])
+    watermark.delivered(seqs[0])
+    watermark.delivered(seqs[2])
+    assert watermark.safe_timestamp == 0
+    watermark.delivered(seqs[1])
+    assert watermark.safe_timestamp == 1  # group 2 is delivered but the fetch may still add to it
+    watermark.delivered(seqs[3])
+    assert watermark.safe_timestamp == 2
+
+
+def test_keyset_position():
+    watermark = DeliveryWatermark((0, ""), position=lambda row: (row["updated_timestamp"], row["product_id"]))
+    seq = watermark.register(watermark.position({"updated_timestamp": 5, "product_id": "P1"}))
+    watermark.delivered(seq)
+    assert watermark.safe_timestamp == (5, "P1")
+
+
+def test_failed_record_stalls_watermark_until_rewind():
+    watermark = DeliveryWatermark(0)
+    watermark.begin_fetch()
+    seqs = register(watermark, [1, 2, 3, 3, 4])
+    watermark.delivered(seqs[0])
+    watermark.delivered(seqs[1])
+    watermark.failed(seqs[2])
+    assert watermark.stalled
+    assert watermark.rewind() is None  # later records are still in flight
+    watermark.delivered(seqs[3])
+    watermark.delivered(seqs[4])
+    watermark.end_fetch()
+    assert watermark.safe_timestamp == 2
+    assert watermark.rewind() == 2
+    assert not watermark.stalled
+
+    # the next cycle re-reads from 2 and delivers everything
+    watermark.begin_fetch()
+    for seq in register(watermark, [3, 3, 4]):
+        watermark.delivered(seq)
+    watermark.end_fetch()
+    assert watermark.safe_timestamp == 4
+    assert watermark.rewind() is None
+
+
+def test_failed_fetch_keeps_watermark_before_last_group():
+    def pages():
+        yield [{"product_id": "a", "updated_timestamp": 1}, {"product_id": "b", "updated_timestamp": 2}]
+        raise RuntimeError("cursor closed")
+
+    watermark = DeliveryWatermark(0)
+    pipeline = ProducerPipeline(StubProducer(), StubSerializer(), DeliveryReportAggregator(get_logger("test")),
+                                watermark)
+    with pytest.raises(RuntimeError):
+        pipeline.run("topic", pages())
+    pipeline.close(timeout=1)
+    assert watermark.pending == 0
+    assert watermark.safe_timestamp == 1  # rows of group 2 may still be unread
+
+
+def test_sharded_delivered_timestamp_is_before_the_slowest_shard(monkeypatch):
+    positions = {0: (datetime(2024, 1, 2), "P9"), 1: (datetime(2024, 1, 1), "P3")}
+    monkeypatch.setattr(sharding, "get_shard_position", lambda shard, num_shards: positions[shard])
+    extractor = sharding.ShardedExtractor(pipeline=None, num_shards=2, pool=object())
+    # shard 1 may still have undelivered rows at 2024-01-01 after P3
+    assert extractor.delivered_timestamp() == datetime(2024, 1, 1) - timedelta(microseconds=1)
@@ -0,0 +1,16 @@
+import pytest
+
+from src.replay import parse_offsets, parse_time
+
+
+def test_parse_offsets():
+    assert parse_offsets("1000") == {None: 1000}
+    assert parse_offsets("0:1000,3:250") == {0: 1000, 3: 250}
+    with pytest.raises(ValueError):
+        parse_offsets("0:x")
+
+
+def test_parse_time():
+    assert parse_time("1704067200000") == 1_704_067_200_000
+    assert parse_time("2024-01-01T00:00:00") == 1_704_067_200_000  # UTC without an offset
+    assert parse_time("2024-01-01T02:00:00.5+02:00") == 1_704_067_200_500
@@ -0,0 +1,59 @@
+import struct
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from src.snapshot import BinaryCopyParser
+
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">II", 0, 0)
+TRAILER = struct.pack(">h", -1)
+
+
+def field(data):
+    return struct.pack(">i", -1) if data is None else struct.pack(">i", len(data)) + data
+
+
+def numeric(digits, weight, sign, dscale):
+    return struct.pack(f">hhHH{len(digits)}h", len(digits), weight, sign, dscale, *digits)
+
+
+def timestamp(value):
+    return struct.pack(">q", (value - datetime(2000, 1, 1)) // timedelta(microseconds=1))
+
+
+def row(*fields):
+    return struct.pack(">h", len(fields)) + b"".join(map(field, fields))
+
+
+STREAM = HEADER + row(b"P1", b"Lamp", b"home", numeric([12, 5000], 0, 0, 2),
+                      timestamp(datetime(2024, 1, 1, 12, 30, 0, 250000))) \
+    + row(b"P2", "Thé".encode("utf-8"), None, numeric([1, 0], 1, 0x4000, 0),
+          timestamp(datetime(1999, 12, 31, 23, 59, 59))) + TRAILER
+
+EXPECTED = [
+    {"product_id": "P1", "name": "Lamp", "category": "home", "price": Decimal("12.50"),
+     "updated_timestamp": datetime(2024, 1, 1, 12, 30, 0, 250000)},
+    {"product_id": "P2", "name": "Thé", "category": None, "price": Decimal("-10000"),
+     "updated_timestamp": datetime(1999, 12, 31, 23, 59, 59)},
+]
+
+
+def test_parses_whole_stream():
+    rows = BinaryCopyParser().feed(STREAM)
+    assert rows == EXPECTED
+    assert str(rows[0]["price"]) == "12.50"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 19, 30])
+def test_tuples_split_across_chunks(chunk_size):
+    parser = BinaryCopyParser()
+    rows = []
+    for start in range(0, len(STREAM), chunk_size):
+        rows.extend(parser.feed(STREAM[start:start + chunk_size]))
+    assert rows == EXPECTED
+
+
+def test_rejects_other_streams():
+    with pytest.raises(ValueError):
+        BinaryCopyParser().feed(b"product_id,name,category,price\n")
@@ -0,0 +1,81 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from src.tables import TableConfig, avro_schema, load_table_configs
+
+COLUMNS = [
+    {"column_name": "order_id", "data_type": "bigint", "is_nullable": "NO"},
+    {"column_name": "note", "data_type": "text", "is_nullable": "YES"},
+    {"column_name": "total", "data_type": "numeric", "is_nullable": "YES"},
+    {"column_name": "updated_timestamp", "data_type": "timestamp without time zone", "is_nullable": "YES"},
+    {"column_name": "tags", "data_type": "ARRAY", "is_nullable": "NO"},
+]
+
+
+def test_avro_schema_maps_catalog_types():
+    schema = json.loads(avro_schema("order_items", COLUMNS, required=("updated_timestamp",)))
+    assert schema["name"] == "OrderItems"
+    assert schema["namespace"].endswith(".order_items")
+    fields = {field["name"]: field for field in schema["fields"]}
+    assert fields["order_id"]["type"] == "long"
+    assert fields["note"] == {"name": "note", "type": ["null", "string"], "default": None}
+    assert fields["total"]["type"] == ["null", "double"]
+    assert fields["updated_timestamp"]["type"] == {"type": "long", "logicalType": "timestamp-millis"}
+    assert fields["tags"]["type"] == "string"  # unlisted types are sent as text
+
+
+def test_avro_schema_rejects_invalid_names():
+    with pytest.raises(ValueError):
+        avro_schema("orders", [{"column_name": "unit price", "data_type": "text", "is_nullable": "NO"}])
+
+
+def test_keyset_query_quotes_identifiers():
+    table = TableConfig("orders", "order_id", "updated_timestamp")
+    table.load_columns(lambda query, params: COLUMNS)
+    assert table.keyset_query() == (
+        'SELECT "order_id", "note", "total", "updated_timestamp", "tags" FROM "public"."orders" '
+        'WHERE ("updated_timestamp" > %s OR ("updated_timestamp" = %s AND "order_id" > %s)) '
+        'ORDER BY "updated_timestamp" ASC, "order_id" ASC LIMIT %s;')
+    assert table.parse_position((None, "42")) == (None, 42)
+
+
+def test_first_page_has_no_key_bound():
+    table = TableConfig("orders", "order_id", "updated_timestamp")
+    table.load_columns(lambda query, params: COLUMNS)
+    query, params = table.keyset_page(table.initial_position(), 100)
+    assert 'WHERE "updated_timestamp" >= %s ORDER BY' in query
+    assert params == (datetime.min, 100)
+    query, params = table.keyset_page((datetime(2024, 1, 1), 7), 100)
+    assert params == (datetime(2024, 1, 1), datetime(2024, 1, 1), 7, 100)
+
+
+def test_load_columns_requires_key_and_timestamp():
+    table = TableConfig("orders", "id", "updated_timestamp")
+    with pytest.raises(ValueError):
+        table.load_columns(lambda query, params: COLUMNS)
+
+
+def test_tables_must_not_share_a_topic():
+    with pytest.raises(ValueError):
+        load_table_configs([{"table": "a", "key": "id", "timestamp": "ts", "topic": "t"},
+                            {"table": "b", "key": "id", "timestamp": "ts", "topic": "t"}])
+
+
+def test_table_configs_stay_off_the_single_table_pipeline():
+    assert [table.topic for table in load_table_configs([{"table": "orders", "key": "id", "timestamp": "ts"}])] \
+        == ["table_pipeline.orders"]
+    with pytest.raises(ValueError):
+        load_table_configs([{"table": "products", "key": "product_id", "timestamp": "updated_timestamp",
+                             "topic": "product_updates"}])
+    with pytest.raises(ValueError):
+        load_table_configs([{"table": "products", "key": "product_id", "timestamp": "updated_timestamp",
+                             "target_table": "PRODUCTS"}])
+
+
+def test_merge_sql_quotes_snowflake_identifiers():
+    table = TableConfig("orders", "order_id", "updated_timestamp")
+    sql = table.merge_sql('db.s."ORDERS"', 'db.s."ORDERS_MERGE_STAGING"', ["order_id", "note", "updated_timestamp"])
+    assert 'ON target."ORDER_ID" = source."ORDER_ID"' in sql
+    assert 'UPDATE SET "NOTE" = source."NOTE", "UPDATED_TIMESTAMP" = source."UPDATED_TIMESTAMP"' in sql